@@ -5,11 +5,13 @@ import logging
 import math
 import types
 from copy import deepcopy
+from contextlib import contextmanager
 from tqdm.autonotebook import tqdm
-from multiprocessing import Process, Manager, Queue, cpu_count
-from time import sleep
+from multiprocessing import Process, Queue, cpu_count
+from queue import Empty
+from threading import Thread, Event, Semaphore
 from typing import Union, List, Tuple, Optional, Any, Dict, Iterable, Generator
-from spacy.tokens import Span, Doc
+from spacy.tokens import Doc
 
 from medcat.preprocessing.tokenizers import spacy_split_all
 from medcat.pipe import Pipe
@@ -17,11 +19,15 @@ from medcat.preprocessing.taggers import tag_skip_and_punct
 from medcat.utils.loggers import add_handlers
 from medcat.utils.data_utils import make_mc_train_test, get_false_positives
 from medcat.utils.normalizers import BasicSpellChecker
+from medcat.utils.spell_index import SymSpellIndex
 from medcat.ner.vocab_based_ner import NER
+from medcat.ner.trie_based_ner import TrieNER
 from medcat.linking.context_based_linker import Linker
+from medcat.pipeline.pipe_runner import PipeRunner
 from medcat.utils.filters import process_old_project_filters, check_filters
 from medcat.preprocessing.cleaners import prepare_name
 from medcat.utils.helpers import tkns_from_doc
+from medcat.utils.shared_memory import frozen_gc
 
 
 class CAT(object):
@@ -61,6 +67,9 @@ class CAT(object):
     log = logging.getLogger(__package__)
     # Add file and console handlers
     log = add_handlers(log)
+    # Seconds between checks that the worker processes of multiprocessing are still alive
+    _mp_poll_interval = 5
+
     def __init__(self, cdb, config, vocab, meta_cats=[]):
         self.cdb = cdb
         self.vocab = vocab
@@ -76,11 +85,17 @@ class CAT(object):
                              name='skip_and_punct',
                              additional_fields=['is_punct'])
 
-        spell_checker = BasicSpellChecker(cdb_vocab=self.cdb.vocab, config=self.config, data_vocab=vocab)
+        spell_index = None
+        if self.config.general['spell_check'] and self.config.general.get('spell_check_index', False):
+            spell_index = SymSpellIndex.from_cdb(self.cdb, max_distance=2 if self.config.general['spell_check_deep'] else 1)
+        spell_checker = BasicSpellChecker(cdb_vocab=self.cdb.vocab, config=self.config, data_vocab=vocab, index=spell_index)
         self.pipe.add_token_normalizer(spell_checker=spell_checker, config=self.config)
 
         # Add NER
-        self.ner = NER(self.cdb, self.config)
+        if self.config.ner.get('engine', 'vocab') == 'trie':
+            self.ner = TrieNER(self.cdb, self.config)
+        else:
+            self.ner = NER(self.cdb, self.config)
         self.pipe.add_ner(self.ner)
 
         # Add LINKER
@@ -343,7 +358,7 @@ class CAT(object):
 
         return fps, fns, tps, cui_prec, cui_rec, cui_f1, cui_counts, examples
 
-    def train(self, data_iterator, fine_tune=True, progress_print=1000):
+    def train(self, data_iterator, fine_tune=True, progress_print=1000, nproc=1, batch_size=100):
         """ Runs training on the data, note that the maximum length of a line
         or document is 1M characters. Anything longer will be trimmed.
 
@@ -354,28 +369,66 @@ class CAT(object):
             If False old training will be removed
         progress_print:
             Print progress after N lines
+        nproc:
+            Number of worker processes, if >1 the workers run the pipeline and collect the training
+            examples while this process applies them to the CDB (in the order of the documents). How far
+            the workers can get ahead is set by config.linking['train_update_staleness']
+        batch_size:
+            Number of documents sent to a worker at once, used if nproc > 1
         """
         if not fine_tune:
             self.log.info("Removing old training data!")
             self.cdb.reset_training()
 
-        cnt = 0
-        for line in data_iterator:
-            if line is not None and line:
-                # Convert to string
-                line = str(line).strip()
+        if nproc > 1:
+            self._train_parallel(data_iterator, nproc=nproc, batch_size=batch_size, progress_print=progress_print)
+        else:
+            cnt = 0
+            for line in data_iterator:
+                if line is not None and line:
+                    # Convert to string
+                    line = str(line).strip()
 
-                try:
-                    _ = self(line, do_train=True)
-                except Exception as e:
-                    self.log.warning("LINE: '{}...' \t WAS SKIPPED".format(line[0:100]))
-                    self.log.warning("BECAUSE OF: " + str(e))
-                if cnt % progress_print == 0:
-                    self.log.info("DONE: " + str(cnt))
-                cnt += 1
+                    try:
+                        _ = self(line, do_train=True)
+                    except Exception as e:
+                        self.log.warning("LINE: '{}...' \t WAS SKIPPED".format(line[0:100]))
+                        self.log.warning("BECAUSE OF: " + str(e))
+                    if cnt % progress_print == 0:
+                        self.log.info("DONE: " + str(cnt))
+                    cnt += 1
 
         self.config.linking['train'] = False
 
+    def _train_parallel(self, data_iterator, nproc, batch_size, progress_print):
+        def lines():
+            for line in data_iterator:
+                if line is not None and line:
+                    line = str(line).strip()
+                    # The start of the line is sent back with its examples, for logging
+                    yield line[0:100], line
+
+        # Each batch waiting to be applied holds batch_size documents
+        staleness = self.config.linking.get('train_update_staleness', 1000)
+        max_queued_batches = max(1, math.ceil(staleness / batch_size))
+        if max_queued_batches < nproc:
+            self.log.warning("train_update_staleness={} allows only {} batches of {} documents to be in progress, "
+                             "some of the {} workers will be idle".format(staleness, max_queued_batches, batch_size, nproc))
+
+        cnt = 0
+        for start, updates in self._mp_iter(lines(), nproc=nproc, batch_size=batch_size, ordered=True,
+                                            max_queued_batches=max_queued_batches, target=self._mp_train_cons):
+            # Single aggregator, the examples are applied in the same order as training in one process would
+            try:
+                for update in updates:
+                    self.linker.apply_train_update(*update)
+            except Exception as e:
+                self.log.warning("LINE: '{}...' \t WAS SKIPPED".format(start))
+                self.log.warning("BECAUSE OF: " + str(e))
+            if cnt % progress_print == 0:
+                self.log.info("DONE: " + str(cnt))
+            cnt += 1
+
     def add_cui_to_group(self, cui, group_name, reset_all_groups=False):
         r'''
         Ads a CUI to a group, will appear in cdb.addl_info['cui2group']
@@ -647,25 +700,30 @@ p
                 for doc in docs:
                     out.append(self._doc_to_out(doc, cnf_annotation_output, only_cui, addl_info))
             else:
-                out = []
                 self.pipe.set_error_handler(self._pipe_error_handler)
                 try:
                     texts = self._get_trimmed_texts(text)
-                    docs = self.pipe.batch_multi_process(texts, n_process, batch_size)
-
-                    for doc in tqdm(docs, total=len(texts)):
-                        doc = None if doc.text.strip() == '' else doc
-                        out.append(self._doc_to_out(doc, cnf_annotation_output, only_cui, addl_info))
-
-                    # Currently spaCy cannot mark which pieces of texts failed within the pipe so be this workaround,
-                    # which also assumes texts are different from each others.
-                    if len(out) < len(texts):
-                        self.log.warning("Found at least one failed batch and set the corresponding outputs to None")
-                        for i in range(len(texts)):
-                            if i == len(out):
-                                out.append(self._doc_to_out(None, cnf_annotation_output, only_cui, addl_info))
-                            elif out[i]['text'] != texts[i]:
-                                out.insert(i, self._doc_to_out(None, cnf_annotation_output, only_cui, addl_info))
+                    docs_out: List[Optional[Dict]] = [None] * len(texts)
+                    with self._worker_memory(n_process):
+                        docs = self.pipe.batch_multi_process(texts, n_process, batch_size)
+
+                        # Every doc carries the position of its text, failed docs are marked and not dropped
+                        for doc in tqdm(docs, total=len(texts)):
+                            doc_out = None if doc._.failed or doc.text.strip() == '' else doc
+                            docs_out[doc._.id] = self._doc_to_out(doc_out, cnf_annotation_output, only_cui, addl_info)
+
+                    # A component outside of MedCAT can still drop docs, retry them one at a time
+                    missing = [i for i, doc_out in enumerate(docs_out) if doc_out is None]
+                    if missing:
+                        self.log.warning("{} docs were dropped from the batch, processing them one at a time".format(len(missing)))
+                    for i in missing:
+                        try:
+                            doc = self(texts[i])
+                        except Exception as e:
+                            self.log.warning(e, exc_info=True, stack_info=True)
+                            doc = None
+                        docs_out[i] = self._doc_to_out(doc, cnf_annotation_output, only_cui, addl_info)
+                    out = docs_out
                 finally:
                     self.pipe.reset_error_handler()
 
@@ -691,58 +749,134 @@ p
 
         return:  an list of tuples: [(id, doc_json), (id, doc_json), ...]
         '''
+        return list(self.multiprocessing_iter(in_data, nproc=nproc, batch_size_chars=batch_size_chars,
+                                              only_cui=only_cui, addl_info=addl_info))
+
+    def multiprocessing_iter(self,
+                             in_data: Iterable[Tuple],
+                             nproc: int = 8,
+                             batch_size_chars: int = 1000000,
+                             only_cui: bool = False,
+                             addl_info: List[str] = [],
+                             max_queued_batches: Optional[int] = None) -> Generator[Tuple, None, None]:
+        r''' Same as `multiprocessing`, but results are yielded as soon as a batch is done (in the order
+        in which the batches finish). The input is read only as fast as the results are consumed, at most
+        `max_queued_batches` batches are read but not yet returned. Can be used for corpora that do not
+        fit into memory. NOT FOR TRAINING
+
+        in_data:  an iterator or array with format: [(id, text), (id, text), ...]
+        nproc:  number of processors
+        batch_size_chars: size of a batch in number of characters
+        max_queued_batches: the number of batches that can be in progress at once, defaults to 2*nproc
+
+        return:  a generator of tuples: (id, doc_json)
+        '''
+        return self._mp_iter(in_data, nproc=nproc, batch_size_chars=batch_size_chars, ordered=False,
+                             max_queued_batches=max_queued_batches,
+                             worker_kwargs={'only_cui': only_cui, 'addl_info': addl_info})
+
+    def multiprocessing_pipe_iter(self,
+                                  in_data: Iterable[Tuple],
+                                  nproc: Optional[int] = None,
+                                  batch_size: int = 100,
+                                  only_cui: bool = False,
+                                  addl_info: List[str] = [],
+                                  ordered: bool = True,
+                                  max_queued_batches: Optional[int] = None) -> Generator[Tuple, None, None]:
+        r''' Streaming version of `multiprocessing_pipe`, the input is never materialised and results are yielded
+        as soon as they are available. Each batch of texts goes through the pipeline in a worker process together with
+        its ids, so outputs always belong to the right id (also when texts repeat). NOT FOR TRAINING
+
+        in_data:  an iterable (can be unbounded) with format: (id, text), (id, text), ...
+        nproc:  the number of processors, defaults to max(cpu_count() - 1, 1)
+        batch_size: the number of texts in one batch
+        ordered: if True results are yielded in the input order, otherwise as soon as a batch is done
+        max_queued_batches: the number of batches that can be in progress at once, defaults to 2*nproc
+
+        return:  a generator of tuples: (id, doc_json), doc_json is None for empty texts or if processing failed
+        '''
+        nproc = nproc if nproc is not None else max(cpu_count() - 1, 1)
+        return self._mp_iter(in_data, nproc=nproc, batch_size=batch_size, ordered=ordered,
+                             max_queued_batches=max_queued_batches,
+                             worker_kwargs={'only_cui': only_cui, 'addl_info': addl_info, 'keep_failed': True})
+
+    def _mp_iter(self, in_data, nproc, batch_size_chars=None, batch_size=None, ordered=False, max_queued_batches=None,
+                 worker_kwargs={}, target=None):
         if self._meta_annotations:
             # Hack for torch using multithreading, which is not good here
             import torch
             torch.set_num_threads(1)
 
-        # Create the input output for MP
-        in_q = Queue(maxsize=4*nproc)
-        manager = Manager()
-        out_dict = manager.dict()
-        out_dict['processed'] = []
+        max_queued_batches = max_queued_batches if max_queued_batches is not None else 2 * nproc
+        in_q = Queue()
+        out_q = Queue()
+        # Released when a batch is returned, limits how far the input is read ahead of the output
+        slots = Semaphore(max_queued_batches)
+        stop = Event()
+        feeder_error: List[BaseException] = []
 
         # Create processes
         procs = []
-        for i in range(nproc):
-            p = Process(target=self._mp_cons, kwargs={'in_q': in_q, 'out_dict': out_dict, 'pid': i, 'only_cui': only_cui,
-                'addl_info': addl_info})
-            p.start()
-            procs.append(p)
-
-        data = []
-        nchars = 0
-        for id, text in in_data:
-            data.append((id, str(text)))
-            nchars += len(str(text))
-            if nchars >= batch_size_chars:
-                in_q.put(data)
-                data = []
-                nchars = 0
-        # Put the last batch if it exists
-        if len(data) > 0:
-            in_q.put(data)
-
-        for _ in range(nproc):  # tell workers we're done
-            in_q.put(None)
-
-        for p in procs:
-            p.join()
-
-        # Close the queue as it can cause memory leaks
-        in_q.close()
-
-        out = []
-        for key in out_dict.keys():
-            if 'pid' in key:
-                data = out_dict[key]
-                out.extend(data)
-
-        # Sometimes necessary to free memory
-        out_dict.clear()
-        del out_dict
+        with self._worker_memory(nproc):
+            for i in range(nproc):
+                p = Process(target=target or self._mp_cons, kwargs=dict(in_q=in_q, out_q=out_q, pid=i, **worker_kwargs))
+                p.daemon = True
+                p.start()
+                procs.append(p)
+
+        # Batches are put on the queue from a thread, so that reading the input and collecting
+        #the results do not block each other
+        feeder = Thread(target=self._mp_feed, args=(in_data, in_q, nproc, batch_size_chars, batch_size, slots, stop, feeder_error),
+                        daemon=True)
+        feeder.start()
+
+        n_finished = 0
+        next_batch = 0
+        pending = {}
+        try:
+            while n_finished < nproc:
+                try:
+                    data = out_q.get(timeout=self._mp_poll_interval)
+                except Empty:
+                    # A worker that was killed (e.g. out of memory) never sends its None, do not wait for it forever
+                    # In order, a lost batch would also hold back all the batches after it
+                    self._mp_check_workers(procs, next_batch if ordered else None)
+                    continue
+                if data is None:
+                    n_finished += 1
+                elif not ordered:
+                    slots.release()
+                    yield from data[1]
+                else:
+                    pending[data[0]] = data[1]
+                    while next_batch in pending:
+                        slots.release()
+                        yield from pending.pop(next_batch)
+                        next_batch += 1
+        finally:
+            if n_finished < nproc:
+                # The generator was closed early or the consumer failed, do not wait for the rest
+                stop.set()
+                for p in procs:
+                    p.terminate()
+                in_q.cancel_join_thread()
+            for p in procs:
+                p.join()
+            # The feeder can be blocked reading the input, it is a daemon thread and is not waited for
+            feeder.join(timeout=self._mp_poll_interval)
+
+        if feeder_error:
+            raise feeder_error[0]
 
-        return out
+    @staticmethod
+    def _mp_check_workers(procs, next_batch=None):
+        # Workers exit with 0 only after they sent their None, anything else means they died
+        for pid, p in enumerate(procs):
+            if p.exitcode is not None and p.exitcode != 0:
+                msg = "Worker process {} died with exit code {}, the results of its batches are lost".format(pid, p.exitcode)
+                if next_batch is not None:
+                    msg += " (results are returned in order, waiting for batch {})".format(next_batch)
+                raise RuntimeError(msg)
 
     def multiprocessing_pipe(self,
                              in_data: Union[List[Tuple], Iterable[Tuple]],
@@ -784,42 +918,111 @@ p
 
         return out
 
-    def _mp_cons(self, in_q, out_dict, pid=0, only_cui=False, addl_info=[]):
-        cnt = 0
-        out = []
+    def share_memory(self):
+        r''' Move the read-only arrays of the model (CDB context vectors, Vocab word vectors and
+        unigram table) into shared memory. Worker processes forked afterwards use them without
+        making a copy each. Used automatically before starting workers if `config.general['share_memory']` is set.
+        '''
+        self.cdb.share_memory()
+        if self.vocab is not None:
+            self.vocab.share_memory()
+
+    @contextmanager
+    def _worker_memory(self, n_process):
+        # Prepare the model to be shared with the workers started inside this context
+        if self.config.general.get('share_memory', False) and n_process is not None and n_process > 1:
+            self.share_memory()
+            with frozen_gc():
+                yield
+        else:
+            yield
+
+    @staticmethod
+    def _mp_feed(in_data, in_q, nproc, batch_size_chars, batch_size, slots, stop, error):
+        n_batches = 0
+
+        def put(data):
+            # Wait for a free slot, unless everything is being stopped
+            while not stop.is_set():
+                if slots.acquire(timeout=1):
+                    in_q.put((n_batches, data))
+                    return True
+            return False
+
+        try:
+            data = []
+            nchars = 0
+            for id, text in in_data:
+                data.append((id, text))
+                nchars += len(text) if isinstance(text, str) else 0
+                if (batch_size_chars is not None and nchars >= batch_size_chars) or \
+                        (batch_size is not None and len(data) >= batch_size):
+                    if not put(data):
+                        return
+                    n_batches += 1
+                    data = []
+                    nchars = 0
+            # Put the last batch if it exists
+            if len(data) > 0:
+                put(data)
+        except Exception as e:
+            error.append(e)
+        finally:
+            for _ in range(nproc):  # tell workers we're done
+                in_q.put(None)
+
+    def _mp_cons(self, in_q, out_q, pid=0, only_cui=False, addl_info=[], keep_failed=False):
         while True:
-            if not in_q.empty():
-                data = in_q.get()
-                if data is None:
-                    out_dict['pid: {}'.format(pid)] = out
-                    break
+            batch = in_q.get()
+            if batch is None:
+                out_q.put(None)
+                break
 
+            n, data = batch
+            out = []
+            if keep_failed:
+                # One output for every input, None if the text is empty or failed. With n_process=1 the batch goes
+                #through Pipe.batch_multi_process, where a failing document is marked and does not fail the others
+                docs = self.get_entities(text=[text for _, text in data], only_cui=only_cui, addl_info=addl_info, n_process=1)
+                out = [(id, doc if 'text' in doc else None) for (id, _), doc in zip(data, docs)]
+            else:
                 for id, text in data:
                     try:
                         # Annotate document
-                        doc = self.get_entities(text=text, only_cui=only_cui, addl_info=addl_info)
+                        doc = self.get_entities(text=str(text), only_cui=only_cui, addl_info=addl_info)
                         out.append((id, doc))
                     except Exception as e:
                         self.log.warning("Exception in _mp_cons")
                         self.log.warning(e, exc_info=True, stack_info=True)
+            out_q.put((n, out))
 
-            sleep(1)
+    def _mp_train_cons(self, in_q, out_q, pid=0):
+        # The linker collects the training examples instead of applying them, they are sent to the main process
+        self.linker.train_updates = []
+        while True:
+            batch = in_q.get()
+            if batch is None:
+                out_q.put(None)
+                break
+
+            n, data = batch
+            out = []
+            for id, text in data:
+                try:
+                    _ = self(text, do_train=True)
+                except Exception as e:
+                    self.log.warning("LINE: '{}...' \t WAS SKIPPED".format(text[0:100]))
+                    self.log.warning("BECAUSE OF: " + str(e))
+                out.append((id, self.linker.train_updates))
+                self.linker.train_updates = []
+            out_q.put((n, out))
 
     def _doc_to_out(self, doc: Doc, cnf_annotation_output: Dict, only_cui: bool, addl_info: List[str]) -> Dict:
         out: Dict = {'entities': {}, 'tokens': []}
         if doc is not None:
             out_ent = {}
             if self.config.general.get('show_nested_entities', False):
-                _ents = []
-                for _ent in doc._.ents:
-                    entity = Span(doc, _ent['start'], _ent['end'], label=_ent['label'])
-                    entity._.cui = _ent['cui']
-                    entity._.detected_name = _ent['detected_name']
-                    entity._.context_similarity = _ent['context_similarity']
-                    entity._.id = _ent['id']
-                    if 'meta_anns' in _ent:
-                        entity._.meta_anns = _ent['meta_anns']
-                    _ents.append(entity)
+                _ents = PipeRunner.deserialize_entities(doc)._.ents
             else:
                 _ents = doc.ents
 
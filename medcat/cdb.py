@@ -1,14 +1,21 @@
 """ Representation class for CDB data
 """
 
+import os
 import dill
 import logging
 import numpy as np
+from copy import deepcopy
 from typing import Dict, List, Set
 from functools import partial
 
 from medcat.utils.matutils import unitvec, sigmoid
+from medcat.utils.context_vectors import ContextVectorStore
+from medcat.utils.name_maps import CompactNameMaps, is_compact, expand, expand_all
+from medcat.utils.similarity import SimilarityIndex
+from medcat.utils.cdb_storage import save_cdb_dir, load_cdb_dir
 from medcat.utils.ml_utils import get_lr_linking
+from medcat.preprocessing.cleaners import get_snames
 from medcat.config import Config, weighted_average, workers
 
 
@@ -27,9 +34,13 @@ class CDB(object):
             From cui to all names assigned to it. Mainly used for subsetting (maybe even only).
         cui2snames (`Dict[str, Set[str]]`):
             From cui to all sub-names assigned to it. Only used for subsetting.
+            If `config.general['compact_name_maps']` is True the five maps above are read-only views of a
+            `medcat.utils.name_maps.CompactNameMaps`, they are moved back into dictionaries when the CDB is edited.
         cui2context_vectors (`Dict[str, Dict[str, np.array]]`):
             From cui to a dictionary of different kinds of context vectors. Normally you would have here
-            a short and a long context vector - they are calculated separately.
+            a short and a long context vector - they are calculated separately. If
+            `config.linking['context_vector_store']` is `matrix` this is a `medcat.utils.context_vectors.ContextVectorStore`
+            that keeps one matrix per context type, but can be used in the same way.
         cui2count_train (`Dict[str, int]`):
             From CUI to the number of training examples seen.
         cui2tags (`Dict[str, List[str]]`):
@@ -49,6 +60,10 @@ class CDB(object):
             Stores all the words tha appear in this CDB and the count for each one.
     """
     log = logging.getLogger(__name__)
+    NAME_MAPS = ('name2cuis', 'name2cuis2status', 'snames', 'cui2names', 'cui2snames')
+    # Set on the CDBs returned by `filtered`, they share data with another CDB and can not be edited or trained
+    _filtered_view = False
+
     def __init__(self, config):
         self.config = config
         self.name2cuis = {}
@@ -58,7 +73,7 @@ class CDB(object):
 
         self.cui2names = {}
         self.cui2snames = {}
-        self.cui2context_vectors = {}
+        self.cui2context_vectors = self._new_context_vectors()
         self.cui2count_train = {}
         self.cui2info = {}
         self.cui2tags = {} # Used to add custom tags to CUIs
@@ -81,6 +96,83 @@ class CDB(object):
                 }
         self.vocab = {} # Vocabulary of all words ever in our cdb
         self._optim_params = None
+        # Used by most_similar, not saved in cdb.dat
+        self._similarity_indices = {}
+
+
+    def __deepcopy__(self, memo):
+        # A copy does not share anything, so a copy of a filtered view can be edited and trained
+        cdb = type(self).__new__(type(self))
+        memo[id(self)] = cdb
+        for k, v in self.__dict__.items():
+            if k != '_filtered_view':
+                cdb.__dict__[k] = deepcopy(v, memo)
+        return cdb
+
+
+    def _check_not_view(self):
+        # Called before the CDB is edited, a filtered view shares containers with the CDB it was made from
+        if self._filtered_view:
+            raise TypeError("This CDB is a view made by CDB.filtered and shares data with the CDB it was made from, "
+                            "it can not be edited or trained. Use copy.deepcopy on it first.")
+
+
+    def _new_context_vectors(self):
+        if self.config.linking.get('context_vector_store', 'dict') == 'matrix':
+            return ContextVectorStore()
+        return {}
+
+
+    def use_context_vector_store(self, matrix=True):
+        r''' Switch the storage of `cui2context_vectors` between a dictionary of numpy arrays and
+        a `ContextVectorStore` (one matrix per context type, used for vectorised disambiguation).
+
+        Args:
+            matrix (`bool`, defaults to `True`):
+                If True the vectors will be moved into a `ContextVectorStore`, otherwise into a dictionary.
+        '''
+        if matrix and not isinstance(self.cui2context_vectors, ContextVectorStore):
+            self.cui2context_vectors = ContextVectorStore.from_dict(self.cui2context_vectors)
+        elif not matrix and isinstance(self.cui2context_vectors, ContextVectorStore):
+            self.cui2context_vectors = self.cui2context_vectors.to_dict()
+        self.config.linking['context_vector_store'] = 'matrix' if matrix else 'dict'
+
+
+    def share_memory(self):
+        r''' Move the context vectors into a `ContextVectorStore` in read-only shared memory, so that
+        worker processes forked afterwards do not copy them. Vectors kept in a dictionary stay in the
+        `ContextVectorStore` afterwards, but `config.linking['context_vector_store']` is not changed.
+        '''
+        if not isinstance(self.cui2context_vectors, ContextVectorStore):
+            self.log.info("Moving the context vectors into a ContextVectorStore to share them with worker processes")
+            self.cui2context_vectors = ContextVectorStore.from_dict(self.cui2context_vectors)
+        self.cui2context_vectors.share_memory()
+
+
+    def use_compact_names(self, compact=True):
+        r''' Switch the storage of the name maps (`name2cuis`, `name2cuis2status`, `snames`, `cui2names`
+        and `cui2snames`) between dictionaries and a `CompactNameMaps` (interned strings and CSR arrays).
+
+        Args:
+            compact (`bool`, defaults to `True`):
+                If True the maps will be replaced by read-only views of a `CompactNameMaps`, otherwise by dictionaries.
+        '''
+        if compact:
+            if not all(is_compact(getattr(self, field)) for field in self.NAME_MAPS):
+                maps = CompactNameMaps(*[getattr(self, field) for field in self.NAME_MAPS])
+                for field in self.NAME_MAPS:
+                    setattr(self, field, getattr(maps, field))
+        else:
+            self._expand_names()
+        self.config.general['compact_name_maps'] = compact
+
+
+    def _expand_names(self):
+        # Called before the name maps are edited, compact maps are read-only
+        if any(is_compact(getattr(self, field)) for field in self.NAME_MAPS):
+            self.log.debug("Moving the compact name maps into dictionaries")
+            for field in self.NAME_MAPS:
+                setattr(self, field, expand(getattr(self, field)))
 
 
     def get_name(self, cui):
@@ -102,6 +194,7 @@ class CDB(object):
 
 
     def update_cui2average_confidence(self, cui, new_sim):
+        self._check_not_view()
         self.cui2average_confidence[cui] = (self.cui2average_confidence.get(cui, 0) * self.cui2count_train.get(cui, 0) + new_sim)  / \
                                             (self.cui2count_train.get(cui, 0) + 1)
 
@@ -118,6 +211,8 @@ class CDB(object):
             names (`Dict[str, Dict]`):
                 Names to be removed, should look like: `{'name': {'tokens': tokens, 'snames': snames, 'raw_name': raw_name}, ...}`
         '''
+        self._check_not_view()
+        self._expand_names()
         for name in names.keys():
             if name in self.name2cuis:
                 if cui in self.name2cuis[name]:
@@ -190,6 +285,8 @@ class CDB(object):
                 If True the dictionary self.addl_info will also be populated, contains a lot of extra information
                 about concepts, but can be very memory consuming. This is not necessary for normal functioning of MedCAT.
         '''
+        self._check_not_view()
+        self._expand_names()
         # Add CUI to the required dictionaries
         if cui not in self.cui2names:
             # Create placeholders 
@@ -246,6 +343,8 @@ class CDB(object):
                     self.vocab[token] += 1
                 else:
                     self.vocab[token] = 1
+                    if 'spell_index' in self.addl_info:
+                        self.addl_info['spell_index'].add_word(token)
 
         # Check is this a preferred name for the concept, this takes the name_info
         #dict which must have a value (but still have to check it, just in case).
@@ -287,12 +386,72 @@ class CDB(object):
             reset_existing (`bool`):
                 Should old data be removed if it exists
         '''
+        self._check_not_view()
         if reset_existing:
             self.addl_info[name] = {}
 
         self.addl_info[name].update(data)
 
 
+    def merge_concepts(self, cdb):
+        r''' Add the concepts of another CDB to this one, the result is the same as if the concepts of `cdb`
+        were added (with `add_concept`) after the ones already in this CDB. Used to merge CDBs built from different
+        parts of the same CSVs. Only the concepts and names are merged, not the training (context vectors, counts).
+
+        Args:
+            cdb (`medcat.cdb.CDB`):
+                The CDB whose concepts will be added to this one, it is not changed.
+        '''
+        self._check_not_view()
+        self._expand_names()
+        for name, cuis in cdb.name2cuis.items():
+            cui2status = cdb.name2cuis2status[name]
+            if name in self.name2cuis:
+                for cui in cuis:
+                    if cui not in self.name2cuis[name]:
+                        self.name2cuis[name].append(cui)
+                        self.name2cuis2status[name][cui] = cui2status[cui]
+                    elif cui2status[cui] == 'P':
+                        self.name2cuis2status[name][cui] = 'P'
+            else:
+                self.name2cuis[name] = list(cuis)
+                self.name2cuis2status[name] = dict(cui2status)
+        self.name_isupper.update(cdb.name_isupper)
+        self.snames.update(cdb.snames)
+
+        for cui, names in cdb.cui2names.items():
+            if cui in self.cui2names:
+                self.cui2names[cui].update(names)
+                self.cui2snames[cui].update(cdb.cui2snames.get(cui, set()))
+                self.cui2type_ids[cui].update(cdb.cui2type_ids.get(cui, set()))
+            else:
+                self.cui2names[cui] = set(names)
+                self.cui2snames[cui] = set(cdb.cui2snames.get(cui, set()))
+                self.cui2type_ids[cui] = set(cdb.cui2type_ids.get(cui, set()))
+            if cui in cdb.cui2preferred_name and cui not in self.cui2preferred_name:
+                self.cui2preferred_name[cui] = cdb.cui2preferred_name[cui]
+
+        for token, count in cdb.vocab.items():
+            if token in self.vocab:
+                self.vocab[token] += count
+            else:
+                self.vocab[token] = count
+                if 'spell_index' in self.addl_info:
+                    self.addl_info['spell_index'].add_word(token)
+
+        for key, data in cdb.addl_info.items():
+            if key in ('cui2ontologies', 'cui2original_names', 'type_id2cuis'):
+                # Sets that add_concept extends
+                merged = self.addl_info.setdefault(key, {})
+                for k, values in data.items():
+                    if k in merged:
+                        merged[k].update(values)
+                    else:
+                        merged[k] = set(values)
+            elif isinstance(data, dict):
+                self.addl_info.setdefault(key, {}).update(data)
+
+
     def update_context_vector(self, cui, vectors, negative=False, lr=None, cui_count=0):
         r''' Add the vector representation of a context for this CUI.
 
@@ -308,6 +467,7 @@ class CDB(object):
         cui_count (`int`, defaults to 0):
             The learning rate will be calculated based on the count for the provided CUI + cui_count.
         '''
+        self._check_not_view()
         if cui not in self.cui2context_vectors:
             self.cui2context_vectors[cui] = {}
             self.cui2count_train[cui] = 0
@@ -353,29 +513,50 @@ class CDB(object):
             self.cui2count_train[cui] += 1
 
 
-    def save(self, path):
+    def save(self, path, fmt='dat'):
         r''' Saves model to file (in fact it saves vairables of this class). 
 
         Args:
             path (`str`):
                 Path to a file where the model will be saved
+            fmt (`str`, defaults to `dat`):
+                `dat` saves everything into one file, `dir` saves into a directory where the
+                context vectors can be memory mapped and `addl_info` is loaded lazily
+                (look at `medcat.utils.cdb_storage`).
         '''
+        if fmt == 'dir':
+            save_cdb_dir(self, path)
+            return
+        elif fmt != 'dat':
+            raise ValueError("Unknown CDB format: {}".format(fmt))
+
         with open(path, 'wb') as f:
             # No idea how to this correctly
             to_save = {}
             to_save['config'] = self.config.__dict__
-            to_save['cdb'] = {k:v for k,v in self.__dict__.items() if k != 'config'}
+            # Compact name maps are saved as dictionaries, pickling a view saves the whole CompactNameMaps with it.
+            #They are made compact again on load.
+            to_save['cdb'] = expand_all({k:v for k,v in self.__dict__.items() if k not in ('config', '_similarity_indices')})
+            # Make sure lazily loaded sections are loaded
+            to_save['cdb']['addl_info'] = dict(self.addl_info)
             dill.dump(to_save, f)
 
 
     @classmethod
-    def load(cls, path, config=None):
+    def load(cls, path, config=None, mmap=True):
         r''' Load and return a CDB. This allows partial loads in probably not the right way at all.
 
         Args:
             path (`str`):
-                Path to a `cdb.dat` from which to load data.
+                Path to a `cdb.dat` from which to load data, or to a directory
+                created with `save(path, fmt='dir')`.
+            mmap (`bool`, defaults to `True`):
+                Only for the directory format, memory map the context vectors.
         '''
+        if os.path.isdir(path):
+            # Raises a ValueError if it is not a saved CDB (e.g. a saved Vocab)
+            return load_cdb_dir(cls, path, config=config, mmap=mmap)
+
         with open(path, 'rb') as f:
             # Again no idea
             data = dill.load(f)
@@ -391,10 +572,15 @@ class CDB(object):
                 if k in data['cdb']:
                     cdb.__dict__[k] = data['cdb'][k]
 
+            if cdb.config.linking.get('context_vector_store', 'dict') == 'matrix':
+                cdb.use_context_vector_store(matrix=True)
+            cdb.use_compact_names(cdb.config.general.get('compact_name_maps', False))
+
         return cdb
 
 
     def import_old_cdb_vectors(self, cdb):
+        self._check_not_view()
         # Import context vectors
         for cui in self.cui2names: # Loop through all CUIs in the current CDB
             if cui in cdb.cui2context_vec:
@@ -411,6 +597,7 @@ class CDB(object):
     def import_old_cdb(self, cdb, import_vectors=True):
         r''' Import all data except for cuis and names from an old CDB.
         '''
+        self._check_not_view()
 
         # Import vectors
         if import_vectors:
@@ -458,6 +645,7 @@ class CDB(object):
         Examples:
             >>> new_cdb.import_traininig(cdb=old_cdb, owerwrite=True)
         '''
+        self._check_not_view()
         # Import vectors and counts
         for cui in cdb.cui2context_vectors:
             if cui in self.cui2names:
@@ -492,7 +680,7 @@ class CDB(object):
         potentially added during supervised/online learning.
         '''
         self.cui2count_train = {}
-        self.cui2context_vectors = {}
+        self.cui2context_vectors = self._new_context_vectors()
         self.reset_concept_similarity()
 
 
@@ -501,33 +689,70 @@ class CDB(object):
         then in cuis_to_keep. It will first find all names that link to the cuis_to_keep and then
         find all CUIs that link to those names and keep all of them.
         This also will not remove any data from cdb.addl_info - as this field can contain data of
-        unknown structure.
+        unknown structure. If the CDB has no `cui2snames` (e.g. a `small/medium` version of a CDB) the
+        snames are recomputed from the kept names.
 
         Args:
             cuis_to_keep (`List[str]`):
                 CUIs that will be kept, the rest will be removed (not completely, look above).
         '''
+        self.__dict__.update(self._filter_fields(cuis_to_keep))
+
+
+    def filtered(self, cuis_to_keep):
+        r''' Same as `filter_by_cui`, but returns a new CDB and leaves this one as it is. Nothing is copied, the
+        new CDB shares the config, the fields that are not subset (`vocab`, `addl_info`, `name_isupper`, ...) and the
+        values of the subset fields with this CDB. Compact name maps (`use_compact_names`) share the string tables
+        and arrays. Because of that the new CDB is read-only, methods that edit or train it (`add_names`,
+        `remove_names`, `update_context_vector`, ...) raise a `TypeError`. Use `copy.deepcopy` on the result
+        to get a CDB that can be edited or trained.
+
+        Args:
+            cuis_to_keep (`List[str]`):
+                CUIs that will be kept (look at `filter_by_cui`).
+
+        Return:
+            cdb (`medcat.cdb.CDB`):
+                The filtered CDB.
+        '''
+        cdb = type(self)(config=self.config)
+        cdb.__dict__.update(self.__dict__)
+        cdb.__dict__.update(self._filter_fields(cuis_to_keep))
+        cdb._filtered_view = True
+        return cdb
+
 
-        if not self.cui2snames:
-            raise Exception("This CDB does not support subsetting - most likely because it is a `small/medium` version of a CDB")
-
-        # First get all names/snames that should be kept based on this CUIs
-        names_to_keep = set()
-        snames_to_keep = set()
-        for cui in cuis_to_keep:
-            names_to_keep.update(self.cui2names[cui])
-            snames_to_keep.update(self.cui2snames[cui])
-
-        # Based on the names get also the indirect CUIs that have to be kept
-        all_cuis_to_keep = set()
-        for name in names_to_keep:
-            all_cuis_to_keep.update(self.name2cuis[name])
-
-        new_name2cuis = {}
-        new_name2cuis2status = {}
-        new_cui2names = {}
-        new_cui2snames = {}
-        new_cui2context_vectors = {}
+    def _filter_fields(self, cuis_to_keep):
+        # The subset fields for filter_by_cui, in time proportional to the number of kept concepts
+        separator = self.config.general['separator']
+        fields = {}
+        if all(is_compact(getattr(self, field)) for field in self.NAME_MAPS):
+            maps, all_cuis_to_keep = self.name2cuis.maps.filter_by_cui(cuis_to_keep, separator)
+            for field in self.NAME_MAPS:
+                fields[field] = getattr(maps, field)
+        else:
+            # First get all names/snames that should be kept based on this CUIs
+            names_to_keep = set()
+            snames_to_keep = set()
+            for cui in cuis_to_keep:
+                names_to_keep.update(self.cui2names.get(cui, ()))
+                snames_to_keep.update(self.cui2snames.get(cui, ()))
+            if not self.cui2snames:
+                for name in names_to_keep:
+                    snames_to_keep.update(get_snames(name.split(separator), separator))
+
+            # Based on the names get also the indirect CUIs that have to be kept
+            all_cuis_to_keep = set()
+            for name in names_to_keep:
+                all_cuis_to_keep.update(self.name2cuis.get(name, ()))
+
+            fields['name2cuis'] = {name: self.name2cuis[name] for name in names_to_keep if name in self.name2cuis}
+            fields['name2cuis2status'] = {name: self.name2cuis2status[name] for name in names_to_keep if name in self.name2cuis2status}
+            fields['snames'] = snames_to_keep
+            fields['cui2names'] = {cui: self.cui2names[cui] for cui in all_cuis_to_keep if cui in self.cui2names}
+            fields['cui2snames'] = {cui: self.cui2snames[cui] for cui in all_cuis_to_keep if cui in self.cui2snames}
+
+        new_cui2context_vectors = self._new_context_vectors()
         new_cui2count_train = {}
         new_cui2tags = {} # Used to add custom tags to CUIs
         new_cui2type_ids = {}
@@ -535,34 +760,24 @@ class CDB(object):
 
         # Subset cui2<whatever>
         for cui in all_cuis_to_keep:
-            new_cui2names[cui] = self.cui2names[cui]
-            new_cui2snames[cui] = self.cui2snames[cui]
             if cui in self.cui2context_vectors:
                 new_cui2context_vectors[cui] = self.cui2context_vectors[cui]
                 # We assume that it must have the cui2count_train if it has a vector
                 new_cui2count_train[cui] = self.cui2count_train[cui]
             if cui in self.cui2tags:
                 new_cui2tags[cui] = self.cui2tags[cui]
-            new_cui2type_ids[cui] = self.cui2type_ids[cui]
+            if cui in self.cui2type_ids:
+                new_cui2type_ids[cui] = self.cui2type_ids[cui]
             if cui in self.cui2preferred_name:
                 new_cui2preferred_name[cui] = self.cui2preferred_name[cui]
 
-        # Subset name2<whatever>
-        for name in names_to_keep:
-            new_name2cuis[name] = self.name2cuis[name]
-            new_name2cuis2status[name] = self.name2cuis2status[name]
-
-        # Replace everything
-        self.name2cuis = new_name2cuis
-        self.snames = snames_to_keep
-        self.name2cuis2status = new_name2cuis2status
-        self.cui2names = new_cui2names
-        self.cui2snames = new_cui2snames
-        self.cui2context_vectors = new_cui2context_vectors
-        self.cui2count_train = new_cui2count_train
-        self.cui2tags = new_cui2tags
-        self.cui2type_ids = new_cui2type_ids
-        self.cui2preferred_name = new_cui2preferred_name
+        fields['cui2context_vectors'] = new_cui2context_vectors
+        fields['cui2count_train'] = new_cui2count_train
+        fields['cui2tags'] = new_cui2tags
+        fields['cui2type_ids'] = new_cui2type_ids
+        fields['cui2preferred_name'] = new_cui2preferred_name
+        fields['_similarity_indices'] = {}
+        return fields
 
 
     def print_stats(self):
@@ -577,9 +792,35 @@ class CDB(object):
 
 
     def reset_concept_similarity(self):
-        r''' Reset concept similarity matrix.
+        r''' Reset the indices used by `most_similar`.
         '''
-        self.addl_info['similarity'] = {}
+        self._similarity_indices = {}
+        # Similarity matrices of older versions
+        self.addl_info.pop('similarity', None)
+
+
+    def build_similarity_index(self, context_type):
+        r''' Build the index used by `most_similar` for one context type, the type of the index is set
+        in `config.linking['similarity_index']`. The index is not updated when context vectors change,
+        build it again (or use `force_build`) after training.
+
+        Args:
+            context_type (`str`):
+                On what vector type from the cui2context_vectors map will the similarity be calculated.
+
+        Return:
+            index (`medcat.utils.similarity.SimilarityIndex`):
+                The new index.
+        '''
+        self.log.info("Building similarity index")
+        settings = self.config.linking.get('similarity_index', {})
+        index = SimilarityIndex.from_cdb(self, context_type)
+        if settings.get('type', 'exact') == 'ivf':
+            index.build_ivf(n_lists=settings.get('n_lists', None), n_probe=settings.get('n_probe', 8))
+        elif settings.get('type', 'exact') != 'exact':
+            raise ValueError("Unknown similarity index: {}".format(settings['type']))
+        self._similarity_indices[context_type] = index
+        return index
 
 
     def most_similar(self, cui, context_type, type_id_filter=[], min_cnt=0, topn=50, force_build=False):
@@ -600,7 +841,7 @@ class CDB(object):
             topn (`int`):
                 How many results to return
             force_build (`bool`, defaults to `False`):
-                Do not use cached sim matrix
+                Do not use cached similarity index
 
         Return:
             results (Dict):
@@ -608,65 +849,39 @@ class CDB(object):
                                                               'type_id': <type_id>, 'cnt': <number of training examples the concept has seen>}, ...}
 
         '''
+        return self.most_similar_batch([cui], context_type, type_id_filter=type_id_filter, min_cnt=min_cnt, topn=topn,
+                                       force_build=force_build)[cui]
 
-        if 'similarity' in self.addl_info:
-            if context_type not in self.addl_info['similarity']:
-                self.addl_info['similarity'][context_type] = {}
-        else:
-            self.addl_info['similarity'] = {context_type: {}}
-
-        sim_data = self.addl_info['similarity'][context_type]
-
-        # Create the matrix if necessary
-        if 'sim_vectors' not in sim_data or force_build:
-            self.log.info("Building similarity matrix")
-
-            sim_vectors = []
-            sim_vectors_counts = []
-            sim_vectors_type_ids = []
-            sim_vectors_cuis = []
-            for _cui in self.cui2context_vectors:
-                if context_type in self.cui2context_vectors[_cui]:
-                    sim_vectors.append(unitvec(self.cui2context_vectors[_cui][context_type]))
-                    sim_vectors_counts.append(self.cui2count_train.get(_cui, 0))
-                    sim_vectors_type_ids.append(self.cui2type_ids.get(_cui, {'unk'}))
-                    sim_vectors_cuis.append(_cui)
-
-            sim_data['sim_vectors'] = np.array(sim_vectors)
-            sim_data['sim_vectors_counts'] = np.array(sim_vectors_counts)
-            sim_data['sim_vectors_type_ids'] = np.array(sim_vectors_type_ids)
-            sim_data['sim_vectors_cuis'] = np.array(sim_vectors_cuis)
-
-        # Select appropriate concepts
-        type_id_inds = np.arange(0, len(sim_data['sim_vectors_type_ids']))
-        if len(type_id_filter) > 0:
-            type_id_inds = np.array([], dtype=np.int32)
-            for type_id in type_id_filter:
-                type_id_inds = np.union1d(np.array([ind for ind, type_ids in enumerate(sim_data['sim_vectors_type_ids']) if type_id in type_ids]),
-                        type_id_inds)
-        cnt_inds = np.arange(0, len(sim_data['sim_vectors_counts']))
-        if min_cnt > 0:
-            cnt_inds = np.where(sim_data['sim_vectors_counts'] >= min_cnt)[0]
-        # Intersect cnt and type_id 
-        inds = np.intersect1d(type_id_inds, cnt_inds)
-
-        mtrx = sim_data['sim_vectors'][inds]
-        cuis = sim_data['sim_vectors_cuis'][inds]
-
-        sims = np.dot(mtrx, unitvec(self.cui2context_vectors[cui][context_type]))
-
-        sims_srt = np.argsort(-1*sims)
-
-        # Create the return dict
-        res = {}
-        print()
-        for ind, _cui in enumerate(cuis[sims_srt[0:topn]]):
-            res[_cui] = {'name': self.cui2preferred_name.get(_cui, list(self.cui2names[_cui])[0]), 'sim': sims[sims_srt][ind],
-                         'type_names': [self.addl_info['type_id2name'].get(cui, 'unk') for cui in self.cui2type_ids.get(_cui, ['unk'])],
-                         'type_ids': self.cui2type_ids.get(_cui, 'unk'),
-                         'cnt': self.cui2count_train.get(_cui, 0)}
-
-        return res
+
+    def most_similar_batch(self, cuis, context_type, type_id_filter=[], min_cnt=0, topn=50, force_build=False):
+        r''' Same as `most_similar`, but for many concepts at once.
+
+        Args:
+            cuis (`List[str]`):
+                The concepts for which you want to get the most similar concepts.
+            context_type (`str`), type_id_filter (`List[str]`), min_cnt (`int`), topn (`int`), force_build (`bool`):
+                Look at `most_similar`.
+
+        Return:
+            results (Dict):
+                From each of the `cuis` to the results of `most_similar` for it.
+        '''
+        index = self._similarity_indices.get(context_type, None)
+        if index is None or force_build:
+            index = self.build_similarity_index(context_type)
+
+        vectors = np.array([self.cui2context_vectors[cui][context_type] for cui in cuis])
+        results = {}
+        for cui, (similar_cuis, sims) in zip(cuis, index.query(vectors, topn=topn, type_id_filter=type_id_filter, min_cnt=min_cnt)):
+            res = {}
+            for _cui, sim in zip(similar_cuis, sims.tolist()):
+                res[_cui] = {'name': self.cui2preferred_name.get(_cui, list(self.cui2names[_cui])[0]), 'sim': sim,
+                             'type_names': [self.addl_info['type_id2name'].get(cui, 'unk') for cui in self.cui2type_ids.get(_cui, ['unk'])],
+                             'type_ids': self.cui2type_ids.get(_cui, 'unk'),
+                             'cnt': self.cui2count_train.get(_cui, 0)}
+            results[cui] = res
+
+        return results
 
     @staticmethod
     def _ensure_backward_compatibility(config: Config):
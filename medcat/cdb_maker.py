@@ -1,19 +1,25 @@
 import pandas
 import spacy
 import numpy as np
+import time
 import datetime
 import logging
 from functools import partial
+from collections import namedtuple
+from joblib import Parallel, delayed
 import re
 
 from medcat.pipe import Pipe
 from medcat.cdb import CDB
 from medcat.preprocessing.tokenizers import spacy_split_all
-from medcat.preprocessing.cleaners import prepare_name
+from medcat.preprocessing.cleaners import prepare_name, prepare_name_from_doc
 from medcat.preprocessing.taggers import tag_skip_and_punct
 from medcat.utils.loggers import add_handlers
 
 PH_REMOVE = re.compile("(\s)\([a-zA-Z]+[^\)\(]*\)($)")
+USEFUL_COLUMNS = ['cui', 'name', 'ontologies', 'name_status', 'type_ids', 'description']
+# A row of a CSV ready for CDB.add_concept, row_id is the position of the row in the CSVs
+ConceptRow = namedtuple('ConceptRow', ['row_id', 'cui', 'names', 'ontologies', 'name_status', 'type_ids', 'description'])
 
 class CDBMaker(object):
     r''' Given a CSV as shown in https://github.com/CogStack/MedCAT/tree/master/examples/<example> it creates a CDB or
@@ -50,7 +56,8 @@ class CDBMaker(object):
                             additional_fields=['is_punct'])
 
 
-    def prepare_csvs(self, csv_paths, sep=',', encoding=None, escapechar=None, index_col=False, full_build=False, only_existing_cuis=False, **kwargs):
+    def prepare_csvs(self, csv_paths, sep=',', encoding=None, escapechar=None, index_col=False, full_build=False, only_existing_cuis=False,
+                     bulk=True, n_process=1, batch_size=1000, n_shards=1, **kwargs):
         r''' Compile one or multiple CSVs into a CDB.
 
         Args:
@@ -72,6 +79,18 @@ class CDBMaker(object):
             only_existing_cuis (`bool`, defaults to False):
                 If True no new CUIs will be added, but only linked names will be extended. Mainly used when
                 enriching names of a CDB (e.g. SNOMED with UMLS terms).
+            bulk (`bool`, defaults to True):
+                If True each distinct name in a CSV is processed only once and all of them go through `nlp.pipe`
+                in batches, otherwise every name is processed in its row. The resulting CDB is the same.
+            n_process (`int`, defaults to 1):
+                Number of processes used by `nlp.pipe` in the bulk build.
+            batch_size (`int`, defaults to 1000):
+                Number of names in a batch for `nlp.pipe` in the bulk build.
+            n_shards (`int`, defaults to 1):
+                If more than 1 the rows of all CSVs are split by CUI into this many shards, each one is built
+                (in bulk) into a separate CDB in its own process and the CDBs are merged into this one.
+                The resulting CDB is the same as with `n_shards=1`. Each shard uses one process for `nlp.pipe`,
+                so it can not be used with `bulk=False` or `n_process` other than 1 (a `ValueError` is raised).
         Return:
             `medcat.cdb.CDB` with the new concepts added.
 
@@ -82,23 +101,25 @@ class CDBMaker(object):
                 Examples of the CSV used to make the CDB can be found on [GitHub](link)
         '''
 
-        useful_columns = ['cui', 'name', 'ontologies', 'name_status', 'type_ids', 'description']
         name_status_options = {'A', 'P', 'N'}
 
+        if n_shards > 1:
+            if not bulk or n_process != 1:
+                raise ValueError("n_shards={} builds every shard in bulk with one process, it can not be used with "
+                                 "bulk={} and n_process={}".format(n_shards, bulk, n_process))
+            return self._prepare_csvs_sharded(csv_paths, n_shards, full_build=full_build, only_existing_cuis=only_existing_cuis,
+                                              batch_size=batch_size, sep=sep, encoding=encoding, escapechar=escapechar,
+                                              index_col=index_col, **kwargs)
+
         for csv_path in csv_paths:
-            # Read CSV, everything is converted to strings
-            df = pandas.read_csv(csv_path, sep=sep, encoding=encoding, escapechar=escapechar, index_col=index_col, dtype=str, **kwargs)
-            df = df.fillna('')
-
-            # Find which columns to use from the CSV
-            cols = []
-            col2ind = {}
-            for col in list(df.columns):
-                if str(col).lower().strip() in useful_columns:
-                    col2ind[str(col).lower().strip()] = len(cols)
-                    cols.append(col)
+            df, cols, col2ind = self._read_csv(csv_path, sep=sep, encoding=encoding, escapechar=escapechar, index_col=index_col, **kwargs)
 
             self.log.info("Started importing concepts from: {}".format(csv_path))
+            if bulk:
+                self._add_df_bulk(df, cols, col2ind, full_build=full_build, only_existing_cuis=only_existing_cuis,
+                                  n_process=n_process, batch_size=batch_size)
+                continue
+
             _time = None # Used to check speed
             _logging_freq = np.ceil(len(df[cols]) / 100)
             for row_id, row in enumerate(df[cols].values):
@@ -172,5 +193,299 @@ class CDBMaker(object):
 
         return self.cdb
 
+    def update_from_csvs(self, old_csv_paths, new_csv_paths, sep=',', encoding=None, escapechar=None, index_col=False, full_build=False,
+                         n_process=1, batch_size=1000, **kwargs):
+        r''' Update a CDB built from `old_csv_paths` to the concepts in `new_csv_paths` (e.g. a new release of a terminology)
+        by applying only the differences between them. Only the concepts with added, removed or changed rows are processed,
+        everything else in the CDB (including the training of the changed concepts) is kept.
+
+        For every changed concept the names that are not in the new CSVs are unlinked with `CDB.remove_names` and the concept
+        is added again from its rows in the new CSVs, with the name statuses, type_ids, preferred name and vocab counts as in a
+        new build. Concepts that have no rows in the new CSVs are removed together with their training (context vectors,
+        counts and average confidence). The result is not exactly the same as a new build: `snames` is not pruned and a concept
+        added again is at the end of the `name2cuis` lists it shares with other concepts, not in the order of the CSVs.
+
+        Args:
+            old_csv_paths (`List[str]`):
+                The CSVs the CDB was built from.
+            new_csv_paths (`List[str]`):
+                The CSVs the CDB should be updated to.
+            full_build (`bool`, defaults to `False`):
+                As in `prepare_csvs`, must be the same as for the build of the CDB.
+            n_process (`int`, defaults to 1):
+                Number of processes used by `nlp.pipe`.
+            batch_size (`int`, defaults to 1000):
+                Number of names in a batch for `nlp.pipe`.
+            sep, encoding, escapechar, index_col, **kwargs:
+                As in `prepare_csvs`.
+
+        Return:
+            `Dict`: What was changed - `added_rows`, `removed_rows`, `cuis` (number of concepts touched), `removed_cuis`
+            (number of concepts removed completely), `added_names`, `removed_names` and `took` (seconds).
+        '''
+        start = time.time()
+        read_kwargs = dict(sep=sep, encoding=encoding, escapechar=escapechar, index_col=index_col, **kwargs)
+        old = self._read_csvs(old_csv_paths, **read_kwargs)
+        new = self._read_csvs(new_csv_paths, **read_kwargs)
+        columns = [col for col in USEFUL_COLUMNS if col in old.columns or col in new.columns]
+        old = old.reindex(columns=columns, fill_value='')
+        new = new.reindex(columns=columns, fill_value='')
+
+        # Rows are compared by the hash of all their columns
+        old_hashes = pandas.util.hash_pandas_object(old, index=False)
+        new_hashes = pandas.util.hash_pandas_object(new, index=False)
+        old_cuis = old['cui'].str.strip().str.upper()
+        new_cuis = new['cui'].str.strip().str.upper()
+        removed = ~old_hashes.isin(new_hashes)
+        added = ~new_hashes.isin(old_hashes)
+        cuis = list(dict.fromkeys(list(old_cuis[removed]) + list(new_cuis[added])))
+
+        # All rows (also the unchanged ones) of the changed concepts
+        col2ind = {col: ind for ind, col in enumerate(columns)}
+        raw_name2names = {}
+        cui2old_rows = {}
+        for row in self._iter_rows(old[old_cuis.isin(cuis)], columns, col2ind, n_process, batch_size, raw_name2names):
+            cui2old_rows.setdefault(row.cui, []).append(row)
+        cui2new_rows = {}
+        for row in self._iter_rows(new[new_cuis.isin(cuis)], columns, col2ind, n_process, batch_size, raw_name2names):
+            cui2new_rows.setdefault(row.cui, []).append(row)
+
+        n_added_names = 0
+        n_removed_names = 0
+        for cui in cuis:
+            old_rows = cui2old_rows.get(cui, [])
+            new_rows = cui2new_rows.get(cui, [])
+            # Status of each name as add_concept would set it: from the first row, unless a later one has P
+            name2status = {}
+            for row in new_rows:
+                for name in row.names:
+                    if name not in name2status or row.name_status == 'P':
+                        name2status[name] = row.name_status
+            old_names = {name: name_info for row in old_rows for name, name_info in row.names.items()}
+            removed_names = {name: name_info for name, name_info in old_names.items() if name not in name2status}
+            # remove_names marks a name left with one concept for disambiguation, the statuses of the other concepts
+            #are restored as they come from their own rows
+            other_statuses = {name: {_cui: status for _cui, status in self.cdb.name2cuis2status.get(name, {}).items() if _cui != cui}
+                              for name in removed_names}
+            self.cdb.remove_names(cui, removed_names)
+            for name, statuses in other_statuses.items():
+                for _cui, status in statuses.items():
+                    self.cdb.name2cuis2status[name][_cui] = status
+            n_removed_names += len(removed_names)
+            n_added_names += len([name for name in name2status if name not in old_names])
+
+            self._remove_rows(cui, old_rows, full_build)
+            for row in new_rows:
+                self.cdb.add_concept(cui=cui, names=row.names, ontologies=row.ontologies, name_status=row.name_status,
+                                     type_ids=row.type_ids, description=row.description, full_build=full_build)
+            for name, name_status in name2status.items():
+                self.cdb.name2cuis2status[name][cui] = name_status
+            for name in removed_names:
+                if name not in self.cdb.name2cuis:
+                    self.cdb.name_isupper.pop(name, None)
+
+        # Concepts without rows in the new CSVs are removed completely, together with their training
+        removed_cuis = [cui for cui in cuis if cui not in self.cdb.cui2names]
+        for cui in removed_cuis:
+            self.cdb.cui2context_vectors.pop(cui, None)
+            self.cdb.cui2count_train.pop(cui, None)
+            self.cdb.cui2average_confidence.pop(cui, None)
+        if removed_cuis:
+            self.cdb.reset_concept_similarity()
+
+        report = {'added_rows': int(added.sum()), 'removed_rows': int(removed.sum()), 'cuis': len(cuis),
+                  'removed_cuis': len(removed_cuis), 'added_names': n_added_names, 'removed_names': n_removed_names,
+                  'took': time.time() - start}
+        self.log.info("Updated the CDB from {} to {}: {}".format(old_csv_paths, new_csv_paths, report))
+
+        return report
+
+    def _remove_rows(self, cui, rows, full_build):
+        # Undo what add_concept did for these rows of the concept, except for the linking (name2cuis) that is done by
+        #remove_names in update_from_csvs. Values that also came from elsewhere (e.g. training) can be removed too.
+        names = {name for row in rows for name in row.names}
+        snames = {sname for row in rows for name_info in row.names.values() for sname in name_info['snames']}
+        type_ids = {type_id for row in rows for type_id in row.type_ids}
+
+        for row in rows:
+            for name_info in row.names.values():
+                for token in name_info['tokens']:
+                    if token in self.cdb.vocab:
+                        self.cdb.vocab[token] -= 1
+                        if self.cdb.vocab[token] <= 0:
+                            del self.cdb.vocab[token]
+
+        if cui in self.cdb.cui2names:
+            self.cdb.cui2names[cui] -= names
+            self.cdb.cui2snames[cui] -= snames
+            self.cdb.cui2type_ids[cui] -= type_ids
+            if not self.cdb.cui2names[cui]:
+                del self.cdb.cui2names[cui]
+                del self.cdb.cui2snames[cui]
+                del self.cdb.cui2type_ids[cui]
+        if any(row.name_status == 'P' for row in rows):
+            self.cdb.cui2preferred_name.pop(cui, None)
+
+        if full_build:
+            addl_info = self.cdb.addl_info
+            for key, values in [('cui2ontologies', {ontology for row in rows for ontology in row.ontologies}),
+                                ('cui2original_names', {name_info['raw_name'] for row in rows for name_info in row.names.values()})]:
+                if cui in addl_info[key]:
+                    addl_info[key][cui] -= values
+                    if not addl_info[key][cui]:
+                        del addl_info[key][cui]
+            if any(row.description for row in rows):
+                addl_info['cui2description'].pop(cui, None)
+            for type_id in type_ids:
+                if type_id in addl_info['type_id2cuis']:
+                    addl_info['type_id2cuis'][type_id].discard(cui)
+                    if not addl_info['type_id2cuis'][type_id]:
+                        del addl_info['type_id2cuis'][type_id]
+
+    @staticmethod
+    def _read_csv(csv_path, **kwargs):
+        # Read CSV, everything is converted to strings
+        df = pandas.read_csv(csv_path, dtype=str, **kwargs)
+        df = df.fillna('')
+
+        # Find which columns to use from the CSV
+        cols = []
+        col2ind = {}
+        for col in list(df.columns):
+            if str(col).lower().strip() in USEFUL_COLUMNS:
+                col2ind[str(col).lower().strip()] = len(cols)
+                cols.append(col)
+
+        return df, cols, col2ind
+
+    @classmethod
+    def _read_csvs(cls, csv_paths, **kwargs):
+        # All rows in one frame with the columns named as in USEFUL_COLUMNS, the index is the position of the row in the CSVs
+        dfs = []
+        for csv_path in csv_paths:
+            df, cols, col2ind = cls._read_csv(csv_path, **kwargs)
+            dfs.append(pandas.DataFrame({col: df[cols[ind]] for col, ind in col2ind.items()}))
+        df = pandas.concat(dfs, ignore_index=True).fillna('')
+
+        return df[[col for col in USEFUL_COLUMNS if col in df.columns]]
+
+    def _prepare_csvs_sharded(self, csv_paths, n_shards, full_build, only_existing_cuis, batch_size, **kwargs):
+        df = self._read_csvs(csv_paths, **kwargs)
+        cuis = df['cui'].str.strip().str.upper()
+        if only_existing_cuis:
+            df = df[cuis.isin(self.cdb.cui2names)]
+            cuis = cuis[df.index]
+
+        # All rows of a CUI are in the same shard, so only names can be shared between shards
+        cui2shard = {cui: code % n_shards for cui, code in zip(cuis, pandas.factorize(cuis)[0])}
+        shard_ids = cuis.map(cui2shard)
+        self.log.info("Building {} rows from {} CSVs in {} shards".format(len(df), len(csv_paths), n_shards))
+        shards = Parallel(n_jobs=n_shards)(delayed(_build_shard)(self.config, df[shard_ids == shard_id], full_build, batch_size)
+                                           for shard_id in range(n_shards))
+
+        # Names added by more than one shard have to be put in the order of the rows
+        name2shards = {}
+        for shard_id, (_, _, last_rows) in enumerate(shards):
+            for name in last_rows:
+                name2shards.setdefault(name, []).append(shard_id)
+        shared_names = [name for name, shard_ids in name2shards.items() if len(shard_ids) > 1]
+        n_existing = {name: len(self.cdb.name2cuis.get(name, [])) for name in shared_names}
+
+        for shard_cdb, _, _ in shards:
+            self.cdb.merge_concepts(shard_cdb)
+
+        for name in shared_names:
+            cuis = self.cdb.name2cuis[name]
+            cuis[n_existing[name]:] = sorted(cuis[n_existing[name]:], key=lambda cui: shards[cui2shard[cui]][1][(name, cui)])
+            # The last row with the name sets name_isupper
+            self.cdb.name_isupper[name] = max(shards[shard_id][2][name] for shard_id in name2shards[name])[1]
+
+        return self.cdb
+
+    def _add_df_bulk(self, df, cols, col2ind, full_build, only_existing_cuis, n_process, batch_size, first_rows=None, last_rows=None):
+        # Same as the row by row loop in prepare_csvs, but every distinct raw name is processed once and the
+        #concepts are added in the order of the rows, so the CDB is the same. If set `first_rows` gets the first
+        #row of each (name, cui) and `last_rows` the last row of each name with its is_upper.
+        if only_existing_cuis:
+            df = df[df[cols[col2ind['cui']]].str.strip().str.upper().isin(self.cdb.cui2names)]
+
+        for row_id, cui, names, ontologies, name_status, type_ids, description in self._iter_rows(
+                df, cols, col2ind, n_process=n_process, batch_size=batch_size):
+            self.cdb.add_concept(cui=cui, names=names, ontologies=ontologies, name_status=name_status, type_ids=type_ids,
+                                 description=description, full_build=full_build)
+            if first_rows is not None:
+                for name, name_info in names.items():
+                    first_rows.setdefault((name, cui), row_id)
+                    last_rows[name] = (row_id, name_info['is_upper'])
+
+    def _iter_rows(self, df, cols, col2ind, n_process, batch_size, raw_name2names=None):
+        # Yields a ConceptRow for each row, the distinct raw names that are not in `raw_name2names` yet go through nlp.pipe first (and are added to it).
+        def column(name):
+            return df[cols[col2ind[name]]].str
+
+        cuis = column('cui').strip().str.upper()
+        if 'name_status' in col2ind:
+            name_statuses = column('name_status').strip().str.upper()
+            name_statuses = name_statuses.where(name_statuses.isin(['A', 'P', 'N']), 'A')
+        else:
+            name_statuses = pandas.Series('A', index=df.index)
+        sep = self.cnf_cm['multi_separator']
+        if 'ontologies' in col2ind:
+            ontologies = [{o.strip() for o in row.split(sep) if o.strip()} for row in column('ontologies').upper()]
+        else:
+            ontologies = [set() for _ in range(len(df))]
+        if 'type_ids' in col2ind:
+            type_ids = [{t.strip() for t in row.split(sep) if t.strip()} for row in column('type_ids').upper()]
+        else:
+            type_ids = [set() for _ in range(len(df))]
+        descriptions = column('description').strip() if 'description' in col2ind else pandas.Series('', index=df.index)
+
+        # The raw names of each row, with the version without the parenthesis for preferred names
+        remove_parenthesis = self.cnf_cm.get('remove_parenthesis', 0)
+        rows_raw_names = []
+        for raw_names, name_status in zip(df[cols[col2ind['name']]], name_statuses):
+            row_raw_names = []
+            for raw_name in raw_names.split(sep):
+                raw_name = raw_name.strip()
+                if raw_name:
+                    row_raw_names.append(raw_name)
+                    if remove_parenthesis > 0 and name_status == 'P':
+                        raw_name = PH_REMOVE.sub(" ", raw_name).strip()
+                        if len(raw_name) >= remove_parenthesis:
+                            row_raw_names.append(raw_name)
+            rows_raw_names.append(row_raw_names)
+
+        raw_name2names = raw_name2names if raw_name2names is not None else {}
+        unique_raw_names = [raw_name for raw_name in dict.fromkeys(raw_name for row_raw_names in rows_raw_names for raw_name in row_raw_names)
+                            if raw_name not in raw_name2names]
+        self.log.info("Processing {} distinct names from {} rows".format(len(unique_raw_names), len(df)))
+        docs = self.nlp.nlp.pipe(unique_raw_names, batch_size=batch_size, n_process=n_process)
+        for raw_name, doc in zip(unique_raw_names, docs):
+            raw_name2names[raw_name] = prepare_name_from_doc(doc, {}, self.config)
+
+        for row_id, cui, name_status, row_ontologies, row_type_ids, description, row_raw_names in zip(
+                df.index, cuis, name_statuses, ontologies, type_ids, descriptions, rows_raw_names):
+            # Merged in the order prepare_name would have added them, the first raw name giving a name is kept
+            names = {}
+            for raw_name in row_raw_names:
+                for name, name_info in raw_name2names[raw_name].items():
+                    if name not in names:
+                        names[name] = dict(name_info, snames=set(name_info['snames']))
+
+            yield ConceptRow(row_id, cui, names, row_ontologies, name_status, row_type_ids, description)
+
     def destroy_pipe(self):
         self.nlp.destroy()
+
+
+def _build_shard(config, df, full_build, batch_size):
+    # Runs in a worker process of CDBMaker.prepare_csvs(n_shards>1), df has the columns named as in USEFUL_COLUMNS
+    maker = CDBMaker(config)
+    first_rows = {}
+    last_rows = {}
+    cols = list(df.columns)
+    maker._add_df_bulk(df, cols, {col: ind for ind, col in enumerate(cols)}, full_build=full_build, only_existing_cuis=False,
+                       n_process=1, batch_size=batch_size, first_rows=first_rows, last_rows=last_rows)
+    maker.destroy_pipe()
+
+    return maker.cdb, first_rows, last_rows
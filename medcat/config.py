@@ -50,11 +50,18 @@ class Config(object):
                 'spacy_disabled_components': ['ner', 'parser', 'vectors', 'textcat', 
                                               'entity_linker', 'sentencizer', 'entity_ruler', 'merge_noun_chunks',
                                               'merge_entities', 'merge_subtokens'],
+                # Do not load the spacy_disabled_components at all (spacy.load(exclude=...)), MedCAT never runs them
+                #and reading e.g. the parser weights is a large part of the start up time. If False they are loaded but disabled.
+                'spacy_exclude_disabled': True,
                 # What model will be used for tokenization
                 'spacy_model': 'en_core_sci_md',
                 # Separator that will be used to merge tokens of a name. Once a CDB is built this should
                 #always stay the same.
                 'separator': '~',
+                # Keep the name maps of the CDB (name2cuis, name2cuis2status, snames, cui2names, cui2snames) as interned strings
+                #and CSR arrays (medcat.utils.name_maps) instead of dictionaries. Uses a fraction of the memory, but lookups are
+                #slower and the maps are moved back into dictionaries when the CDB is edited.
+                'compact_name_maps': False,
                 # Should we check spelling - note that this makes things much slower, use only if necessary. The only thing necessary
                 #for the spell checker to work is vocab.dat and cdb.dat built with concepts in the respective language.
                 'spell_check': True,
@@ -63,6 +70,14 @@ class Config(object):
                 'spell_check_deep': False,
                 # Spelling will not be checked for words with length less than this
                 'spell_check_len_limit': 7,
+                # Find spelling candidates with a symmetric delete index over cdb.vocab instead of generating all
+                #edits of a word. The index is built on first use and stored in cdb.addl_info['spell_index'], so it is saved with the CDB.
+                'spell_check_index': False,
+                # Maximum number of misspelled words for which the correction is cached
+                'spell_check_cache_size': 100000,
+                # If set the spell cache is loaded from this file when the pipeline is created, it can be saved with
+                #TokenNormalizer.save_spell_cache (e.g. next to the model) so that other processes start with it.
+                'spell_check_cache_path': None,
                 # If set to True functions like get_entities and get_json will return nested_entities and overlaps
                 'show_nested_entities': False,
                 # When unlinking a name from a concept should we do full_unlink (means unlink a name from all concepts, not just the one in question)
@@ -71,6 +86,12 @@ class Config(object):
                 'check_upper_case_names': False,
                 # Number of workers used by a parallelizable pipeline component
                 'workers': workers(),
+                # Before starting worker processes (multiprocessing and get_entities with n_process) move the context vectors
+                #and word vectors into shared memory and freeze the garbage collector, so that the workers do not each get a
+                #copy of the CDB and Vocab. Works only when workers are started with `fork` (the default on Linux). Context vectors
+                #kept in a dictionary (linking.context_vector_store = 'dict') are moved into the matrix store, for the rest of the
+                #session only, the config is not changed.
+                'share_memory': False,
                 }
 
         self.preprocessing = {
@@ -88,6 +109,8 @@ class Config(object):
                 'max_document_length': 1000000,
                 # Should specific word types be normalized: e.g. running -> run
                 'do_not_normalize': {'VBD', 'VBG', 'VBN', 'VBP', 'JJS', 'JJR'},
+                # Cache the punct/skip tags of each word (spacy lexeme), so the regexes run once per word and not once per token
+                'cache_token_tags': True,
                 }
 
         self.ner = {
@@ -101,6 +124,11 @@ class Config(object):
                 'upper_case_limit_len': 3,
                 # Try reverse word order for short concepts (2 words max), e.g. heart disease -> disease heart
                 'try_reverse_word_order': False,
+                # Candidate detection engine, 'vocab' probes cdb.snames with strings token by token, 'trie' compiles
+                #cdb.snames into a token trie once and walks it (much faster on large CDBs, same output). The trie
+                #shares the strings of cdb.snames, but takes about 250 bytes per sname for its nodes (about twice the
+                #memory of cdb.snames as a set, e.g. 50MB for 220k snames).
+                'engine': 'vocab',
                 }
 
         self.linking = {
@@ -145,8 +173,19 @@ class Config(object):
                 # When adding a positive example, should it also be treated as Negative for concepts
                 #which link to the postive one via names (ambigous names).
                 'devalue_linked_concepts': False,
+                # Parallel unsupervised training (CAT.train with nproc > 1): workers collect the training examples of documents
+                #and the main process applies them to the CDB in the input order. This is the maximum number of documents the workers
+                #can process ahead of the updates applied to the CDB, it limits the memory used by updates waiting to be applied.
+                'train_update_staleness': 1000,
                 # If true when the context of a concept is calculated (embedding) the words making that concept are not taken into accout
                 'context_ignore_center_tokens': False,
+                # How are cdb.cui2context_vectors stored, 'dict' is a dictionary of numpy arrays, 'matrix' keeps one float32 matrix
+                #per context type so that all candidates of an entity are scored with one matrix product.
+                'context_vector_store': 'dict',
+                # Index used by cdb.most_similar: 'exact' compares a concept with all others, 'ivf' clusters the concepts into n_lists
+                #lists (None is the square root of the number of concepts) and compares only with the concepts in the n_probe closest
+                #lists - approximate, but much faster for large CDBs.
+                'similarity_index': {'type': 'exact', 'n_lists': None, 'n_probe': 8},
                 # Filters
                 'filters': {
                     'cuis': set(), # CUIs in this filter will be included, everything else excluded, must be a set, if empty all cuis will be included
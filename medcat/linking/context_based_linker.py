@@ -25,19 +25,49 @@ class Linker(PipeRunner):
         self.context_model = ContextModel(self.cdb, self.vocab, self.config)
         # Counter for how often did a pair (name,cui) appear and was used during training
         self.train_counter = {}
+        # If a list, training examples are collected into it instead of being applied to the CDB (used by the
+        #workers of parallel training, the examples are applied with `apply_train_update` by the aggregator)
+        self.train_updates = None
         super().__init__(self.config.general['workers'])
 
-    def _train(self, cui, entity, doc, add_negative=True):
-        name = "{} - {}".format(entity._.detected_name, cui)
+    def _subsample(self, name):
+        # Should an example for the pair (name,cui) be used, pairs seen more than subsample_after times are subsampled
         if self.train_counter.get(name, 0) > self.config.linking['subsample_after']:
-            if random.random() < 1 / (self.train_counter.get(name) - self.config.linking['subsample_after']):
-                self.context_model.train(cui, entity, doc, negative=False)
-                if add_negative and self.config.linking['negative_probability'] >= random.random():
-                    self.context_model.train_using_negative_sampling(cui)
-                self.train_counter[name] = self.train_counter.get(name, 0) + 1
-        else:
-            # Always train
-            self.context_model.train(cui, entity, doc, negative=False)
+            return random.random() < 1 / (self.train_counter.get(name) - self.config.linking['subsample_after'])
+        return True
+
+    def _train(self, cui, entity, doc, add_negative=True, vectors=None):
+        if self.train_updates is not None:
+            # Negative sampling and subsampling are left to the aggregator, as the example may not be used
+            if vectors is None:
+                vectors = self.context_model.get_context_vectors(entity, doc)
+            self.train_updates.append((cui, entity._.detected_name, vectors, add_negative))
+            return
+
+        name = "{} - {}".format(entity._.detected_name, cui)
+        if self._subsample(name):
+            self.context_model.train(cui, entity, doc, negative=False, vectors=vectors)
+            if add_negative and self.config.linking['negative_probability'] >= random.random():
+                self.context_model.train_using_negative_sampling(cui)
+            self.train_counter[name] = self.train_counter.get(name, 0) + 1
+
+    def apply_train_update(self, cui, detected_name, vectors, add_negative=True):
+        r''' Apply a training example collected in `train_updates` to the CDB, the same way
+        as `_train` does it during training in a single process.
+
+        Args:
+            cui (str):
+                The concept that was linked.
+            detected_name (str):
+                The name that was detected for the entity.
+            vectors (Dict[str, np.array]):
+                Context vectors of the entity.
+            add_negative (bool):
+                Can a negative example be added for this concept.
+        '''
+        name = "{} - {}".format(detected_name, cui)
+        if self._subsample(name):
+            self.context_model.train_vectors(cui, vectors, negative=False, detected_name=detected_name)
             if add_negative and self.config.linking['negative_probability'] >= random.random():
                 self.context_model.train_using_negative_sampling(cui)
             self.train_counter[name] = self.train_counter.get(name, 0) + 1
@@ -51,9 +81,12 @@ class Linker(PipeRunner):
         doc_tkns = [tkn for tkn in doc if not tkn._.to_skip]
         doc_tkn_ids = [tkn.idx for tkn in doc_tkns]
 
+        # Context vectors for all entities, calculated in one pass over the document
+        ent_vectors = self.context_model.get_doc_context_vectors(doc._.ents, doc)
+
         if cnf_l['train']:
             # Run training
-            for entity in doc._.ents:
+            for entity, vectors in zip(doc._.ents, ent_vectors):
                 # Check does it have a detected name
                 if entity._.detected_name is not None:
                     name = entity._.detected_name
@@ -64,21 +97,21 @@ class Linker(PipeRunner):
                             # N - means name must be disambiguated, is not the prefered
                             #name of the concept, links to other concepts also.
                             if self.cdb.name2cuis2status[name][cuis[0]] != 'N':
-                                self._train(cui=cuis[0], entity=entity, doc=doc)
+                                self._train(cui=cuis[0], entity=entity, doc=doc, vectors=vectors)
                                 entity._.cui = cuis[0]
                                 entity._.context_similarity = 1
                                 linked_entities.append(entity)
                         else:
                             for cui in cuis:
                                 if self.cdb.name2cuis2status[name][cui] in {'P', 'PD'}:
-                                    self._train(cui=cui, entity=entity, doc=doc)
+                                    self._train(cui=cui, entity=entity, doc=doc, vectors=vectors)
                                     # It should not be possible that one name is 'P' for two CUIs,
                                     #but it can happen - and we do not care.
                                     entity._.cui = cui
                                     entity._.context_similarity = 1
                                     linked_entities.append(entity)
         else:
-            for entity in doc._.ents:
+            for entity, vectors in zip(doc._.ents, ent_vectors):
                 self.log.debug("Linker started with entity: {}".format(entity))
                 # Check does it have a detected name
                 if entity._.link_candidates is not None:
@@ -97,16 +130,16 @@ class Linker(PipeRunner):
                                 do_disambiguate = True
 
                             if do_disambiguate:
-                                cui, context_similarity = self.context_model.disambiguate(cuis, entity, name, doc)
+                                cui, context_similarity = self.context_model.disambiguate(cuis, entity, name, doc, vectors=vectors)
                             else:
                                 cui = cuis[0]
                                 if self.config.linking['always_calculate_similarity']:
-                                    context_similarity = self.context_model.similarity(cui, entity, doc)
+                                    context_similarity = self.context_model.similarity(cui, entity, doc, vectors=vectors)
                                 else:
                                     context_similarity = 1 # Direct link, no care for similarity
                     else:
                         # No name detected, just disambiguate
-                        cui, context_similarity = self.context_model.disambiguate(entity._.link_candidates, entity, 'unk-unk', doc)
+                        cui, context_similarity = self.context_model.disambiguate(entity._.link_candidates, entity, 'unk-unk', doc, vectors=vectors)
 
                     # Add the annotation if it exists and if above threshold and in filters
                     if cui and check_filters(cui, self.config.linking['filters']):
@@ -2,6 +2,7 @@ import numpy as np
 import logging
 from medcat.utils.matutils import unitvec
 from medcat.utils.filters import check_filters
+from medcat.utils.context_vectors import ContextVectorStore
 import spacy
 
 class ContextModel(object):
@@ -57,16 +58,16 @@ class ContextModel(object):
 
             values = []
             # Add left
-            values.extend([self.config.linking['weighted_average_function'](step) * self.vocab.vec(tkn.lower_)
-                           for step, tkn in enumerate(tokens_left) if tkn.lower_ in self.vocab and self.vocab.vec(tkn.lower_) is not None])
+            values.extend([self.config.linking['weighted_average_function'](step) * vec
+                           for step, vec in enumerate(map(self._token_vec, tokens_left)) if vec is not None])
 
             if self.config.linking.get('context_ignore_center_tokens', False):
                 # Add center
-                values.extend([self.vocab.vec(tkn.lower_) for tkn in tokens_center if tkn.lower_ in self.vocab and self.vocab.vec(tkn.lower_) is not None])
+                values.extend([vec for vec in map(self._token_vec, tokens_center) if vec is not None])
 
             # Add right
-            values.extend([self.config.linking['weighted_average_function'](step) * self.vocab.vec(tkn.lower_)
-                           for step, tkn in enumerate(tokens_right) if tkn.lower_ in self.vocab and self.vocab.vec(tkn.lower_) is not None])
+            values.extend([self.config.linking['weighted_average_function'](step) * vec
+                           for step, vec in enumerate(map(self._token_vec, tokens_right)) if vec is not None])
 
             if len(values) > 0:
                 value = np.average(values, axis=0)
@@ -74,7 +75,119 @@ class ContextModel(object):
 
         return vectors
 
-    def similarity(self, cui, entity, doc):
+    def _token_vec(self, tkn):
+        # Word vectors are stored as float32, contexts are calculated in float64
+        vec = self.vocab.vec(tkn.lower_) if tkn.lower_ in self.vocab else None
+        return np.asarray(vec, dtype=np.float64) if vec is not None else None
+
+    def _get_doc_embeddings(self, doc):
+        r''' Look up the embedding of each token in the document once.
+
+        Args:
+            doc
+
+        Return:
+            embeddings (`np.array`):
+                Matrix with one row per token, rows of tokens without a vector are zeros.
+            has_vector (`np.array`):
+                True for tokens that have a vector.
+            is_context (`np.array`):
+                True for tokens that can be used as context (see `get_context_tokens`).
+        '''
+        vecs = []
+        for tkn in doc:
+            vec = self.vocab.vec(tkn.lower_) if tkn.lower_ in self.vocab else None
+            vecs.append(vec)
+
+        has_vector = np.array([vec is not None for vec in vecs], dtype=bool)
+        is_context = np.array([not tkn._.to_skip and not tkn.is_stop and not tkn.is_digit and not tkn.is_punct for tkn in doc], dtype=bool)
+        if has_vector.any():
+            dim = len(vecs[int(np.argmax(has_vector))])
+            embeddings = np.zeros((len(vecs), dim))
+            for ind in np.flatnonzero(has_vector):
+                embeddings[ind] = vecs[ind]
+        else:
+            embeddings = np.zeros((len(vecs), 0))
+
+        return embeddings, has_vector, is_context
+
+    def get_doc_context_vectors(self, entities, doc):
+        r''' Same as calling `get_context_vectors` for each of the entities, but token vectors are
+        looked up only once per document and the windows for all context types are taken from
+        cumulative weighted sums over the largest window.
+
+        Args:
+            entities (`List[spacy.tokens.Span]`):
+                Entities (or lists of tokens) from `doc`.
+            doc
+
+        Return:
+            vectors (`List[Dict[str, np.array]]`):
+                Context vectors for each entity, in the same order as `entities`.
+        '''
+        sizes = self.config.linking['context_vector_sizes']
+        if not entities:
+            return []
+        embeddings, has_vector, is_context = self._get_doc_embeddings(doc)
+        if not has_vector.any():
+            return [{} for _ in entities]
+
+        max_size = max(sizes.values())
+        weights = np.array([self.config.linking['weighted_average_function'](step) for step in range(max_size)])
+        add_center = self.config.linking.get('context_ignore_center_tokens', False)
+
+        # Only tokens that can be context, in document order
+        context_inds = np.flatnonzero(is_context)
+        context_embeddings = embeddings[context_inds]
+        context_has_vector = has_vector[context_inds].astype(np.int64)
+
+        all_vectors = []
+        for entity in entities:
+            start_ind = entity[0].i
+            end_ind = entity[-1].i
+
+            # Left tokens, closest to the center first
+            left_end = np.searchsorted(context_inds, start_ind)
+            left_start = np.searchsorted(context_inds, start_ind - max_size)
+            left = np.arange(left_end - 1, left_start - 1, -1)
+            left_sums = np.cumsum(weights[:left_end - left_start, None] * context_embeddings[left], axis=0)
+            left_cnts = np.cumsum(context_has_vector[left])
+
+            # Right tokens
+            right_start = np.searchsorted(context_inds, end_ind + 1)
+            right_end = np.searchsorted(context_inds, end_ind + 1 + max_size)
+            right_sums = np.cumsum(weights[:right_end - right_start, None] * context_embeddings[right_start:right_end], axis=0)
+            right_cnts = np.cumsum(context_has_vector[right_start:right_end])
+
+            if add_center:
+                center_inds = [tkn.i for tkn in entity]
+                center_sum = embeddings[center_inds].sum(axis=0)
+                center_cnt = int(has_vector[center_inds].sum())
+            else:
+                center_sum = 0
+                center_cnt = 0
+
+            vectors = {}
+            for context_type, size in sizes.items():
+                n_left = left_end - np.searchsorted(context_inds, start_ind - size)
+                n_right = np.searchsorted(context_inds, end_ind + 1 + size) - right_start
+
+                total = center_sum
+                cnt = center_cnt
+                if n_left > 0:
+                    total = total + left_sums[n_left - 1]
+                    cnt += left_cnts[n_left - 1]
+                if n_right > 0:
+                    total = total + right_sums[n_right - 1]
+                    cnt += right_cnts[n_right - 1]
+
+                if cnt > 0:
+                    vectors[context_type] = total / cnt
+            all_vectors.append(vectors)
+
+        return all_vectors
+
+    def similarity(self, cui, entity, doc, vectors=None):
         r''' Calculate the similarity between the learnt context for this CUI and the context
         in the given `doc`.
 
@@ -82,8 +195,11 @@ class ContextModel(object):
             cui
             entity
             doc
+            vectors (`Dict[str, np.array]`, optional):
+                Context vectors of the entity if they were already calculated.
         '''
-        vectors = self.get_context_vectors(entity, doc)
+        if vectors is None:
+            vectors = self.get_context_vectors(entity, doc)
         sim = self._similarity(cui, vectors)
 
         return sim
@@ -115,8 +231,27 @@ class ContextModel(object):
         else:
             return -1
 
-    def disambiguate(self, cuis, entity, name, doc):
-        vectors = self.get_context_vectors(entity, doc)
+    def _similarities(self, cuis, vectors):
+        r''' Calculate similarities for a list of cuis, the same as calling `_similarity` for each
+        cui, but if the CDB uses a `ContextVectorStore` all cuis are scored at once.
+
+        Args:
+            cuis
+            vectors
+        '''
+        cui2context_vectors = self.cdb.cui2context_vectors
+        if not isinstance(cui2context_vectors, ContextVectorStore):
+            return [self._similarity(cui, vectors) for cui in cuis]
+
+        similarities, has_vectors = cui2context_vectors.similarities(cuis, vectors, self.config.linking['context_vector_weights'])
+        counts = np.array([self.cdb.cui2count_train.get(cui, 0) for cui in cuis])
+        is_trained = has_vectors & (counts >= self.config.linking['train_count_threshold'])
+
+        return np.where(is_trained, similarities, -1).tolist()
+
+    def disambiguate(self, cuis, entity, name, doc, vectors=None):
+        if vectors is None:
+            vectors = self.get_context_vectors(entity, doc)
         filters = self.config.linking['filters']
 
         # If it is trainer we want to filter concepts before disambiguation
@@ -132,7 +267,7 @@ class ContextModel(object):
 
         if cuis: #Maybe none are left after filtering
             # Calculate similarity for each cui
-            similarities = [self._similarity(cui, vectors) for cui in cuis]
+            similarities = self._similarities(cuis, vectors)
             # DEBUG
             self.log.debug("Similarities: {}".format([(sim, cui) for sim,cui in zip(cuis, similarities)]))
 
@@ -162,58 +297,80 @@ class ContextModel(object):
             return None, 0
 
 
-    def train(self, cui, entity, doc, negative=False, names=[]):
+    def train(self, cui, entity, doc, negative=False, names=[], vectors=None):
         r''' Update the context representation for this CUI, given it's correct location (entity)
         in a document (doc).
 
         Args:
             names (List[str]/Dict):
                 Optionally used to update the `status` of a name-cui pair in the CDB.
+            vectors (Dict[str, np.array], optional):
+                Context vectors of the entity if they were already calculated.
         '''
         # Context vectors to be calculated
         if len(entity) > 0: # Make sure there is something
-            vectors = self.get_context_vectors(entity, doc)
-            self.cdb.update_context_vector(cui=cui, vectors=vectors, negative=negative)
-            # Debug
-            self.log.debug("Updating CUI: {} with negative={}".format(cui, negative))
-
-            if not negative:
-                # Update the name count, if possible
-                if type(entity) == spacy.tokens.span.Span:
-                    self.cdb.name2count_train[entity._.detected_name] = self.cdb.name2count_train.get(entity._.detected_name, 0) + 1
-
-                if self.config.linking.get('calculate_dynamic_threshold', False):
-                    # Update average confidence for this CUI
-                    sim = self.similarity(cui, entity, doc)
-                    self.cdb.update_cui2average_confidence(cui=cui, new_sim=sim)
-
-            if negative:
-                # Change the status of the name so that it has to be disambiguated always
-                for name in names:
-                    if self.cdb.name2cuis2status.get(name, {}).get(cui, '') == 'P':
-                        # Set this name to always be disambiguated, even though it is primary
-                        self.cdb.name2cuis2status.get(name, {})[cui] = 'PD'
-                        # Debug
-                        self.log.debug("Updating status for CUI: {}, name: {} to <PD>".format(cui, name))
-                    elif self.cdb.name2cuis2status.get(name, {}).get(cui, '') == 'A':
-                        # Set this name to always be disambiguated instead of A
-                        self.cdb.name2cuis2status.get(name, {})[cui] = 'N'
-                        self.log.debug("Updating status for CUI: {}, name: {} to <N>".format(cui, name))
-            if not negative and self.config.linking.get('devalue_linked_concepts', False):
-                #Find what other concepts can be disambiguated against this one
-                _cuis = set()
-                for name in self.cdb.cui2names[cui]:
-                    _cuis.update(self.cdb.name2cuis.get(name, []))
-                # Remove the cui of the current concept
-                _cuis = _cuis - {cui}
-
-                for _cui in _cuis:
-                    self.cdb.update_context_vector(cui=_cui, vectors=vectors, negative=True)
-
-                self.log.debug("Devalued via names.\n\tBase cui: {} \n\tTo be devalued: {}\n".format(cui, _cuis))
+            if vectors is None:
+                vectors = self.get_context_vectors(entity, doc)
+            detected_name = entity._.detected_name if type(entity) == spacy.tokens.span.Span else None
+            self.train_vectors(cui, vectors, negative=negative, names=names, detected_name=detected_name)
         else:
             self.log.warning("The provided entity for cui <{}> was empty, nothing to train".format(cui))
 
+    def train_vectors(self, cui, vectors, negative=False, names=[], detected_name=None):
+        r''' Same as `train`, but with the context vectors of the entity already calculated. Used to apply
+        the updates collected by the workers of parallel training.
+
+        Args:
+            cui (str):
+                The concept to be updated.
+            vectors (Dict[str, np.array]):
+                Context vectors of the entity.
+            negative (bool):
+                Is this a negative example.
+            names (List[str]/Dict):
+                Optionally used to update the `status` of a name-cui pair in the CDB.
+            detected_name (str, optional):
+                The name that was detected for the entity, used to update the name count.
+        '''
+        self.cdb.update_context_vector(cui=cui, vectors=vectors, negative=negative)
+        # Debug
+        self.log.debug("Updating CUI: {} with negative={}".format(cui, negative))
+
+        if not negative:
+            # Update the name count, if possible
+            if detected_name is not None:
+                self.cdb.name2count_train[detected_name] = self.cdb.name2count_train.get(detected_name, 0) + 1
+
+            if self.config.linking.get('calculate_dynamic_threshold', False):
+                # Update average confidence for this CUI
+                sim = self._similarity(cui, vectors)
+                self.cdb.update_cui2average_confidence(cui=cui, new_sim=sim)
+
+        if negative:
+            # Change the status of the name so that it has to be disambiguated always
+            for name in names:
+                if self.cdb.name2cuis2status.get(name, {}).get(cui, '') == 'P':
+                    # Set this name to always be disambiguated, even though it is primary
+                    self.cdb.name2cuis2status.get(name, {})[cui] = 'PD'
+                    # Debug
+                    self.log.debug("Updating status for CUI: {}, name: {} to <PD>".format(cui, name))
+                elif self.cdb.name2cuis2status.get(name, {}).get(cui, '') == 'A':
+                    # Set this name to always be disambiguated instead of A
+                    self.cdb.name2cuis2status.get(name, {})[cui] = 'N'
+                    self.log.debug("Updating status for CUI: {}, name: {} to <N>".format(cui, name))
+        if not negative and self.config.linking.get('devalue_linked_concepts', False):
+            #Find what other concepts can be disambiguated against this one
+            _cuis = set()
+            for name in self.cdb.cui2names[cui]:
+                _cuis.update(self.cdb.name2cuis.get(name, []))
+            # Remove the cui of the current concept
+            _cuis = _cuis - {cui}
+
+            for _cui in _cuis:
+                self.cdb.update_context_vector(cui=_cui, vectors=vectors, negative=True)
+
+            self.log.debug("Devalued via names.\n\tBase cui: {} \n\tTo be devalued: {}\n".format(cui, _cuis))
+
 
     def train_using_negative_sampling(self, cui):
         vectors = {}
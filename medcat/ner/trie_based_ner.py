@@ -0,0 +1,163 @@
+import logging
+from medcat.ner.vocab_based_annotator import maybe_annotate_name
+from medcat.ner.vocab_based_ner import NER
+
+
+class _TrieNode(object):
+    r''' One node of the sub-name trie, the path from the root to a node spells
+    a sub-name (tokens joined by the separator). Only nodes of snames have a `name`
+    (the string from `cdb.snames`) and only nodes with children have a `children` dict.
+    '''
+    __slots__ = ('children', 'name', 'is_sname')
+
+    def __init__(self):
+        self.children = None
+        self.name = None
+        self.is_sname = False
+
+
+class SnamesTrie(object):
+    r''' Token level trie compiled from `cdb.snames`. Each sname is split on the
+    separator and every token becomes one edge, so extending a candidate name by
+    a token is a single dict lookup instead of building and hashing a new string.
+
+    The trie keeps a reference to each sname instead of a copy and builds no other
+    strings, it takes about as much memory as one small object per sname plus one
+    dict per sname that is a prefix of another sname.
+
+    Args:
+        snames (`Set[str]`):
+            All possible subnames for all concepts, usually `cdb.snames`.
+        separator (`str`):
+            Separator used to merge tokens of a name.
+    '''
+    def __init__(self, snames, separator):
+        self.separator = separator
+        self.root = _TrieNode()
+        self.root.name = ""
+        for sname in snames:
+            node = self.root
+            for token in sname.split(separator):
+                if node.children is None:
+                    node.children = {}
+                child = node.children.get(token)
+                if child is None:
+                    child = _TrieNode()
+                    node.children[token] = child
+                node = child
+            node.name = sname
+            node.is_sname = True
+
+    def get_child(self, node, token):
+        r''' Return the node for `node.name + separator + token` (or just `token` when
+        `node` is the root) if that string is a sname, otherwise None.
+        '''
+        if token is None:
+            return None
+        if self.separator in token:
+            # A token that contains the separator spans multiple levels of the trie
+            for part in token.split(self.separator):
+                if node.children is None:
+                    return None
+                node = node.children.get(part)
+                if node is None:
+                    return None
+        elif node.children is None:
+            return None
+        else:
+            node = node.children.get(token)
+
+        if node is not None and node.is_sname:
+            return node
+        return None
+
+
+class TrieNER(NER):
+    r''' Drop-in replacement for `medcat.ner.vocab_based_ner.NER` that walks a token
+    trie compiled from `cdb.snames` instead of concatenating and probing strings. It
+    detects exactly the same entities, select it with `config.ner['engine'] = 'trie'`.
+
+    The trie is compiled on first use and recompiled whenever `cdb.snames` changes.
+    '''
+    log = logging.getLogger(__name__)
+
+    def __init__(self, cdb, config):
+        super().__init__(cdb, config)
+        self._trie = None
+        self._snames = None
+        self._n_snames = -1
+
+    def get_trie(self):
+        r''' Returns the trie for the current `cdb.snames`, building it if necessary.
+        '''
+        if self._trie is None or self._snames is not self.cdb.snames or self._n_snames != len(self.cdb.snames) or \
+                self._trie.separator != self.config.general['separator']:
+            self.log.debug("Compiling the snames trie for {} snames".format(len(self.cdb.snames)))
+            self._snames = self.cdb.snames
+            self._n_snames = len(self.cdb.snames)
+            self._trie = SnamesTrie(self.cdb.snames, self.config.general['separator'])
+        return self._trie
+
+    def __call__(self, doc):
+        r''' Detect candidates for concepts - linker will then be able to do the rest. It adds `entities` to the
+        doc._.ents and each entity can have the entitiy._.link_candidates - that the linker will resolve.
+
+        Args:
+            doc (`spacy.tokens.Doc`):
+                Spacy document to be annotated with named entities.
+        Return
+            doc (`spacy.tokens.Doc`):
+                Spacy document with detected entities.
+        '''
+        trie = self.get_trie()
+        root = trie.root
+        separator = self.config.general['separator']
+        max_skip_tokens = self.config.ner['max_skip_tokens']
+        try_reverse_word_order = self.config.ner.get('try_reverse_word_order', False)
+        name2cuis = self.cdb.name2cuis
+        snames = self.cdb.snames
+
+        # Just take the tokens we need
+        _doc = [tkn for tkn in doc if not tkn._.to_skip]
+        for i in range(len(_doc)):
+            tkn = _doc[i]
+            tkns = [tkn]
+
+            node = trie.get_child(root, tkn._.norm) or trie.get_child(root, tkn.lower_)
+            if node is not None and node.name in name2cuis and not tkn.is_stop:
+                maybe_annotate_name(node.name, tkns, doc, self.cdb, self.config)
+
+            if node is None or not node.name:
+                # There has to be at least something appended to the name to go forward
+                continue
+
+            for j in range(i+1, len(_doc)):
+                if _doc[j].i - _doc[j-1].i - 1 > max_skip_tokens:
+                    # Do not allow to skip more than limit
+                    break
+                tkn = _doc[j]
+                tkns.append(tkn)
+
+                child = None
+                name_reverse = None
+                for name_version in (tkn._.norm, tkn.lower_):
+                    child = trie.get_child(node, name_version)
+                    if child is not None:
+                        break
+
+                    if try_reverse_word_order and name_version is not None:
+                        _name_reverse = name_version + separator + node.name
+                        if _name_reverse in snames:
+                            name_reverse = _name_reverse
+
+                if child is not None:
+                    node = child
+                    if node.name in name2cuis:
+                        maybe_annotate_name(node.name, tkns, doc, self.cdb, self.config)
+                elif name_reverse is not None:
+                    if name_reverse in name2cuis:
+                        maybe_annotate_name(name_reverse, tkns, doc, self.cdb, self.config)
+                else:
+                    break
+
+        return doc
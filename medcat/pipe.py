@@ -8,16 +8,50 @@ from spacy.language import Language
 from spacy.util import raise_error
 from tqdm.autonotebook import tqdm
 from medcat.linking.context_based_linker import Linker
-from medcat.meta_cat import MetaCAT
 from medcat.ner.vocab_based_ner import NER
 from medcat.utils.normalizers import TokenNormalizer, BasicSpellChecker
 from medcat.utils.loggers import add_handlers
 from medcat.config import Config
 from medcat.pipeline.pipe_runner import PipeRunner
 from medcat.preprocessing.taggers import tag_skip_and_punct
-from typing import List, Optional, Union, Iterable, Callable, Generator
+from typing import List, Optional, Union, Iterable, Callable, Generator, TYPE_CHECKING
 from multiprocessing import cpu_count
 
+if TYPE_CHECKING:
+    # Only for the type hints, importing MetaCAT imports torch
+    from medcat.meta_cat import MetaCAT
+
+
+class _TextWithId(str):
+    # A text that remembers the position of its document in the input of `Pipe.batch_multi_process`,
+    #it survives the trip to the spaCy worker processes (pickle) and is read by `_IdTokenizer`.
+    def __new__(cls, text, id):
+        obj = super().__new__(cls, text)
+        obj.id = id
+        return obj
+
+    def __reduce__(self):
+        return (_TextWithId, (str(self), self.id))
+
+
+class _IdTokenizer(object):
+    # Wraps the tokenizer and sets `doc._.id` for texts that carry an id
+    def __init__(self, tokenizer):
+        self.tokenizer = tokenizer
+
+    def __call__(self, text):
+        if isinstance(text, _TextWithId):
+            doc = self.tokenizer(str(text))
+            doc._.id = text.id
+            return doc
+        return self.tokenizer(text)
+
+    def __getattr__(self, name):
+        # Not set yet while unpickling
+        if name == 'tokenizer':
+            raise AttributeError(name)
+        return getattr(self.tokenizer, name)
+
 
 class Pipe(object):
     r''' A wrapper around the standard spacy pipeline.
@@ -36,11 +70,17 @@ class Pipe(object):
     # Add file and console handlers
     log = add_handlers(log)
     def __init__(self, tokenizer: Tokenizer, config: Config):
-        self.nlp = spacy.load(config.general['spacy_model'], disable=config.general['spacy_disabled_components'])
+        if config.general.get('spacy_exclude_disabled', True):
+            self.nlp = spacy.load(config.general['spacy_model'], exclude=config.general['spacy_disabled_components'])
+        else:
+            self.nlp = spacy.load(config.general['spacy_model'], disable=config.general['spacy_disabled_components'])
         if config.preprocessing['stopwords'] is not None:
             self.nlp.Defaults.stop_words = set(config.preprocessing['stopwords'])
-        self.nlp.tokenizer = tokenizer(self.nlp)
+        self.nlp.tokenizer = _IdTokenizer(tokenizer(self.nlp))
         self.config = config
+        # Used to keep documents aligned with the input in batch_multi_process
+        Doc.set_extension('id', default=None, force=True)
+        Doc.set_extension('failed', default=False, force=True)
         # Set log level
         self.log.setLevel(self.config.general['log_level'])
 
@@ -69,7 +109,7 @@ class Pipe(object):
             Token.set_extension(field, default=False, force=True)
 
     def add_token_normalizer(self, config: Config, name: Optional[str] = None, spell_checker: Optional[BasicSpellChecker] = None) -> None:
-        token_normalizer = TokenNormalizer(config=config, spell_checker=spell_checker)
+        token_normalizer = TokenNormalizer(config=config, spell_checker=spell_checker, nlp=self.nlp)
         component_name = spacy.util.get_object_name(token_normalizer)
         name = name if name is not None else component_name
         Language.component(name=component_name, func=token_normalizer)
@@ -113,7 +153,7 @@ class Pipe(object):
         Span.set_extension('context_similarity', default=-1, force=True)
 
 
-    def add_meta_cat(self, meta_cat: MetaCAT, name: Optional[str] = None) -> None:
+    def add_meta_cat(self, meta_cat: 'MetaCAT', name: Optional[str] = None) -> None:
         component_name = spacy.util.get_object_name(meta_cat)
         name = name if name is not None else component_name
         Language.component(name=component_name, func=meta_cat)
@@ -143,7 +183,12 @@ class Pipe(object):
 
         Return:
             Generator[Doc]:
-                The output sequence of spacy documents with the extracted entities
+                The output sequence of spacy documents with the extracted entities. `doc._.id` is the position
+                of the text in `texts` and `doc._.failed` is True if a pipeline component failed on the document.
+                Documents dropped by a component that is not part of MedCAT will be missing from the output.
+                `doc._.ents` of the output is packed by `PipeRunner.serialize_entities` into a dictionary of arrays
+                (it used to be a list of dictionaries, one per entity), `PipeRunner.deserialize_entities` turns it
+                back into a list of spans. The packing component is only in the pipeline while the texts are processed.
         '''
         instance_name = "ensure_serializable"
         try:
@@ -176,10 +221,14 @@ class Pipe(object):
             }
         }
 
-        return self.nlp.pipe(texts,
-                             n_process=n_process,
-                             batch_size=batch_size,
-                             component_cfg=component_cfg)
+        try:
+            yield from self.nlp.pipe((_TextWithId(text, i) for i, text in enumerate(texts)),
+                                     n_process=n_process,
+                                     batch_size=batch_size,
+                                     component_cfg=component_cfg)
+        finally:
+            # Docs created later (e.g. by `__call__`) keep the entities as a list of spans
+            self.force_remove(instance_name)
 
     def set_error_handler(self, error_handler):
         self.nlp.set_error_handler(error_handler)
@@ -1,7 +1,8 @@
 import logging
-import gc
+import math
+import numpy as np
 from joblib import Parallel, delayed
-from typing import Iterable, Generator, Tuple, Callable
+from typing import Iterable, Generator, Tuple, Callable, Optional, List, Dict
 from spacy.tokens import Doc, Span
 from spacy.tokens.underscore import Underscore
 from spacy.pipeline import Pipe
@@ -19,7 +20,7 @@ class PipeRunner(Pipe):
         if PipeRunner._execute is None or workers > PipeRunner._execute.n_jobs:
             PipeRunner._execute = Parallel(n_jobs=workers, timeout=PipeRunner._time_out_in_secs)
         if PipeRunner._delayed is None:
-            PipeRunner._delayed = delayed(PipeRunner._run_pipe_on_one)
+            PipeRunner._delayed = delayed(PipeRunner._run_pipe_on_batch)
 
     def __call__(self, doc: Doc):
         raise NotImplementedError("Method __call__ has not been implemented.")
@@ -29,67 +30,132 @@ class PipeRunner(Pipe):
         if kwargs.get("parallel", False):
             for docs in minibatch(stream, size=batch_size):
                 docs = [PipeRunner.serialize_entities(doc) for doc in docs]
+                # One task per worker and not per doc, so the component and the underscore state are sent once per chunk
+                chunk_size = max(math.ceil(len(docs) / PipeRunner._execute.n_jobs), 1)
+                underscore_state = Underscore.get_state()
                 try:
-                    tasks = (PipeRunner._delayed(self.__call__, doc, Underscore.get_state()) for doc in docs)
-                    for output_doc in PipeRunner._execute(tasks):
-                        yield PipeRunner.deserialize_entities(output_doc)
+                    # Each task catches errors per doc, so one failing doc does not fail the chunk
+                    tasks = (PipeRunner._delayed(self.__call__, docs[i:i + chunk_size], underscore_state)
+                             for i in range(0, len(docs), chunk_size))
+                    outputs = [output for chunk in PipeRunner._execute(tasks) for output in chunk]
                 except Exception as e:
                     error_handler(self.name, self, docs, e)
-                    yield from [None] * len(docs)
+                    for doc in docs:
+                        PipeRunner._mark_failed(doc)
+                    outputs = [(doc, None) for doc in docs]
+
+                for output_doc, e in outputs:
+                    output_doc = PipeRunner.deserialize_entities(output_doc)
+                    if e is not None:
+                        error_handler(self.name, self, [output_doc], e)
+                        PipeRunner._mark_failed(output_doc)
+                    yield output_doc
         else:
             for doc in stream:
-                try:
-                    yield self(doc)
-                except Exception as e:
-                    error_handler(self.name, self, [doc], e)
-                    yield None
+                yield self._call_or_fail(doc, error_handler)
+
+    def _call_or_fail(self, doc: Doc, error_handler: Callable) -> Doc:
+        # Docs that failed in an earlier component are passed on without changes
+        if PipeRunner.is_failed(doc):
+            return doc
+        try:
+            return self(doc)
+        except Exception as e:
+            error_handler(self.name, self, [doc], e)
+            PipeRunner._mark_failed(doc)
+            return doc
 
     @staticmethod
-    def serialize_entities(doc: Doc):
-        new_ents = []
-        for ent in doc._.ents:
-            serializable = {
-                "start": ent.start,
-                "end": ent.end,
-                "label": ent.label,
-                "cui": ent._.cui,
-                "detected_name": ent._.detected_name,
-                "context_similarity": ent._.context_similarity,
-                "link_candidates": ent._.link_candidates,
-                "confidence": ent._.confidence,
-                "id": ent._.id
-            }
-            if hasattr(ent._, 'meta_anns') and ent._.meta_anns:
-                serializable['meta_anns'] = ent._.meta_anns
-            new_ents.append(serializable)
-        doc._.ents.clear()
-        gc.collect()
-        doc._.ents = new_ents
+    def _mark_failed(doc: Doc) -> None:
+        if not Doc.has_extension('failed'):
+            Doc.set_extension('failed', default=False)
+        doc._.failed = True
+
+    @staticmethod
+    def is_failed(doc: Doc) -> bool:
+        r''' True if processing of the doc failed in one of the components, the
+        doc is kept in the stream so that the output stays aligned with the input.
+        '''
+        return Doc.has_extension('failed') and doc._.failed
+
+    @staticmethod
+    def serialize_entities(doc: Doc) -> Doc:
+        r''' Pack `doc._.ents` into a dictionary of arrays (start, end, label, index into the list of CUIs,
+        similarity, ...) that is cheap to pickle. Docs that are already packed are returned unchanged.
+
+        Before the packed format `doc._.ents` was serialized into a list of dictionaries, one per entity. Code
+        that reads `doc._.ents` of docs from `Pipe.batch_multi_process` should use `deserialize_entities`.
+        '''
+        if PipeRunner.is_serialized(doc):
+            return doc
+
+        ents = doc._.ents
+        cui2ind: Dict = {}
+        packed = {
+            "start": np.array([ent.start for ent in ents], dtype=np.int32),
+            "end": np.array([ent.end for ent in ents], dtype=np.int32),
+            "label": np.array([ent.label for ent in ents], dtype=np.uint64),
+            "cui": np.array([cui2ind.setdefault(ent._.cui, len(cui2ind)) for ent in ents], dtype=np.int32),
+            "context_similarity": np.array([ent._.context_similarity for ent in ents], dtype=np.float64),
+            "confidence": np.array([ent._.confidence for ent in ents], dtype=np.float64),
+            "id": np.array([ent._.id for ent in ents], dtype=np.int64),
+            "detected_name": [ent._.detected_name for ent in ents],
+            "link_candidates": [ent._.link_candidates for ent in ents],
+        }
+        packed["cuis"] = list(cui2ind.keys())
+        if Span.has_extension('meta_anns'):
+            meta_anns = [ent._.meta_anns for ent in ents]
+            if any(meta_anns):
+                packed["meta_anns"] = meta_anns
+        doc._.ents = packed
         return doc
 
     @staticmethod
-    def deserialize_entities(doc: Doc):
+    def deserialize_entities(doc: Doc) -> Doc:
+        r''' Rebuild the entities (`Span` objects) of a doc packed with `serialize_entities`. Docs that
+        are not packed are returned unchanged.
+        '''
+        if not PipeRunner.is_serialized(doc):
+            return doc
+
+        packed = doc._.ents
+        cuis = packed["cuis"]
+        meta_anns = packed.get("meta_anns")
         new_ents = []
-        for ent in doc._.ents:
-            ent_span = Span(doc, ent['start'], ent['end'], label=ent['label'])
-            ent_span._.cui = ent['cui']
-            ent_span._.detected_name = ent['detected_name']
-            ent_span._.context_similarity = ent['context_similarity']
-            ent_span._.link_candidates = ent['link_candidates']
-            ent_span._.confidence = ent['confidence']
-            ent_span._.id = ent['id']
-            if 'meta_anns' in ent:
-                ent_span._.meta_anns = ent['meta_anns']
+        for i, (start, end, label, cui_ind, context_similarity, confidence, id) in enumerate(zip(
+                packed["start"].tolist(), packed["end"].tolist(), packed["label"].tolist(), packed["cui"].tolist(),
+                packed["context_similarity"].tolist(), packed["confidence"].tolist(), packed["id"].tolist())):
+            ent_span = Span(doc, start, end, label=label)
+            ent_span._.cui = cuis[cui_ind]
+            ent_span._.detected_name = packed["detected_name"][i]
+            ent_span._.context_similarity = context_similarity
+            ent_span._.link_candidates = packed["link_candidates"][i]
+            ent_span._.confidence = confidence
+            ent_span._.id = id
+            if meta_anns is not None and meta_anns[i]:
+                ent_span._.meta_anns = meta_anns[i]
             new_ents.append(ent_span)
-        doc._.ents.clear()
-        gc.collect()
         doc._.ents = new_ents
         return doc
 
     @staticmethod
-    def _run_pipe_on_one(call: Callable, doc: Doc, underscore_state: Tuple) -> Doc:
+    def is_serialized(doc: Doc) -> bool:
+        return isinstance(doc._.ents, dict)
+
+    @staticmethod
+    def _run_pipe_on_batch(call: Callable, docs: List[Doc], underscore_state: Tuple) -> List[Tuple[Doc, Optional[Exception]]]:
         Underscore.load_state(underscore_state)
+        return [PipeRunner._run_pipe_on_one(call, doc) for doc in docs]
+
+    @staticmethod
+    def _run_pipe_on_one(call: Callable, doc: Doc) -> Tuple[Doc, Optional[Exception]]:
+        if PipeRunner.is_failed(doc):
+            return doc, None
         doc = PipeRunner.deserialize_entities(doc)
-        doc = call(doc)
+        try:
+            doc = call(doc)
+            error = None
+        except Exception as e:
+            error = e
         doc = PipeRunner.serialize_entities(doc)
-        return doc
+        return doc, error
@@ -22,6 +22,26 @@ def prepare_name(raw_name, nlp, names, config):
     '''
     sc_name = nlp(raw_name)
 
+    return prepare_name_from_doc(sc_name, names, config)
+
+
+def prepare_name_from_doc(sc_name, names, config):
+    r''' Same as `prepare_name`, but for a name that was already processed by the spacy pipeline
+    (e.g. with `nlp.pipe` when building a CDB), `sc_name.text` is the raw name.
+
+    Args:
+        sc_name (`spacy.tokens.Doc`):
+            The name processed by the spacy pipeline.
+        names (`dict`):
+            Dictionary of existing names for this concept, the new name versions will be added here.
+        config (`medcat.config.Config`):
+            Global config for medcat.
+
+    Return:
+        names (`dict`):
+            The new dictionary of prepared names.
+    '''
+    raw_name = sc_name.text
     for version in config.cdb_maker['name_versions']:
         tokens = None
         is_upper = sc_name.text.isupper()
@@ -41,24 +61,40 @@ def prepare_name(raw_name, nlp, names, config):
                         tokens.append(t.lemma_.lower())
 
         if tokens is not None and tokens:
-            snames = set()
             name = config.general['separator'].join(tokens)
 
             if not config.cdb_maker.get('min_letters_required', 0) or len(re.sub("[^A-Za-z]*", '', name)) >= config.cdb_maker.get('min_letters_required'):
                 if name not in names:
-                    sname = ""
-                    for token in tokens:
-                        if sname:
-                            sname = sname + config.general['separator'] + token
-                        else:
-                            sname = token
-                        snames.add(sname.strip())
-
+                    snames = get_snames(tokens, config.general['separator'])
                     names[name] = {'tokens': tokens, 'snames': snames, 'raw_name': raw_name, 'is_upper': is_upper}
 
     return names
 
 
+def get_snames(tokens, separator):
+    r''' Sub-names of a name, the first one, two, ... tokens of the name joined with the separator.
+
+    Args:
+        tokens (`List[str]`):
+            Tokens of the name.
+        separator (`str`):
+            The separator used to join tokens (`config.general['separator']`).
+
+    Return:
+        snames (`Set[str]`):
+            The sub-names, including the name itself.
+    '''
+    snames = set()
+    sname = ""
+    for token in tokens:
+        if sname:
+            sname = sname + separator + token
+        else:
+            sname = token
+        snames.add(sname.strip())
+    return snames
+
+
 def basic_clean(text):
     """ Remove almost everything from text
 
@@ -1,3 +1,4 @@
+from spacy.attrs import ORTH, IS_STOP
 from medcat.pipeline.pipe_runner import PipeRunner
 
 
@@ -21,24 +22,62 @@ tag_skip_and_punct.name = "tag_skip_and_punct"
 
 class _Tagger(PipeRunner):
 
+    # Values in the tag cache
+    _NONE = 0
+    _SKIP = 1
+    _PUNCT = 2
+
     def __init__(self, nlp, name, config):
         self.name = name
         self.config = config
+        # From a lexeme (token.orth) to its tag, the tags of a lexeme are the same in every doc
+        self._tag_cache = {}
+        self._tag_cache_key = None
         super().__init__(self.config.general['workers'])
 
     def __call__(self, doc):
         # Make life easier
         cnf_p = self.config.preprocessing
 
-        for token in doc:
-            if self.config.punct_checker.match(token.lower_) and token.text not in cnf_p['keep_punct']:
-                # There can't be punct in a token if it also has text
-                token._.is_punct = True
-                token._.to_skip = True
-            elif self.config.word_skipper.match(token.lower_):
-                # Skip if specific strings
-                token._.to_skip = True
-            elif cnf_p['skip_stopwords'] and token.is_stop:
-                token._.to_skip = True
+        if not cnf_p.get('cache_token_tags', True):
+            for token in doc:
+                self._set_tag(token, self._get_tag(token))
+            return doc
+
+        # Work on lexeme ids, Token objects are only created for tokens that get tagged
+        tags = self._get_tag_cache()
+        for i, (orth, is_stop) in enumerate(doc.to_array([ORTH, IS_STOP]).tolist()):
+            tag = tags.get(orth)
+            if tag is None:
+                tag = tags[orth] = self._get_tag(doc[i])
+            if tag != self._NONE or (is_stop and cnf_p['skip_stopwords']):
+                self._set_tag(doc[i], tag)
 
         return doc
+
+    def _set_tag(self, token, tag):
+        if tag == self._PUNCT:
+            token._.is_punct = True
+            token._.to_skip = True
+        elif tag == self._SKIP:
+            token._.to_skip = True
+        elif self.config.preprocessing['skip_stopwords'] and token.is_stop:
+            token._.to_skip = True
+
+    def _get_tag(self, token):
+        if self.config.punct_checker.match(token.lower_) and token.text not in self.config.preprocessing['keep_punct']:
+            # There can't be punct in a token if it also has text
+            return self._PUNCT
+        elif self.config.word_skipper.match(token.lower_):
+            # Skip if specific strings
+            return self._SKIP
+        return self._NONE
+
+    def _get_tag_cache(self):
+        # The cached tags are no longer valid if the config used to calculate them has changed
+        key = (self.config.punct_checker.pattern, self.config.word_skipper.pattern,
+               frozenset(self.config.preprocessing['keep_punct']))
+        if key != self._tag_cache_key:
+            self._tag_cache = {}
+            self._tag_cache_key = key
+        return self._tag_cache
@@ -1,8 +1,6 @@
 import spacy
 from spacy.tokenizer import Tokenizer
 from spacy.language import Language
-from tokenizers import ByteLevelBPETokenizer
-from transformers.models.bert.tokenization_bert_fast import BertTokenizerFast
 import re
 import os
 
@@ -152,6 +150,7 @@ class TokenizerWrapperBPE(object):
 
     @classmethod
     def load(cls, dir_path, name='bbpe', **kwargs):
+        from tokenizers import ByteLevelBPETokenizer
         tokenizer = cls()
         vocab_file = os.path.join(dir_path, f'{name}-vocab.json')
         merges_file = os.path.join(dir_path, f'{name}-merges.txt')
@@ -186,6 +185,7 @@ class TokenizerWrapperBERT(object):
 
     @classmethod
     def load(cls, dir_path, name='bert', **kwargs):
+        from transformers.models.bert.tokenization_bert_fast import BertTokenizerFast
         tokenizer = cls()
         path = os.path.join(dir_path, name)
         tokenizer.hf_tokenizers = BertTokenizerFast.from_pretrained(path, **kwargs)
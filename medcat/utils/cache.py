@@ -0,0 +1,86 @@
+""" A bounded least recently used (LRU) cache with hit/miss counters that can be saved to disk.
+"""
+import os
+import pickle
+import logging
+from collections import OrderedDict
+
+log = logging.getLogger(__name__)
+
+
+class LRUCache(object):
+    r''' Dictionary like cache that keeps at most `max_size` items, once full the least recently used item is removed.
+
+    Args:
+        max_size (`int`, optional):
+            Maximum number of items in the cache, no limit if None.
+
+    Examples:
+        >>> cache = LRUCache(max_size=1000)
+        >>> value = cache.get(key)
+        >>> if value is None:
+        >>>     value = cache[key] = compute(key)
+    '''
+    _missing = object()
+
+    def __init__(self, max_size=None):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+
+    def get(self, key, default=None):
+        r''' Get the value for `key` and mark it as used, each call is counted as a hit or a miss.
+        '''
+        value = self._data.get(key, self._missing)
+        if value is self._missing:
+            self.misses += 1
+            return default
+        self.hits += 1
+        self._data.move_to_end(key)
+        return value
+
+    def __setitem__(self, key, value):
+        self._data[key] = value
+        self._data.move_to_end(key)
+        if self.max_size is not None and len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __len__(self):
+        return len(self._data)
+
+    def clear(self):
+        self._data.clear()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def info(self):
+        r''' Size and hit/miss counters of the cache.
+        '''
+        return {'size': len(self._data), 'max_size': self.max_size, 'hits': self.hits, 'misses': self.misses,
+                'hit_rate': self.hit_rate}
+
+    def save(self, path):
+        r''' Save the cached items (from least to most recently used) into `path`.
+        '''
+        # Write next to the target and replace it, so that a process reading the cache never sees a partial file
+        with open(path + '.tmp', 'wb') as f:
+            pickle.dump(list(self._data.items()), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(path + '.tmp', path)
+
+    def load(self, path):
+        r''' Add the items saved with `save` to this cache, the counters are not changed.
+        '''
+        with open(path, 'rb') as f:
+            items = pickle.load(f)
+        for key, value in items:
+            self[key] = value
+        log.debug("Loaded {} items into the cache from: {}".format(len(items), path))
@@ -0,0 +1,306 @@
+""" Directory based on-disk format for the CDB. Compared to the single `cdb.dat` file it:
+    - keeps names/snames in compact string tables (one text blob + offsets) instead of pickled Python objects,
+    - saves context vectors as `.npy` matrices that are memory mapped on load (`np.load(mmap_mode='r')`),
+    - saves each `addl_info` section in its own file that is only loaded on first access.
+
+Layout of a saved CDB:
+    cdb_dir/
+        format.json                 # Kind (cdb), version, context types and the list of addl_info sections
+        config.dat                  # The config (dill, as in cdb.dat)
+        core.pickle                 # All other (small) CDB fields
+        names.txt, names.npy        # name2cuis: names, offsets into names.txt
+        name2cuis.npz               # name2cuis: CSR (indptr, indices) into cuis
+        cuis.txt, cuis.npy          # All CUIs used by name2cuis
+        snames.txt, snames.npy      # snames
+        context_vectors/            # <context_type>.npy, <context_type>.normed.npy, <context_type>.present.npy, cuis.txt/npy
+        addl_info/<i>.pickle        # One file per addl_info section
+        similarity/<i>/             # The indices of cdb.most_similar, one per context type (medcat.utils.similarity)
+"""
+import os
+import gc
+import json
+import pickle
+import logging
+import dill
+import numpy as np
+from collections.abc import MutableMapping
+
+from medcat.config import Config
+from medcat.utils.context_vectors import ContextVectorStore
+from medcat.utils.name_maps import expand_all
+
+log = logging.getLogger(__name__)
+
+FORMAT_VERSION = 1
+FORMAT_FILE = 'format.json'
+# The kinds of saved directories that share FORMAT_FILE
+_KIND_NAMES = {'cdb': 'CDB', 'vocab': 'Vocab'}
+# Fields that are not saved in core.pickle
+_SEPARATE_FIELDS = ('config', 'name2cuis', 'snames', 'cui2context_vectors', 'addl_info', '_similarity_indices')
+
+
+def is_cdb_dir(path):
+    r''' Is `path` a CDB saved with `save_cdb_dir`.
+    '''
+    return os.path.isdir(path) and os.path.exists(os.path.join(path, FORMAT_FILE)) and read_format(path)['kind'] == 'cdb'
+
+
+def read_format(path):
+    r''' Read `format.json` of a directory saved with `save_cdb_dir` or `medcat.utils.vocab_storage.save_vocab_dir`,
+    `kind` (`cdb` or `vocab`) says which one. Directories saved before `kind` was added get it from the files in them.
+
+    Args:
+        path (`str`):
+            The saved directory.
+    '''
+    with open(os.path.join(path, FORMAT_FILE)) as f:
+        meta = json.load(f)
+    if 'kind' not in meta:
+        meta['kind'] = 'vocab' if os.path.exists(os.path.join(path, 'words.txt')) else 'cdb'
+    return meta
+
+
+def check_format(path, kind, format_version):
+    r''' Read `format.json` of a saved directory (`read_format`), a `ValueError` is raised if the directory
+    does not hold a `kind` (`cdb` or `vocab`) or was saved with a format newer than `format_version`.
+    '''
+    meta = read_format(path)
+    if meta['kind'] != kind:
+        raise ValueError("{} holds a saved {}, it can not be loaded as a {}".format(path, _KIND_NAMES.get(meta['kind'], meta['kind']),
+                                                                                     _KIND_NAMES[kind]))
+    if meta['format_version'] > format_version:
+        raise ValueError("The {} in {} was saved with a newer format (version {})".format(_KIND_NAMES[kind], path, meta['format_version']))
+    return meta
+
+
+def _save_npy(path, array):
+    # Write next to the target and replace it, so that arrays memory mapped from the old file stay valid
+    with open(path + '.tmp', 'wb') as f:
+        np.save(f, array)
+    os.replace(path + '.tmp', path)
+
+
+def save_strings(path, strings):
+    r''' Save a list of strings as one text blob (`<path>.txt`) plus the offset of
+    each string in that blob (`<path>.npy`).
+    '''
+    strings = list(strings)
+    offsets = np.zeros(len(strings) + 1, dtype=np.int64)
+    np.cumsum([len(s) for s in strings], out=offsets[1:])
+    with open(path + '.txt', 'w', encoding='utf-8', newline='') as f:
+        f.write(''.join(strings))
+    _save_npy(path + '.npy', offsets)
+
+
+def load_strings(path):
+    r''' Load a list of strings saved with `save_strings`.
+    '''
+    with open(path + '.txt', encoding='utf-8', newline='') as f:
+        text = f.read()
+    offsets = np.load(path + '.npy').tolist()
+    return [text[start:end] for start, end in zip(offsets[:-1], offsets[1:])]
+
+
+class LazyAddlInfo(MutableMapping):
+    r''' Dictionary used for `cdb.addl_info` when a CDB is loaded from a directory, each
+    section is read from disk on first access.
+
+    Args:
+        paths (`Dict[str, str]`):
+            From the name of a section to the pickle file that holds it.
+    '''
+    def __init__(self, paths):
+        self._paths = dict(paths)
+        self._data = {}
+
+    def is_loaded(self, name):
+        return name in self._data
+
+    def __getitem__(self, name):
+        if name not in self._data:
+            if name not in self._paths:
+                raise KeyError(name)
+            log.debug("Loading addl_info section: {}".format(name))
+            with open(self._paths.pop(name), 'rb') as f:
+                self._data[name] = pickle.load(f)
+        return self._data[name]
+
+    def __setitem__(self, name, value):
+        self._paths.pop(name, None)
+        self._data[name] = value
+
+    def __delitem__(self, name):
+        if name in self._data:
+            del self._data[name]
+            self._paths.pop(name, None)
+        elif name in self._paths:
+            del self._paths[name]
+        else:
+            raise KeyError(name)
+
+    def __contains__(self, name):
+        return name in self._data or name in self._paths
+
+    def __iter__(self):
+        yield from list(self._data)
+        yield from [name for name in list(self._paths) if name not in self._data]
+
+    def __len__(self):
+        return len(self._data) + len([name for name in self._paths if name not in self._data])
+
+    def __repr__(self):
+        return "<LazyAddlInfo loaded: {}, not loaded: {}>".format(list(self._data), list(self._paths))
+
+
+def save_cdb_dir(cdb, path):
+    r''' Save a CDB into the directory format (see the module docstring).
+
+    Args:
+        cdb (`medcat.cdb.CDB`):
+            The CDB to be saved.
+        path (`str`):
+            Directory where the CDB will be saved, created if it does not exist.
+    '''
+    os.makedirs(os.path.join(path, 'context_vectors'), exist_ok=True)
+    os.makedirs(os.path.join(path, 'addl_info'), exist_ok=True)
+
+    with open(os.path.join(path, 'config.dat'), 'wb') as f:
+        dill.dump(cdb.config.__dict__, f)
+
+    # Compact name maps are pickled as dictionaries, a view would take the whole CompactNameMaps with it
+    #(including name2cuis and snames that are saved below). They are made compact again on load.
+    core = expand_all({k: v for k, v in cdb.__dict__.items() if k not in _SEPARATE_FIELDS})
+    with open(os.path.join(path, 'core.pickle'), 'wb') as f:
+        pickle.dump(core, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    # name2cuis as CSR over a table of CUIs
+    cui2ind = {}
+    indptr = np.zeros(len(cdb.name2cuis) + 1, dtype=np.int64)
+    indices = []
+    for i, cuis in enumerate(cdb.name2cuis.values()):
+        for cui in cuis:
+            indices.append(cui2ind.setdefault(cui, len(cui2ind)))
+        indptr[i + 1] = len(indices)
+    save_strings(os.path.join(path, 'names'), cdb.name2cuis.keys())
+    save_strings(os.path.join(path, 'cuis'), cui2ind.keys())
+    with open(os.path.join(path, 'name2cuis.npz'), 'wb') as f:
+        np.savez(f, indptr=indptr, indices=np.array(indices, dtype=np.int32))
+    save_strings(os.path.join(path, 'snames'), cdb.snames)
+
+    # Context vectors, only rows that are in use
+    store = cdb.cui2context_vectors
+    if not isinstance(store, ContextVectorStore):
+        store = ContextVectorStore.from_dict(store)
+    cuis = list(store.cui2row.keys())
+    rows = np.array([store.cui2row[cui] for cui in cuis], dtype=np.int64)
+    save_strings(os.path.join(path, 'context_vectors', 'cuis'), cuis)
+    context_types = list(store.matrices.keys())
+    for ind, context_type in enumerate(context_types):
+        _save_npy(os.path.join(path, 'context_vectors', '{}.npy'.format(ind)), store.matrices[context_type][rows])
+        _save_npy(os.path.join(path, 'context_vectors', '{}.normed.npy'.format(ind)), store.normed[context_type][rows])
+        _save_npy(os.path.join(path, 'context_vectors', '{}.present.npy'.format(ind)), store.present[context_type][rows])
+
+    # addl_info, one file per section. Everything is loaded before writing as a lazily
+    #loaded CDB could be saved into the directory it was loaded from.
+    addl_info = [(name, cdb.addl_info[name]) for name in list(cdb.addl_info.keys())]
+    for ind, (_, section) in enumerate(addl_info):
+        with open(os.path.join(path, 'addl_info', '{}.pickle'.format(ind)), 'wb') as f:
+            pickle.dump(section, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    similarity_indices = list(cdb._similarity_indices.items())
+    for ind, (_, index) in enumerate(similarity_indices):
+        index.save(os.path.join(path, 'similarity', str(ind)))
+
+    with open(os.path.join(path, FORMAT_FILE), 'w') as f:
+        json.dump({'kind': 'cdb',
+                   'format_version': FORMAT_VERSION,
+                   'context_types': context_types,
+                   'addl_info': [name for name, _ in addl_info],
+                   'similarity': [context_type for context_type, _ in similarity_indices]}, f)
+
+
+def load_cdb_dir(cdb_cls, path, config=None, mmap=True):
+    r''' Load a CDB saved with `save_cdb_dir`.
+
+    Args:
+        cdb_cls (`type`):
+            The CDB class (`medcat.cdb.CDB`).
+        path (`str`):
+            Directory from which to load.
+        config (`medcat.config.Config`, optional):
+            If set it will be used instead of the saved config.
+        mmap (`bool`, defaults to `True`):
+            Memory map the context vectors instead of reading them into memory.
+    '''
+    # Building millions of small objects triggers the cyclic GC over and over, none of them can be garbage
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        return _load_cdb_dir(cdb_cls, path, config, mmap)
+    finally:
+        if gc_enabled:
+            gc.enable()
+
+
+def _load_cdb_dir(cdb_cls, path, config, mmap):
+    meta = check_format(path, 'cdb', FORMAT_VERSION)
+
+    if config is None:
+        with open(os.path.join(path, 'config.dat'), 'rb') as f:
+            config = Config.from_dict(dill.load(f))
+        cdb_cls._ensure_backward_compatibility(config)
+    cdb = cdb_cls(config=config)
+
+    with open(os.path.join(path, 'core.pickle'), 'rb') as f:
+        core = pickle.load(f)
+    for k in cdb.__dict__:
+        if k in core:
+            cdb.__dict__[k] = core[k]
+
+    names = load_strings(os.path.join(path, 'names'))
+    cuis = load_strings(os.path.join(path, 'cuis'))
+    csr = np.load(os.path.join(path, 'name2cuis.npz'))
+    indptr = csr['indptr'].tolist()
+    flat_cuis = [cuis[ind] for ind in csr['indices'].tolist()]
+    cdb.name2cuis = {name: flat_cuis[start:end] for name, start, end in zip(names, indptr[:-1], indptr[1:])}
+    cdb.snames = set(load_strings(os.path.join(path, 'snames')))
+
+    mmap_mode = 'r' if mmap else None
+    matrices, normed, present = {}, {}, {}
+    for ind, context_type in enumerate(meta['context_types']):
+        matrices[context_type] = np.load(os.path.join(path, 'context_vectors', '{}.npy'.format(ind)), mmap_mode=mmap_mode)
+        normed[context_type] = np.load(os.path.join(path, 'context_vectors', '{}.normed.npy'.format(ind)), mmap_mode=mmap_mode)
+        present[context_type] = np.load(os.path.join(path, 'context_vectors', '{}.present.npy'.format(ind)), mmap_mode=mmap_mode)
+    cdb.cui2context_vectors = ContextVectorStore.from_arrays(load_strings(os.path.join(path, 'context_vectors', 'cuis')),
+                                                             matrices, present, normed=normed)
+    # The vectors are always loaded into the matrix store, config.linking['context_vector_store'] is left as it was
+    #saved so that it does not change when the CDB is saved again
+
+    cdb.addl_info = LazyAddlInfo({name: os.path.join(path, 'addl_info', '{}.pickle'.format(ind))
+                                  for ind, name in enumerate(meta['addl_info'])})
+    cdb.use_compact_names(cdb.config.general.get('compact_name_maps', False))
+
+    from medcat.utils.similarity import SimilarityIndex
+    cdb._similarity_indices = {context_type: SimilarityIndex.load(os.path.join(path, 'similarity', str(ind)), mmap=mmap)
+                               for ind, context_type in enumerate(meta.get('similarity', []))}
+
+    return cdb
+
+
+def convert_cdb(dat_path, dir_path):
+    r''' Convert a CDB saved in the old single file format (`cdb.dat`) into the directory format.
+
+    Args:
+        dat_path (`str`):
+            Path to the `cdb.dat` file.
+        dir_path (`str`):
+            Directory where the converted CDB will be saved.
+
+    Examples:
+        >>> convert_cdb('./cdb.dat', './cdb')
+        >>> cdb = CDB.load('./cdb')
+    '''
+    from medcat.cdb import CDB
+    cdb = CDB.load(dat_path)
+    save_cdb_dir(cdb, dir_path)
+    return dir_path
@@ -0,0 +1,278 @@
+""" Matrix backed storage for CDB context vectors
+"""
+import numpy as np
+from collections.abc import MutableMapping
+
+from medcat.utils.matutils import unitvec
+from medcat.utils.shared_memory import to_shared_array
+
+
+class _CUIContextVectors(MutableMapping):
+    r''' View of the context vectors of one CUI, behaves like the `{context_type: np.array}`
+    dictionary that is used in `cdb.cui2context_vectors` when the store is not used.
+    '''
+    __slots__ = ('_store', '_row')
+
+    def __init__(self, store, row):
+        self._store = store
+        self._row = row
+
+    def __getitem__(self, context_type):
+        if context_type not in self._store.present or not self._store.present[context_type][self._row]:
+            raise KeyError(context_type)
+        vector = self._store.matrices[context_type][self._row]
+        # Do not allow in place edits, they would bypass the normalised copy
+        vector.flags.writeable = False
+        return vector
+
+    def __setitem__(self, context_type, vector):
+        self._store.set_vector(self._row, context_type, vector)
+
+    def __delitem__(self, context_type):
+        if context_type not in self:
+            raise KeyError(context_type)
+        self._store._make_writeable(context_type)
+        self._store.present[context_type][self._row] = False
+
+    def __contains__(self, context_type):
+        return context_type in self._store.present and bool(self._store.present[context_type][self._row])
+
+    def __iter__(self):
+        return (context_type for context_type in self._store.present if self._store.present[context_type][self._row])
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        return repr(dict(self))
+
+
+class ContextVectorStore(MutableMapping):
+    r''' Stores context vectors for all CUIs in one contiguous matrix per context type (plus a
+    copy with unit length rows), so that the similarity of a context to many CUIs can be calculated
+    with one matrix product. Behaves like `Dict[str, Dict[str, np.array]]` so it can be used as
+    `cdb.cui2context_vectors`.
+
+    Args:
+        dtype (`np.dtype`, defaults to `np.float32`):
+            Type used for the stored vectors.
+
+    Properties:
+        cui2row (`Dict[str, int]`):
+            Row of each CUI in the matrices.
+        row2cui (`List[str]`):
+            CUI for each row, None for rows that were freed.
+        matrices (`Dict[str, np.array]`):
+            From context type to a matrix with one row per CUI.
+        normed (`Dict[str, np.array]`):
+            Same as matrices, but each row is normalised to unit length.
+        present (`Dict[str, np.array]`):
+            From context type to a boolean mask showing which rows have a vector for that type.
+    '''
+    def __init__(self, dtype=np.float32):
+        self.dtype = np.dtype(dtype)
+        self.cui2row = {}
+        self.row2cui = []
+        self.matrices = {}
+        self.normed = {}
+        self.present = {}
+        self._free_rows = []
+        self._capacity = 0
+
+    @classmethod
+    def from_dict(cls, cui2context_vectors, dtype=np.float32):
+        r''' Create a store from a standard `{cui: {context_type: np.array}}` dictionary.
+        '''
+        store = cls(dtype=dtype)
+        store._reserve(len(cui2context_vectors))
+        for cui, vectors in cui2context_vectors.items():
+            store[cui] = vectors
+        return store
+
+    @classmethod
+    def from_arrays(cls, cuis, matrices, present, normed=None):
+        r''' Create a store around existing arrays (e.g. memory mapped with `np.load(mmap_mode='r')`),
+        the arrays are not copied until something in the store is changed.
+
+        Args:
+            cuis (`List[str]`):
+                CUI for each row of the matrices.
+            matrices (`Dict[str, np.array]`):
+                From context type to a matrix with one row per CUI.
+            present (`Dict[str, np.array]`):
+                From context type to a boolean mask showing which rows have a vector for that type.
+            normed (`Dict[str, np.array]`, optional):
+                Same as matrices but with unit length rows, calculated if not provided.
+        '''
+        store = cls(dtype=next(iter(matrices.values())).dtype if matrices else np.float32)
+        store.row2cui = list(cuis)
+        store.cui2row = {cui: row for row, cui in enumerate(store.row2cui)}
+        store.matrices = dict(matrices)
+        store.present = dict(present)
+        if normed is None:
+            normed = {}
+            for context_type, matrix in matrices.items():
+                norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+                normed[context_type] = (matrix / np.where(norms > 0, norms, 1)).astype(store.dtype)
+        store.normed = dict(normed)
+        store._capacity = len(store.row2cui)
+        return store
+
+    def to_dict(self):
+        r''' Convert back to a standard `{cui: {context_type: np.array}}` dictionary.
+        '''
+        return {cui: {context_type: np.array(vector) for context_type, vector in self[cui].items()} for cui in self}
+
+    def _reserve(self, n_rows):
+        if n_rows <= self._capacity:
+            return
+        capacity = max(n_rows, 2 * self._capacity, 16)
+        for context_type in list(self.matrices.keys()):
+            self.matrices[context_type] = self._resize(self.matrices[context_type], capacity)
+            self.normed[context_type] = self._resize(self.normed[context_type], capacity)
+            self.present[context_type] = self._resize(self.present[context_type], capacity)
+        self._capacity = capacity
+
+    @staticmethod
+    def _resize(array, capacity):
+        new_array = np.zeros((capacity,) + array.shape[1:], dtype=array.dtype)
+        new_array[:min(len(array), capacity)] = array[:capacity]
+        return new_array
+
+    def _add_row(self, cui):
+        if self._free_rows:
+            row = self._free_rows.pop()
+            self.row2cui[row] = cui
+        else:
+            row = len(self.row2cui)
+            self._reserve(row + 1)
+            self.row2cui.append(cui)
+        self.cui2row[cui] = row
+        return row
+
+    def set_vector(self, row, context_type, vector):
+        r''' Set the vector of one context type for the CUI in `row`, the normalised
+        copy is updated at the same time.
+        '''
+        vector = np.asarray(vector, dtype=self.dtype)
+        if context_type not in self.matrices:
+            self.matrices[context_type] = np.zeros((self._capacity, len(vector)), dtype=self.dtype)
+            self.normed[context_type] = np.zeros((self._capacity, len(vector)), dtype=self.dtype)
+            self.present[context_type] = np.zeros(self._capacity, dtype=bool)
+        elif self.matrices[context_type].shape[1] != len(vector):
+            raise ValueError("Vector for context type '{}' has {} dimensions, expected {}".format(
+                context_type, len(vector), self.matrices[context_type].shape[1]))
+
+        self._make_writeable(context_type)
+        self.matrices[context_type][row] = vector
+        self.normed[context_type][row] = unitvec(vector)
+        self.present[context_type][row] = True
+
+    def _make_writeable(self, context_type):
+        if self.matrices[context_type].base is not None or not self.matrices[context_type].flags.writeable:
+            # Attached to external (e.g. memory mapped) buffers, take a private copy before writing
+            self.matrices[context_type] = np.array(self.matrices[context_type])
+            self.normed[context_type] = np.array(self.normed[context_type])
+            self.present[context_type] = np.array(self.present[context_type])
+
+    def share_memory(self):
+        r''' Move all matrices into read-only shared memory (unused capacity is dropped), so that
+        worker processes do not copy them. The first change to a context type after this
+        will take a private copy of its matrices.
+        '''
+        n_rows = len(self.row2cui)
+        for key in ('matrices', 'normed', 'present'):
+            arrays = getattr(self, key)
+            for context_type in arrays:
+                arrays[context_type] = to_shared_array(arrays[context_type][:n_rows])
+        self._capacity = n_rows
+
+    def row(self, cui):
+        r''' Row of the CUI in the matrices or -1 if the CUI has no vectors.
+        '''
+        return self.cui2row.get(cui, -1)
+
+    def similarities(self, cuis, vectors, weights):
+        r''' Weighted context similarity between `vectors` and all `cuis`, the same as
+        `sum(weight * np.dot(unitvec(vectors[ct]), unitvec(cui2context_vectors[cui][ct])))` over all
+        context types that are present for both, but done with one matrix product per context type.
+
+        Args:
+            cuis (`List[str]`):
+                CUIs for which to calculate the similarity.
+            vectors (`Dict[str, np.array]`):
+                Context vectors of an entity, `{context_type: np.array}`.
+            weights (`Dict[str, float]`):
+                Weight of each context type, usually `config.linking['context_vector_weights']`.
+
+        Return:
+            similarities (`np.array`):
+                Similarity for each CUI.
+            has_vectors (`np.array`):
+                Boolean mask, False for CUIs that have no context vectors at all.
+        '''
+        rows = np.array([self.cui2row.get(cui, -1) for cui in cuis], dtype=np.int64)
+        has_vectors = rows >= 0
+        _rows = rows[has_vectors]
+
+        similarities = np.zeros(len(rows))
+        _similarities = np.zeros(len(_rows))
+        _has_any = np.zeros(len(_rows), dtype=bool)
+        for context_type, present in self.present.items():
+            _present = present[_rows]
+            _has_any |= _present
+            if context_type in vectors and context_type in weights:
+                sims = np.dot(self.normed[context_type][_rows], unitvec(vectors[context_type]))
+                _similarities += weights[context_type] * np.where(_present, sims, 0)
+
+        similarities[has_vectors] = _similarities
+        has_vectors[has_vectors] = _has_any
+
+        return similarities, has_vectors
+
+    def __getitem__(self, cui):
+        return _CUIContextVectors(self, self.cui2row[cui])
+
+    def __setitem__(self, cui, vectors):
+        if cui in self.cui2row:
+            row = self.cui2row[cui]
+            for context_type in self.present:
+                self._make_writeable(context_type)
+                self.present[context_type][row] = False
+        else:
+            row = self._add_row(cui)
+
+        for context_type, vector in list(vectors.items()):
+            self.set_vector(row, context_type, vector)
+
+    def __delitem__(self, cui):
+        row = self.cui2row.pop(cui)
+        for context_type in self.present:
+            self._make_writeable(context_type)
+            self.present[context_type][row] = False
+        self.row2cui[row] = None
+        self._free_rows.append(row)
+
+    def __contains__(self, cui):
+        return cui in self.cui2row
+
+    def __iter__(self):
+        return iter(self.cui2row)
+
+    def __len__(self):
+        return len(self.cui2row)
+
+    def __repr__(self):
+        return "<ContextVectorStore with {} CUIs and context types: {}>".format(len(self), list(self.matrices.keys()))
+
+    def __getstate__(self):
+        # Do not save the unused capacity
+        state = dict(self.__dict__)
+        n_rows = len(self.row2cui)
+        for key in ('matrices', 'normed', 'present'):
+            state[key] = {context_type: np.ascontiguousarray(array[:n_rows]) for context_type, array in state[key].items()}
+        state['_capacity'] = n_rows
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
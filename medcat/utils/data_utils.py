@@ -1,11 +1,10 @@
 import numpy as np
 import json
 import copy
-from sklearn.metrics import cohen_kappa_score
-import torch
 import pickle
 
 def set_all_seeds(seed):
+    import torch
     torch.manual_seed(seed)
     np.random.seed(seed)
 
@@ -186,6 +185,7 @@ def get_same_anns(document, document2, require_double_inner=True, ann_stats=[],
 
 
 def print_consolid_stats(ann_stats=[], meta_names=[]):
+    from sklearn.metrics import cohen_kappa_score
     if ann_stats:
         _ann_stats = np.array(ann_stats[0])
         t = 0
@@ -651,7 +651,10 @@ def validate_ner_data(data_path, cdb, cntx_size=70, status_only=False, ignore_if
     json.dump(data, open(data_path, 'w'))
 
 
-class MetaAnnotationDS(torch.utils.data.Dataset):
+class MetaAnnotationDS(object):
+    r''' A map-style dataset (`torch.utils.data.Dataset` interface) of the meta annotations, torch is
+    imported only when items are created so that importing this module (e.g. from medcat.cat) does not import it.
+    '''
     def __init__(self, data, category_map):
         r'''
 
@@ -666,6 +669,8 @@ class MetaAnnotationDS(torch.utils.data.Dataset):
 
 
     def __getitem__(self, idx):
+        import torch
+
         item = {}
         for key, value in self.data.items():
             if key != 'labels':
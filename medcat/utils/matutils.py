@@ -1,8 +1,18 @@
-from gensim.matutils import unitvec as g_unitvec
+from scipy.linalg import get_blas_funcs
 import numpy as np
 
+# The BLAS functions used by gensim.matutils.unitvec, gensim itself is not imported as it takes
+#longer to import than the rest of medcat.
+blas_nrm2, blas_scal = get_blas_funcs(('nrm2', 'scal'), (np.array([], dtype=float), ))
+
 def unitvec(arr):
-    return g_unitvec(np.array(arr))
+    vec = np.array(arr)
+    veclen = blas_nrm2(vec) if vec.size else 0.0
+    if veclen > 0.0:
+        if np.issubdtype(vec.dtype, np.integer):
+            vec = vec.astype(float)
+        return blas_scal(1.0 / veclen, vec).astype(vec.dtype)
+    return vec
 
 def sigmoid(x):
     return 1 / (1 + np.exp(-x))
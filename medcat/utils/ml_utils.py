@@ -1,10 +1,4 @@
-from sklearn.model_selection import train_test_split
 import numpy as np
-from sklearn.metrics import classification_report, f1_score, confusion_matrix, precision_score, recall_score
-import torch
-from torch import nn
-import torch.nn.functional as F
-import torch.optim as optim
 import os
 import math
 
@@ -62,9 +56,7 @@ def build_vocab_from_hf(model_name, hf_tokenizer, vocab):
                 embs = model.embeddings.word_embeddings.weight.cpu().detach().numpy()
 
             # Reset all vecs in current vocab
-            vocab.vec_index2word = {}
-            for ind in vocab.index2word.keys():
-                vocab.vocab[vocab.index2word[ind]]['vec'] = None
+            vocab.remove_all_vectors()
 
             for i in range(hf_tokenizer.vocab_size):
                 tkn = hf_tokenizer.ids_to_tokens[i]
@@ -0,0 +1,483 @@
+""" Compact storage for the name maps of the CDB (`name2cuis`, `name2cuis2status`, `snames`, `cui2names`
+and `cui2snames`).
+
+In the dictionary representation every name is a separate Python string (often many copies of the same
+name), every CUI has its own `set` of names and snames and every name its own `list` and `dict` of CUIs. Here
+each distinct name/sname and CUI is stored once in a `StringTable` (one UTF-8 blob plus offsets) and gets an
+integer id, the relationships are CSR arrays of those ids. Views over the arrays behave like the dictionaries
+and sets, so NER and linking work with either representation.
+
+The views are read-only, except for the status of an existing name/CUI pair (changed during training). Values
+are built on access: `name2cuis[name]` is a new `list`, `cui2names[cui]` a new `set`. Use the methods of the CDB
+to change the maps, they move the maps back into dictionaries first.
+"""
+import copy
+import zlib
+import numpy as np
+from collections.abc import Mapping, MutableMapping, Set
+
+from medcat.preprocessing.cleaners import get_snames
+
+
+def _index_dtype(size):
+    return np.int32 if size < 2**31 else np.int64
+
+
+def _encode(string):
+    return string.encode('utf-8', 'surrogatepass')
+
+
+class StringTable(object):
+    r''' Immutable table of distinct strings, each string has an integer id. The strings are stored
+    as one UTF-8 blob with offsets, the lookup from a string to its id uses a hash table (crc32)
+    kept in two arrays.
+
+    Args:
+        strings (`Iterable[str]`):
+            Distinct strings, the id of each one is its position.
+    '''
+    def __init__(self, strings):
+        encoded = [_encode(string) for string in strings]
+        self._blob = b''.join(encoded)
+        self._offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum(np.array([len(b) for b in encoded], dtype=np.int64), out=self._offsets[1:])
+
+        # Bucket of each string in a table with at least as many buckets as strings,
+        #the ids in each bucket are stored next to each other in _order
+        n_buckets = 1
+        while n_buckets < len(encoded):
+            n_buckets *= 2
+        self._mask = n_buckets - 1
+        buckets = np.array([zlib.crc32(b) & self._mask for b in encoded], dtype=np.int64)
+        dtype = _index_dtype(len(encoded) + 1)
+        self._order = np.argsort(buckets, kind='stable').astype(dtype)
+        self._bucket_ptr = np.zeros(n_buckets + 1, dtype=dtype)
+        np.cumsum(np.bincount(buckets, minlength=n_buckets), out=self._bucket_ptr[1:])
+        self._init_views()
+
+    def _init_views(self):
+        # Indexing a memoryview returns python ints and is a lot faster than indexing numpy arrays
+        self._offsets_view = memoryview(self._offsets)
+        self._order_view = memoryview(self._order)
+        self._bucket_ptr_view = memoryview(self._bucket_ptr)
+
+    def __getstate__(self):
+        return {k: v for k, v in self.__dict__.items() if not k.endswith('_view')}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._init_views()
+
+    def index(self, string):
+        r''' Id of `string`, or -1 if it is not in the table.
+        '''
+        if not isinstance(string, str):
+            return -1
+        key = _encode(string)
+        bucket = zlib.crc32(key) & self._mask
+        bucket_ptr = self._bucket_ptr_view
+        offsets = self._offsets_view
+        for i in range(bucket_ptr[bucket], bucket_ptr[bucket + 1]):
+            ind = self._order_view[i]
+            start = offsets[ind]
+            if offsets[ind + 1] - start == len(key) and self._blob[start:start + len(key)] == key:
+                return ind
+        return -1
+
+    def __getitem__(self, ind):
+        return self._blob[self._offsets_view[ind]:self._offsets_view[ind + 1]].decode('utf-8', 'surrogatepass')
+
+    def strings(self, inds):
+        r''' The strings for a sequence of ids.
+        '''
+        offsets = self._offsets_view
+        blob = self._blob
+        return [blob[offsets[ind]:offsets[ind + 1]].decode('utf-8', 'surrogatepass') for ind in inds]
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __iter__(self):
+        return iter(self.strings(range(len(self))))
+
+    @property
+    def nbytes(self):
+        return len(self._blob) + self._offsets.nbytes + self._order.nbytes + self._bucket_ptr.nbytes
+
+
+class _CSR(object):
+    r''' Rows of ids for some of the ids in a key table. `keys` holds the ids of the keys with a row,
+    in the order in which the keys are iterated.
+    '''
+    def __init__(self, n_keys, rows, intern):
+        self.keys = np.array([key for key, _ in rows], dtype=_index_dtype(n_keys))
+        self.has_key = np.zeros(n_keys, dtype=bool)
+        self.has_key[self.keys] = True
+        lengths = np.zeros(n_keys, dtype=np.int64)
+        lengths[self.keys] = np.array([len(values) for _, values in rows], dtype=np.int64)
+        self.indptr = np.zeros(n_keys + 1, dtype=np.int64)
+        np.cumsum(lengths, out=self.indptr[1:])
+        # Values are stored in the order of the key ids, not of iteration
+        ordered = sorted(rows, key=lambda row: row[0])
+        self.indices = np.array([intern(value) for _, values in ordered for value in values], dtype=np.int32)
+        self.indptr = self.indptr.astype(_index_dtype(len(self.indices) + 1))
+        self._init_views()
+
+    def _init_views(self):
+        self._has_key_view = memoryview(self.has_key)
+        self._indptr_view = memoryview(self.indptr)
+        self._indices_view = memoryview(self.indices)
+
+    def __getstate__(self):
+        return {k: v for k, v in self.__dict__.items() if not k.endswith('_view')}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._init_views()
+
+    def row(self, key):
+        return self._indptr_view[key], self._indptr_view[key + 1]
+
+    def gather(self, keys):
+        r''' All values in the rows of `keys` (an array of ids), concatenated.
+        '''
+        starts = self.indptr[keys].astype(np.int64)
+        lengths = self.indptr[keys + 1] - starts
+        if not len(lengths):
+            return self.indices[:0]
+        # Position of each value in indices: start of its row plus its position within the row
+        row_offsets = starts - (np.cumsum(lengths) - lengths)
+        return self.indices[np.arange(lengths.sum()) + np.repeat(row_offsets, lengths)]
+
+    def restricted(self, keys):
+        r''' The same rows, but only for `keys` (a sorted array of distinct ids). The arrays with the
+        rows are shared, not copied.
+        '''
+        csr = copy.copy(self)
+        csr.keys = keys[self.has_key[keys]].astype(self.keys.dtype)
+        csr.has_key = np.zeros(len(self.has_key), dtype=bool)
+        csr.has_key[csr.keys] = True
+        csr._init_views()
+        return csr
+
+    @property
+    def nbytes(self):
+        return self.keys.nbytes + self.has_key.nbytes + self.indptr.nbytes + self.indices.nbytes
+
+
+class _IdMap(Mapping):
+    r''' Read-only view of a map from strings to a collection (`list` or `set`) of strings.
+    '''
+    def __init__(self, maps, key_table, value_table, csr, container):
+        self.maps = maps
+        self._keys = key_table
+        self._values = value_table
+        self._csr = csr
+        self._container = container
+
+    def _key_id(self, key):
+        ind = self._keys.index(key)
+        if ind < 0 or not self._csr._has_key_view[ind]:
+            return -1
+        return ind
+
+    def __getitem__(self, key):
+        ind = self._key_id(key)
+        if ind < 0:
+            raise KeyError(key)
+        return self._value(*self._csr.row(ind))
+
+    def __contains__(self, key):
+        return self._key_id(key) >= 0
+
+    def _iter_items(self):
+        # Same as items(), without looking up every key in the hash table
+        indptr = self._csr.indptr.tolist()
+        for ind, key in zip(self._csr.keys.tolist(), self):
+            yield key, self._value(indptr[ind], indptr[ind + 1])
+
+    def _value(self, start, end):
+        return self._container(self._values.strings(self._csr.indices[start:end].tolist()))
+
+    def __iter__(self):
+        return iter(self._keys.strings(self._csr.keys.tolist()))
+
+    def __len__(self):
+        return len(self._csr.keys)
+
+    def __repr__(self):
+        return "<{} with {} keys>".format(type(self).__name__, len(self))
+
+
+class _NameStatuses(MutableMapping):
+    r''' View of `name2cuis2status[name]`, the status of a CUI that is already linked to the name can be changed.
+    '''
+    __slots__ = ('_maps', '_start', '_end')
+
+    def __init__(self, maps, start, end):
+        self._maps = maps
+        self._start = start
+        self._end = end
+
+    def _position(self, cui):
+        ind = self._maps.cuis.index(cui)
+        if ind >= 0:
+            indices = self._maps._status_csr._indices_view
+            for position in range(self._start, self._end):
+                if indices[position] == ind:
+                    return position
+        return -1
+
+    def __getitem__(self, cui):
+        position = self._position(cui)
+        if position < 0:
+            raise KeyError(cui)
+        return self._maps._status_values[self._maps._status_codes[position]]
+
+    def __setitem__(self, cui, status):
+        position = self._position(cui)
+        if position < 0:
+            raise TypeError("CUI {} is not linked to this name, compact name maps can not get new links".format(cui))
+        self._maps._status_codes[position] = self._maps._status_code(status)
+
+    def __delitem__(self, cui):
+        raise TypeError("Compact name maps are read-only, use the CDB to remove names")
+
+    def __iter__(self):
+        return iter(self._maps.cuis.strings(self._maps._status_csr.indices[self._start:self._end].tolist()))
+
+    def __len__(self):
+        return self._end - self._start
+
+    def __repr__(self):
+        return repr(dict(self))
+
+
+class _StatusMap(_IdMap):
+    r''' Read-only view of `name2cuis2status`, the values are `_NameStatuses`.
+    '''
+    def __init__(self, maps):
+        super().__init__(maps, maps.names, maps.cuis, maps._status_csr, None)
+
+    def _value(self, start, end):
+        return _NameStatuses(self.maps, start, end)
+
+
+class _IdSet(Set):
+    r''' Read-only view of a set of strings from a `StringTable`.
+    '''
+    def __init__(self, maps, table, ids):
+        self.maps = maps
+        self._table = table
+        self._ids = np.array(ids, dtype=_index_dtype(len(table)))
+        self._mask = np.zeros(len(table), dtype=bool)
+        self._mask[self._ids] = True
+        self._init_views()
+
+    def _init_views(self):
+        self._mask_view = memoryview(self._mask)
+
+    def __getstate__(self):
+        return {k: v for k, v in self.__dict__.items() if not k.endswith('_view')}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._init_views()
+
+    def __contains__(self, string):
+        ind = self._table.index(string)
+        return ind >= 0 and self._mask_view[ind]
+
+    def __iter__(self):
+        return iter(self._table.strings(self._ids.tolist()))
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __repr__(self):
+        return "<{} with {} strings>".format(type(self).__name__, len(self))
+
+    @property
+    def nbytes(self):
+        return self._ids.nbytes + self._mask.nbytes
+
+
+def is_compact(name_map):
+    r''' Is `name_map` a view of `CompactNameMaps`.
+    '''
+    return isinstance(name_map, (_IdMap, _IdSet))
+
+
+def expand(name_map):
+    r''' Copy a view of `CompactNameMaps` into the dictionary or set used by the CDB, anything else
+    is returned as it is.
+    '''
+    if isinstance(name_map, _IdSet):
+        return set(name_map)
+    elif isinstance(name_map, _StatusMap):
+        return {name: dict(cui2status) for name, cui2status in name_map._iter_items()}
+    elif isinstance(name_map, _IdMap):
+        return dict(name_map._iter_items())
+    return name_map
+
+
+def expand_all(fields):
+    r''' `expand` for all values of `fields` (e.g. the fields of a CDB that will be pickled). Equal strings in the
+    expanded maps and in the keys of the other dictionaries are one object, as in the maps of a CDB that was never
+    compact, so that they are pickled only once.
+
+    Args:
+        fields (`Dict[str, Any]`):
+            From a field name to its value.
+
+    Return:
+        `Dict[str, Any]` with the same keys and the views of `CompactNameMaps` replaced by dictionaries and sets.
+    '''
+    strings = {}
+    for value in fields.values():
+        if isinstance(value, dict):
+            for key in value:
+                if isinstance(key, str):
+                    strings.setdefault(key, key)
+
+    def interned(value):
+        if isinstance(value, str):
+            return strings.setdefault(value, value)
+        elif isinstance(value, dict):
+            return {interned(k): interned(v) for k, v in value.items()}
+        elif isinstance(value, list):
+            return [interned(v) for v in value]
+        return {interned(v) for v in value}
+
+    return {field: interned(expand(value)) if is_compact(value) else value for field, value in fields.items()}
+
+
+class CompactNameMaps(object):
+    r''' The name maps of a CDB with interned strings and CSR arrays. The attributes `name2cuis`,
+    `name2cuis2status`, `snames`, `cui2names` and `cui2snames` are views that can be used in
+    place of the CDB dictionaries.
+
+    Args:
+        name2cuis (`Dict[str, List[str]]`):
+        name2cuis2status (`Dict[str, Dict[str, str]]`):
+        snames (`Set[str]`):
+        cui2names (`Dict[str, Set[str]]`):
+        cui2snames (`Dict[str, Set[str]]`):
+            The maps as they are in the CDB, views of another `CompactNameMaps` can also be used.
+
+    Properties:
+        names (`StringTable`):
+            All names and snames.
+        cuis (`StringTable`):
+            All CUIs.
+    '''
+    def __init__(self, name2cuis, name2cuis2status, snames, cui2names, cui2snames):
+        name2cuis = [(name, list(cuis)) for name, cuis in name2cuis.items()]
+        name2cuis2status = [(name, list(cui2status.items())) for name, cui2status in name2cuis2status.items()]
+        cui2names = [(cui, list(names)) for cui, names in cui2names.items()]
+        cui2snames = [(cui, list(names)) for cui, names in cui2snames.items()]
+
+        name2ind = {}
+        cui2ind = {}
+        for name, cuis in name2cuis:
+            name2ind.setdefault(name, len(name2ind))
+            for cui in cuis:
+                cui2ind.setdefault(cui, len(cui2ind))
+        for name, cui2status in name2cuis2status:
+            name2ind.setdefault(name, len(name2ind))
+            for cui, _ in cui2status:
+                cui2ind.setdefault(cui, len(cui2ind))
+        for cui, names in cui2names + cui2snames:
+            cui2ind.setdefault(cui, len(cui2ind))
+            for name in names:
+                name2ind.setdefault(name, len(name2ind))
+        for name in snames:
+            name2ind.setdefault(name, len(name2ind))
+
+        self.names = StringTable(name2ind.keys())
+        self.cuis = StringTable(cui2ind.keys())
+        n_names = len(name2ind)
+        n_cuis = len(cui2ind)
+
+        self._name2cuis_csr = _CSR(n_names, [(name2ind[name], cuis) for name, cuis in name2cuis], cui2ind.__getitem__)
+        self._status_values = []
+        self._status_csr = _CSR(n_names, [(name2ind[name], [cui for cui, _ in cui2status]) for name, cui2status in name2cuis2status],
+                                cui2ind.__getitem__)
+        self._status_codes = np.array([self._status_code(status) for _, cui2status in sorted(name2cuis2status, key=lambda row: name2ind[row[0]])
+                                       for _, status in cui2status], dtype=np.uint8)
+        self._cui2names_csr = _CSR(n_cuis, [(cui2ind[cui], names) for cui, names in cui2names], name2ind.__getitem__)
+        self._cui2snames_csr = _CSR(n_cuis, [(cui2ind[cui], names) for cui, names in cui2snames], name2ind.__getitem__)
+
+        self._make_views([name2ind[name] for name in snames])
+
+    def _make_views(self, sname_ids):
+        self.name2cuis = _IdMap(self, self.names, self.cuis, self._name2cuis_csr, list)
+        self.name2cuis2status = _StatusMap(self)
+        self.snames = _IdSet(self, self.names, sname_ids)
+        self.cui2names = _IdMap(self, self.cuis, self.names, self._cui2names_csr, set)
+        self.cui2snames = _IdMap(self, self.cuis, self.names, self._cui2snames_csr, set)
+
+    def filter_by_cui(self, cuis_to_keep, separator):
+        r''' Subset the maps in the same way as `CDB.filter_by_cui`, using the id based indices: the names
+        of `cuis_to_keep` (`cui2names`) and all CUIs linked to those names (`name2cuis`) are kept. The string
+        tables and rows are shared with these maps, so the time depends only on the number of kept concepts.
+        If there is no `cui2snames` the snames are recomputed from the kept names.
+
+        Args:
+            cuis_to_keep (`Iterable[str]`):
+                CUIs that will be kept.
+            separator (`str`):
+                The separator used to join tokens of names (`config.general['separator']`).
+
+        Return:
+            maps (`CompactNameMaps`):
+                The subset, the views of it replace the name maps of the CDB.
+            cuis (`List[str]`):
+                All kept CUIs.
+        '''
+        cui_ids = np.unique(np.array([ind for ind in map(self.cuis.index, cuis_to_keep) if ind >= 0], dtype=np.int64))
+        name_ids = np.unique(self._cui2names_csr.gather(cui_ids)).astype(np.int64)
+        all_cui_ids = np.unique(self._name2cuis_csr.gather(name_ids)).astype(np.int64)
+
+        maps = copy.copy(self)
+        maps._name2cuis_csr = self._name2cuis_csr.restricted(name_ids)
+        maps._status_csr = self._status_csr.restricted(name_ids)
+        maps._cui2names_csr = self._cui2names_csr.restricted(all_cui_ids)
+        maps._cui2snames_csr = self._cui2snames_csr.restricted(all_cui_ids)
+        if len(self._cui2snames_csr.keys):
+            maps._make_views(np.unique(self._cui2snames_csr.gather(cui_ids)))
+        else:
+            snames = set()
+            for name in self.names.strings(name_ids.tolist()):
+                snames.update(get_snames(name.split(separator), separator))
+            sname_ids = [self.names.index(sname) for sname in snames]
+            if min(sname_ids, default=0) < 0:
+                # Some snames are not in the string table, build new maps for the (small) subset
+                maps._make_views([])
+                maps = CompactNameMaps(maps.name2cuis, maps.name2cuis2status, snames, maps.cui2names, maps.cui2snames)
+            else:
+                maps._make_views(sname_ids)
+        return maps, self.cuis.strings(all_cui_ids.tolist())
+
+    def _status_code(self, status):
+        if status not in self._status_values:
+            if len(self._status_values) > 255:
+                raise ValueError("Too many different name statuses")
+            self._status_values.append(status)
+        return self._status_values.index(status)
+
+    def to_dicts(self):
+        r''' The maps as dictionaries and sets, in the form used by the CDB.
+
+        Return:
+            name2cuis, name2cuis2status, snames, cui2names, cui2snames
+        '''
+        return (expand(self.name2cuis), expand(self.name2cuis2status), expand(self.snames),
+                expand(self.cui2names), expand(self.cui2snames))
+
+    @property
+    def nbytes(self):
+        r''' Memory used by the string tables and arrays.
+        '''
+        return self.names.nbytes + self.cuis.nbytes + self._name2cuis_csr.nbytes + self._status_csr.nbytes + \
+               self._status_codes.nbytes + self._cui2names_csr.nbytes + self._cui2snames_csr.nbytes + self.snames.nbytes
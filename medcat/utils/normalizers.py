@@ -1,18 +1,37 @@
+import os
 import re
+from collections import Counter
+import logging
 import spacy
 from medcat.pipeline.pipe_runner import PipeRunner
+from medcat.utils.cache import LRUCache
+
+log = logging.getLogger(__name__)
 
 
 CONTAINS_NUMBER = re.compile('[0-9]+')
+# Letters used by the spell checker to replace and insert characters
+LETTERS = 'abcdefghijklmnopqrstuvwxyz'
 
 
 class BasicSpellChecker(object):
     r'''
+    Args:
+        cdb_vocab (`Dict[str, int]`):
+            Words and their counts, usually `cdb.vocab`.
+        config (`medcat.config.Config`):
+            Global config for medcat.
+        data_vocab (`medcat.vocab.Vocab`, optional):
+            Vocabulary of the data.
+        index (`medcat.utils.spell_index.SymSpellIndex`, optional):
+            Index over `cdb_vocab`, if set the candidates are looked up in it instead of being
+            found by generating all possible edits of a word.
     '''
-    def __init__(self, cdb_vocab, config, data_vocab=None):
+    def __init__(self, cdb_vocab, config, data_vocab=None, index=None):
         self.vocab = cdb_vocab
         self.config = config
         self.data_vocab = data_vocab
+        self.index = index
 
 
     def P(self, word):
@@ -45,6 +64,10 @@ class BasicSpellChecker(object):
 
     def candidates(self, word):
         "Generate possible spelling corrections for word."
+        max_distance = 2 if self.config.general['spell_check_deep'] else 1
+        if self.index is not None and self.index.max_distance >= max_distance:
+            return self.indexed_candidates(word, max_distance)
+
         if self.config.general['spell_check_deep']:
             # This will check a two letter edit distance
             return (self.known([word]) or self.known(self.edits1(word)) or self.known(self.edits2(word)) or [word])
@@ -53,6 +76,75 @@ class BasicSpellChecker(object):
             return (self.known([word]) or self.known(self.edits1(word))  or [word])
 
 
+    def indexed_candidates(self, word, max_distance):
+        "Same as `candidates`, but the words within `max_distance` edits are found with the index."
+        if word in self.vocab:
+            return {word}
+        candidates = [w for w in self.index.lookup(word, max_distance) if w in self.vocab]
+        for distance in range(1, max_distance + 1):
+            known = set(w for w in candidates if self.within_distance(word, w, distance))
+            if known:
+                return known
+        return [word]
+
+
+    def within_distance(self, word, other, distance):
+        "Can `word` be changed into `other` with at most `distance` of the edits made by `edits1`."
+        # Edits are only needed where the words differ
+        start = 0
+        while start < len(word) and start < len(other) and word[start] == other[start]:
+            start += 1
+        end = 0
+        while end < len(word) - start and end < len(other) - start and word[-1 - end] == other[-1 - end]:
+            end += 1
+        word = word[start:len(word) - end]
+        other = other[start:len(other) - end]
+
+        if word == other:
+            return True
+        if distance == 0 or abs(len(word) - len(other)) > distance:
+            return False
+        if self._one_edit(word, other):
+            return True
+        if distance == 1:
+            return False
+
+        # An edit removes at most one character from a word and adds at most one
+        diff = Counter(word)
+        diff.subtract(other)
+        if sum(cnt for cnt in diff.values() if cnt > 0) > distance or -sum(cnt for cnt in diff.values() if cnt < 0) > distance:
+            return False
+        if distance == 2:
+            # Is there a word one edit away from both
+            return not self.edits1(word).isdisjoint(self._reverse_edits1(other, LETTERS + word))
+        return any(self.within_distance(w, other, distance - 1) for w in self.edits1(word))
+
+
+    @staticmethod
+    def _one_edit(word, other):
+        # `word` and `other` differ in the first and the last character
+        if len(word) == len(other) == 1:
+            return other in LETTERS
+        if len(word) == len(other) == 2:
+            return word[0] == other[1] and word[1] == other[0]
+        if len(word) == 1 and len(other) == 0:
+            return True
+        if len(word) == 0 and len(other) == 1:
+            return other in LETTERS
+        return False
+
+
+    @staticmethod
+    def _reverse_edits1(word, letters):
+        "All words that `edits1` changes into `word` with one edit, `letters` are the characters they can have."
+        splits     = [(word[:i], word[i:])    for i in range(len(word) + 1)]
+        undeletes  = [L + c + R               for L, R in splits for c in letters]
+        transposes = [L + R[1] + R[0] + R[2:] for L, R in splits if len(R)>1]
+        unreplaces = [L + c + R[1:]           for L, R in splits if R and R[0] in LETTERS for c in letters]
+        uninserts  = [L + R[1:]               for L, R in splits if R and R[0] in LETTERS]
+        return set(undeletes + transposes + unreplaces + uninserts)
+
+
     def known(self, words):
         "The subset of `words` that appear in the dictionary of WORDS."
         return set(w for w in words if w in self.vocab)
@@ -60,7 +152,7 @@ class BasicSpellChecker(object):
 
     def edits1(self, word):
         "All edits that are one edit away from `word`."
-        letters    = 'abcdefghijklmnopqrstuvwxyz'
+        letters    = LETTERS
         splits     = [(word[:i], word[i:])    for i in range(len(word) + 1)]
         deletes    = [L + R[1:]               for L, R in splits if R]
         transposes = [L + R[1] + R[0] + R[2:] for L, R in splits if len(R)>1]
@@ -86,18 +178,40 @@ class TokenNormalizer(PipeRunner):
     Args:
         config
         spell_checker
+        nlp (`spacy.language.Language`, optional):
+            The pipeline this normalizer is part of, its spacy components (tagger, lemmatizer, ...) are used to
+            lemmatize spelling corrections. If not set the spacy model from the config is loaded for that.
     '''
 
     # Custom pipeline component name
     name = 'token_normalizer'
+    # Returned by the spell cache for words that are not in it
+    _no_fix = object()
 
-    def __init__(self, config, spell_checker=None):
+    def __init__(self, config, spell_checker=None, nlp=None):
         self.config = config
         self.spell_checker = spell_checker
-        self.nlp = spacy.load(config.general['spacy_model'], disable=config.general['spacy_disabled_components'])
+        if nlp is None:
+            nlp = spacy.load(config.general['spacy_model'], exclude=config.general['spacy_disabled_components'])
+        # Only the tokenizer and the spacy components are kept, MedCAT components are not needed for
+        #lemmatization and would make this component expensive to pickle.
+        self._tokenizer = nlp.tokenizer
+        self._lemma_pipes = [proc for _, proc in nlp.pipeline if not isinstance(proc, PipeRunner)]
+        # From a misspelled word (token.lower_) to the norm of its correction, None if it has no correction
+        self.spell_cache = LRUCache(max_size=config.general.get('spell_check_cache_size', 100000))
+        self._spell_cache_key = None
+        cache_path = config.general.get('spell_check_cache_path', None)
+        if spell_checker is not None and cache_path is not None and os.path.exists(cache_path):
+            self.spell_cache.load(cache_path)
+            self._spell_cache_key = self._get_spell_cache_key()
         super().__init__(self.config.general['workers'])
 
     def __call__(self, doc):
+        if self.config.general['spell_check']:
+            self._check_spell_cache()
+        # From a misspelled word to its correction and the tokens with that word
+        to_lemmatize = {}
+
         for token in doc:
             if len(token.lower_) < self.config.preprocessing['min_len_normalize']:
                 token._.norm = token.lower_
@@ -114,11 +228,62 @@ class TokenNormalizer(PipeRunner):
                 # Fix the token if necessary
                 if len(token.text) >= self.config.general['spell_check_len_limit'] and not token._.is_punct \
                         and token.lower_ not in self.spell_checker and not CONTAINS_NUMBER.search(token.lower_):
-                    fix = self.spell_checker.fix(token.lower_)
-                    if fix is not None:
-                        tmp = self.nlp(fix)[0]
-                        if len(token.lower_) < self.config.preprocessing['min_len_normalize']:
-                            token._.norm = tmp.lower_
+                    if token.lower_ in to_lemmatize:
+                        to_lemmatize[token.lower_][1].append(token)
+                        continue
+                    norm = self.spell_cache.get(token.lower_, self._no_fix)
+                    if norm is self._no_fix:
+                        fix = self.spell_checker.fix(token.lower_)
+                        if fix is None:
+                            self.spell_cache[token.lower_] = None
                         else:
-                            token._.norm = tmp.lemma_.lower()
+                            # Corrections are lemmatized together once the whole doc was checked
+                            to_lemmatize[token.lower_] = (fix, [token])
+                    elif norm is not None:
+                        token._.norm = norm
+
+        if to_lemmatize:
+            fixed_tokens = self._lemmatize([fix for fix, _ in to_lemmatize.values()])
+            for (word, (_, tokens)), fixed_token in zip(to_lemmatize.items(), fixed_tokens):
+                if len(word) < self.config.preprocessing['min_len_normalize']:
+                    norm = fixed_token.lower_
+                else:
+                    norm = fixed_token.lemma_.lower()
+                self.spell_cache[word] = norm
+                for token in tokens:
+                    token._.norm = norm
         return doc
+
+    def _lemmatize(self, words):
+        r''' Run the spacy components of the pipeline on `words` in one pass, returns the first token of each word.
+        '''
+        docs = (self._tokenizer(word) for word in words)
+        for proc in self._lemma_pipes:
+            docs = proc.pipe(docs) if hasattr(proc, 'pipe') else map(proc, docs)
+        return [doc[0] for doc in docs]
+
+    def _get_spell_cache_key(self):
+        return (len(self.spell_checker.vocab), self.config.general['spell_check_deep'],
+                self.config.preprocessing['min_len_normalize'])
+
+    def _check_spell_cache(self):
+        # Corrections can change if words are added to the CDB or the config is changed
+        key = self._get_spell_cache_key()
+        if key != self._spell_cache_key:
+            if self._spell_cache_key is not None:
+                log.debug("The spell checker or its config has changed, clearing the spell cache")
+            self.spell_cache.clear()
+            self._spell_cache_key = key
+
+    def save_spell_cache(self, path=None):
+        r''' Save the spell cache, so that other processes (or the next run) can start with it. The cache is
+        loaded automatically when the normalizer is created if `config.general['spell_check_cache_path']` is set.
+
+        Args:
+            path (`str`, optional):
+                Where to save the cache, defaults to `config.general['spell_check_cache_path']`.
+        '''
+        path = path if path is not None else self.config.general.get('spell_check_cache_path', None)
+        if path is None:
+            raise ValueError("No path given and config.general['spell_check_cache_path'] is not set")
+        self.spell_cache.save(path)
@@ -0,0 +1,57 @@
+""" Helpers used to share the read-only parts of a model (CDB/Vocab arrays) with worker processes.
+
+Workers are started with `fork`, so in theory they share all memory of the parent copy-on-write. In practice
+every page that holds a Python object is copied as soon as the worker touches the object (reference counts,
+garbage collector headers). Arrays packed into one buffer outside of the Python heap and a frozen
+garbage collector keep those pages shared.
+"""
+import gc
+import mmap
+import logging
+import numpy as np
+from contextlib import contextmanager
+
+log = logging.getLogger(__name__)
+
+
+def to_shared_array(array):
+    r''' Copy `array` into an anonymous shared memory mapping. Processes forked afterwards use the same physical
+    memory instead of copy-on-write pages. The returned array is read-only, code that has to change it must
+    take a private copy (`np.array(shared)`).
+
+    Args:
+        array (`np.array`):
+            The array to be shared.
+
+    Return:
+        shared (`np.array`):
+            Read-only array with the same content backed by shared memory.
+    '''
+    array = np.ascontiguousarray(array)
+    if array.nbytes == 0:
+        shared = array.copy()
+    else:
+        buffer = mmap.mmap(-1, array.nbytes)
+        shared = np.frombuffer(buffer, dtype=array.dtype, count=array.size).reshape(array.shape)
+        shared[...] = array
+    shared.flags.writeable = False
+    return shared
+
+
+@contextmanager
+def frozen_gc():
+    r''' Move all objects that exist now into the permanent generation of the garbage collector while the
+    context is active. Worker processes forked inside the context will not touch (and copy) the memory of
+    those objects when collecting garbage.
+    '''
+    if not hasattr(gc, 'freeze'):
+        yield
+        return
+
+    gc.collect()
+    gc.freeze()
+    log.debug("Frozen {} objects for worker processes".format(gc.get_freeze_count()))
+    try:
+        yield
+    finally:
+        gc.unfreeze()
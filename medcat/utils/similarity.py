@@ -0,0 +1,247 @@
+""" Index used by `CDB.most_similar` to find the concepts with the most similar context vectors.
+
+The index keeps the unit length vectors of one context type in one float32 matrix, plus the training counts and
+the positions of the concepts of each type id, so a query is a matrix product and `np.argpartition`. Optionally the
+vectors are clustered with spherical k-means into `n_lists` inverted lists (IVF, `build_ivf`) and a query only scores
+the concepts in the `n_probe` lists with the closest centroids - approximate, but much faster for large CDBs.
+
+The index is not pickled with the CDB, it is built on first use or saved into its own directory (`save`/`load`,
+used by the directory format of the CDB).
+"""
+import os
+import json
+import numpy as np
+
+from medcat.utils.matutils import unitvec
+from medcat.utils.context_vectors import ContextVectorStore
+from medcat.utils.cdb_storage import _save_npy
+
+# Rows of the similarity matrix calculated at once
+_CHUNK_SIZE = 1024
+
+
+def _normalise_rows(vectors):
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return vectors / norms
+
+
+def _top(sims, topn):
+    # Positions of the topn largest values, sorted from the largest
+    if len(sims) > topn:
+        top = np.argpartition(-sims, topn - 1)[:topn]
+    else:
+        top = np.arange(len(sims))
+    return top[np.argsort(-sims[top], kind='stable')]
+
+
+class SimilarityIndex(object):
+    r''' Similarity search over the context vectors of one context type.
+
+    Args:
+        cuis (`List[str]`):
+            The concepts in the index.
+        vectors (`np.array`):
+            Unit length context vector of each concept, shape `(len(cuis), dim)`.
+        counts (`np.array`):
+            Number of training examples of each concept.
+        type_id2positions (`Dict[str, np.array]`):
+            From type id to the positions of the concepts with that type id.
+    '''
+    def __init__(self, cuis, vectors, counts, type_id2positions):
+        self.cuis = list(cuis)
+        self.vectors = vectors
+        self.counts = np.asarray(counts, dtype=np.int64)
+        self.type_id2positions = type_id2positions
+        # Set by build_ivf
+        self.centroids = None
+        self.list_ptr = None
+        self.list_positions = None
+        self.n_probe = None
+
+    @classmethod
+    def from_cdb(cls, cdb, context_type):
+        r''' Create an (exact) index from the context vectors of a CDB.
+
+        Args:
+            cdb (`medcat.cdb.CDB`):
+                The CDB.
+            context_type (`str`):
+                The context type of the vectors, e.g. `long`.
+        '''
+        store = cdb.cui2context_vectors
+        if isinstance(store, ContextVectorStore):
+            if context_type in store.present:
+                rows = np.flatnonzero(store.present[context_type][:len(store.row2cui)])
+                cuis = [store.row2cui[row] for row in rows]
+                vectors = np.array(store.normed[context_type][rows], dtype=np.float32)
+            else:
+                cuis = []
+                vectors = np.zeros((0, 0), dtype=np.float32)
+        else:
+            cuis = [cui for cui, vectors in store.items() if context_type in vectors]
+            vectors = np.array([unitvec(store[cui][context_type]) for cui in cuis], dtype=np.float32).reshape(len(cuis), -1)
+
+        type_id2positions = {}
+        for position, cui in enumerate(cuis):
+            for type_id in cdb.cui2type_ids.get(cui, {'unk'}):
+                type_id2positions.setdefault(type_id, []).append(position)
+        type_id2positions = {type_id: np.array(positions, dtype=np.int64) for type_id, positions in type_id2positions.items()}
+
+        return cls(cuis, vectors, [cdb.cui2count_train.get(cui, 0) for cui in cuis], type_id2positions)
+
+    def build_ivf(self, n_lists=None, n_probe=8, n_iter=10, seed=11):
+        r''' Cluster the vectors into inverted lists, queries will afterwards only score the concepts in
+        the `n_probe` lists closest to the query.
+
+        Args:
+            n_lists (`int`, optional):
+                Number of lists (clusters), by default the square root of the number of concepts.
+            n_probe (`int`, defaults to 8):
+                Number of lists searched for each query, more is slower and more accurate.
+            n_iter (`int`, defaults to 10):
+                Iterations of k-means.
+            seed (`int`, defaults to 11):
+                Seed for the choice of the initial centroids.
+        '''
+        n = len(self.cuis)
+        if n == 0:
+            return
+        if n_lists is None:
+            n_lists = int(np.sqrt(n))
+        n_lists = max(1, min(n_lists, n))
+        rng = np.random.RandomState(seed)
+
+        # k-means on a sample is enough to place the centroids
+        sample = self.vectors
+        if n > 256 * n_lists:
+            sample = self.vectors[np.sort(rng.choice(n, 256 * n_lists, replace=False))]
+        centroids = np.array(sample[rng.choice(len(sample), n_lists, replace=False)], dtype=np.float32)
+        for _ in range(n_iter):
+            assignment = self._nearest(sample, centroids)
+            order = np.argsort(assignment, kind='stable')
+            sizes = np.bincount(assignment, minlength=n_lists)
+            filled = sizes > 0
+            starts = (np.cumsum(sizes) - sizes)[filled]
+            centroids[filled] = np.add.reduceat(sample[order], starts, axis=0)
+            # Empty lists get a random vector
+            centroids[~filled] = sample[rng.choice(len(sample), int((~filled).sum()))]
+            centroids = _normalise_rows(centroids)
+
+        assignment = self._nearest(self.vectors, centroids)
+        self.centroids = centroids
+        self.list_positions = np.argsort(assignment, kind='stable')
+        self.list_ptr = np.zeros(n_lists + 1, dtype=np.int64)
+        np.cumsum(np.bincount(assignment, minlength=n_lists), out=self.list_ptr[1:])
+        self.n_probe = n_probe
+
+    @staticmethod
+    def _nearest(vectors, centroids):
+        return np.concatenate([np.argmax(np.dot(vectors[start:start + _CHUNK_SIZE], centroids.T), axis=1)
+                               for start in range(0, len(vectors), _CHUNK_SIZE)] or [np.zeros(0, dtype=np.int64)])
+
+    def _selected(self, type_id_filter, min_cnt):
+        # Mask of the concepts that pass the filters, None if all do
+        mask = None
+        if type_id_filter:
+            mask = np.zeros(len(self.cuis), dtype=bool)
+            for type_id in type_id_filter:
+                mask[self.type_id2positions.get(type_id, [])] = True
+        if min_cnt > 0:
+            cnt_mask = self.counts >= min_cnt
+            mask = cnt_mask if mask is None else mask & cnt_mask
+        return mask
+
+    def query(self, vectors, topn=50, type_id_filter=(), min_cnt=0):
+        r''' Find the most similar concepts for each of the query vectors.
+
+        Args:
+            vectors (`np.array`):
+                One query vector or a matrix with one query vector per row.
+            topn (`int`, defaults to 50):
+                How many concepts to return for each query.
+            type_id_filter (`List[str]`):
+                Only return concepts with one of these type ids.
+            min_cnt (`int`):
+                Only return concepts with at least this many training examples.
+
+        Return:
+            results (`List[Tuple[List[str], np.array]]`):
+                For each query the CUIs and similarities of the most similar concepts, from the most similar.
+        '''
+        queries = _normalise_rows(np.atleast_2d(np.asarray(vectors, dtype=np.float32)))
+        mask = self._selected(type_id_filter, min_cnt)
+        results = []
+        if len(self.cuis) == 0:
+            return [([], np.zeros(0, dtype=np.float32)) for _ in queries]
+
+        if self.centroids is None:
+            # Exact, one matrix product per chunk of queries
+            positions = np.arange(len(self.cuis)) if mask is None else np.flatnonzero(mask)
+            # Copying the selected vectors only pays off when the filters remove most of the concepts,
+            # otherwise the similarities are calculated for all and then selected.
+            gather = len(positions) < len(self.cuis) // 4
+            matrix = self.vectors[positions] if gather else self.vectors
+            for start in range(0, len(queries), _CHUNK_SIZE):
+                chunk_sims = np.dot(queries[start:start + _CHUNK_SIZE], matrix.T)
+                if not gather and mask is not None:
+                    chunk_sims = chunk_sims[:, positions]
+                for sims in chunk_sims:
+                    top = _top(sims, topn)
+                    results.append(([self.cuis[ind] for ind in positions[top]], sims[top]))
+        else:
+            n_probe = min(self.n_probe, len(self.centroids))
+            for query, centroid_sims in zip(queries, np.dot(queries, self.centroids.T)):
+                lists = _top(centroid_sims, n_probe)
+                candidates = np.concatenate([self.list_positions[self.list_ptr[ind]:self.list_ptr[ind + 1]] for ind in lists])
+                if mask is not None:
+                    candidates = candidates[mask[candidates]]
+                sims = np.dot(self.vectors[candidates], query)
+                top = _top(sims, topn)
+                results.append(([self.cuis[ind] for ind in candidates[top]], sims[top]))
+        return results
+
+    def save(self, path):
+        r''' Save the index into a directory, the vectors can be memory mapped by `load`.
+
+        Args:
+            path (`str`):
+                Directory where the index will be saved, created if it does not exist.
+        '''
+        os.makedirs(path, exist_ok=True)
+        _save_npy(os.path.join(path, 'vectors.npy'), self.vectors)
+        _save_npy(os.path.join(path, 'counts.npy'), self.counts)
+        _save_npy(os.path.join(path, 'cuis.npy'), np.array(self.cuis, dtype=str))
+        type_ids = list(self.type_id2positions.keys())
+        np.savez(os.path.join(path, 'type_ids.npz'), *[self.type_id2positions[type_id] for type_id in type_ids])
+        if self.centroids is not None:
+            _save_npy(os.path.join(path, 'centroids.npy'), self.centroids)
+            _save_npy(os.path.join(path, 'list_ptr.npy'), self.list_ptr)
+            _save_npy(os.path.join(path, 'list_positions.npy'), self.list_positions)
+        with open(os.path.join(path, 'index.json'), 'w') as f:
+            json.dump({'type_ids': type_ids, 'ivf': self.centroids is not None, 'n_probe': self.n_probe}, f)
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        r''' Load an index saved with `save`.
+
+        Args:
+            path (`str`):
+                Directory from which to load.
+            mmap (`bool`, defaults to `True`):
+                Memory map the vectors instead of reading them into memory.
+        '''
+        with open(os.path.join(path, 'index.json')) as f:
+            meta = json.load(f)
+        with np.load(os.path.join(path, 'type_ids.npz')) as positions:
+            type_id2positions = {type_id: positions['arr_{}'.format(ind)] for ind, type_id in enumerate(meta['type_ids'])}
+        index = cls(np.load(os.path.join(path, 'cuis.npy')).tolist(),
+                    np.load(os.path.join(path, 'vectors.npy'), mmap_mode='r' if mmap else None),
+                    np.load(os.path.join(path, 'counts.npy')),
+                    type_id2positions)
+        if meta['ivf']:
+            index.centroids = np.load(os.path.join(path, 'centroids.npy'))
+            index.list_ptr = np.load(os.path.join(path, 'list_ptr.npy'))
+            index.list_positions = np.load(os.path.join(path, 'list_positions.npy'))
+            index.n_probe = meta['n_probe']
+        return index
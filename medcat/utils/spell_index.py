@@ -0,0 +1,79 @@
+""" Symmetric delete index (as in SymSpell) over the words of the CDB vocab, used by the spell checker
+to find words within one or two edits of a misspelled word without generating all possible edits.
+"""
+import logging
+
+log = logging.getLogger(__name__)
+
+
+class SymSpellIndex(object):
+    r''' From every string that can be made by deleting up to `max_distance` characters from the first
+    `prefix_length` characters of a word, to the words that produce it. Two words within `max_distance` edits
+    of each other always share at least one such string, so a lookup only has to generate the deletes of the
+    misspelled word. The returned words are candidates, the edit distance has to be checked by the caller.
+
+    Args:
+        max_distance (`int`, defaults to 1):
+            The largest edit distance that can be looked up.
+        prefix_length (`int`, defaults to 7):
+            Only the deletes of this many characters at the start of a word are indexed, longer
+            prefixes make lookups return fewer candidates but the index gets bigger.
+    '''
+    def __init__(self, max_distance=1, prefix_length=7):
+        self.max_distance = max_distance
+        self.prefix_length = prefix_length
+        self.n_words = 0
+        self.deletes = {}
+
+    @classmethod
+    def from_cdb(cls, cdb, max_distance=1):
+        r''' Get the index over `cdb.vocab` stored in `cdb.addl_info['spell_index']`, it is built (and stored,
+        so it is saved with the CDB) if it does not exist or was built with a lower `max_distance`.
+
+        Args:
+            cdb (`medcat.cdb.CDB`):
+                The concept database.
+            max_distance (`int`, defaults to 1):
+                The largest edit distance that will be looked up.
+        '''
+        if 'spell_index' in cdb.addl_info:
+            index = cdb.addl_info['spell_index']
+            if index.max_distance >= max_distance and index.n_words == len(cdb.vocab):
+                return index
+
+        log.info("Building the spell index for {} words".format(len(cdb.vocab)))
+        index = cls(max_distance=max_distance)
+        for word in cdb.vocab:
+            index.add_word(word)
+        cdb.addl_info['spell_index'] = index
+        return index
+
+    def add_word(self, word):
+        r''' Add a new word to the index, `cdb.add_names` calls this for every word added to `cdb.vocab`.
+        '''
+        self.n_words += 1
+        for delete in self._get_deletes(word[:self.prefix_length], self.max_distance):
+            words = self.deletes.get(delete)
+            if words is None:
+                self.deletes[delete] = [word]
+            else:
+                words.append(word)
+
+    def lookup(self, word, max_distance):
+        r''' Words from the index that could be within `max_distance` edits of `word`.
+        '''
+        if max_distance > self.max_distance:
+            raise ValueError("The index was built for a max distance of {}".format(self.max_distance))
+        candidates = set()
+        for delete in self._get_deletes(word[:self.prefix_length], max_distance):
+            candidates.update(self.deletes.get(delete, ()))
+        return candidates
+
+    @staticmethod
+    def _get_deletes(word, max_distance):
+        deletes = {word}
+        last = {word}
+        for _ in range(max_distance):
+            last = {w[:i] + w[i + 1:] for w in last for i in range(len(w))}
+            deletes.update(last)
+        return deletes
@@ -0,0 +1,166 @@
+""" Readers used by `Vocab.add_words` to load words and vectors from large files in chunks. Each reader yields
+`(words, counts, vectors, has_vec)` for a chunk of lines: the words, their counts, a float32 matrix with one
+row per word (zeros for words without a vector, None if no word in the chunk has one) and a mask of the words
+that have a vector. The vectors of a whole chunk are parsed at once by the C parser of pandas.
+
+Supported formats:
+    medcat              # <word>\t<cnt>[\t<vec_space_separated>], one word per line
+    word2vec            # word2vec text format, an optional `<n_words> <dim>` header and then <word> <vec_space_separated>
+    word2vec_binary     # word2vec binary format, a `<n_words> <dim>` header and then <word> followed by dim float32s
+"""
+import io
+import itertools
+import numpy as np
+
+FORMATS = ('medcat', 'word2vec', 'word2vec_binary')
+# Bytes read at once from binary files
+_BLOCK_SIZE = 1 << 24
+
+
+def parse_vectors(lines):
+    r''' Parse vectors, one per line with the values separated by single spaces, into a float32 matrix.
+
+    Args:
+        lines (`List[str]`):
+            The vectors, all of them must have the same number of dimensions.
+
+    Return:
+        vectors (`np.array`):
+            Matrix of shape `(len(lines), dim)`.
+    '''
+    import pandas as pd
+
+    # A single character separator is parsed much faster than whitespace (`\s+`)
+    return pd.read_csv(io.StringIO("\n".join(lines)), sep=' ', header=None, dtype=np.float64, engine='c',
+                       na_filter=False, quoting=3).to_numpy(dtype=np.float32)
+
+
+def _make_chunk(words, counts, vec_lines, vec_rows, start_line, path):
+    has_vec = np.zeros(len(words), dtype=bool)
+    has_vec[vec_rows] = True
+    vectors = None
+    if vec_lines:
+        try:
+            parsed = parse_vectors(vec_lines)
+        except ValueError as e:
+            raise ValueError("Could not parse the vectors in lines {}-{} of {}: {}".format(
+                start_line + 1, start_line + len(words), path, e)) from e
+        vectors = np.zeros((len(words), parsed.shape[1]), dtype=np.float32)
+        vectors[has_vec] = parsed
+    return words, np.array(counts, dtype=np.int64).reshape(-1), vectors, has_vec
+
+
+def read_medcat(path, chunk_size=100000, words_to_keep=None):
+    r''' Read a file in the MedCAT vocab format `<word>\t<cnt>[\t<vec_space_separated>]`.
+
+    Args:
+        path (`str`):
+            Path to the file.
+        chunk_size (`int`):
+            Number of lines in a chunk.
+        words_to_keep (`Container[str]`, optional):
+            If set only these words are read, e.g. `cdb.vocab`.
+    '''
+    with open(path) as f:
+        start_line = 0
+        while True:
+            lines = list(itertools.islice(f, chunk_size))
+            if not lines:
+                break
+            words, counts, vec_lines, vec_rows = [], [], [], []
+            for line in lines:
+                parts = line.split("\t")
+                if len(parts) < 2 or (words_to_keep is not None and parts[0] not in words_to_keep):
+                    continue
+                vec = parts[2].strip() if len(parts) == 3 else ''
+                if vec:
+                    vec_rows.append(len(words))
+                    vec_lines.append(vec)
+                words.append(parts[0])
+                counts.append(int(parts[1].strip()))
+            yield _make_chunk(words, counts, vec_lines, vec_rows, start_line, path)
+            start_line += len(lines)
+
+
+def read_word2vec(path, cnt=1, chunk_size=100000, words_to_keep=None):
+    r''' Read a file in the word2vec text format (`<word> <vec_space_separated>`, the header
+    with the number of words and dimensions is optional, e.g. GloVe files do not have one).
+
+    Args:
+        path (`str`):
+            Path to the file.
+        cnt (`int`):
+            Count used for all words, the format has no counts.
+        chunk_size (`int`):
+            Number of lines in a chunk.
+        words_to_keep (`Container[str]`, optional):
+            If set only these words are read, e.g. `cdb.vocab`.
+    '''
+    with open(path, encoding='utf-8') as f:
+        first = f.readline()
+        start_line = 1
+        header = first.split()
+        if len(header) == 2 and all(part.isdigit() for part in header):
+            lines = []
+        else:
+            lines = [first]
+            start_line = 0
+        while True:
+            lines.extend(itertools.islice(f, chunk_size - len(lines)))
+            if not lines:
+                break
+            words, vec_lines = [], []
+            for line in lines:
+                parts = line.rstrip("\n").split(" ", 1)
+                if len(parts) < 2 or (words_to_keep is not None and parts[0] not in words_to_keep):
+                    continue
+                words.append(parts[0])
+                vec_lines.append(parts[1].strip())
+            yield _make_chunk(words, [cnt] * len(words), vec_lines, list(range(len(words))), start_line, path)
+            start_line += len(lines)
+            lines = []
+
+
+def read_word2vec_binary(path, cnt=1, chunk_size=100000, words_to_keep=None):
+    r''' Read a file in the word2vec binary format.
+
+    Args:
+        path (`str`):
+            Path to the file.
+        cnt (`int`):
+            Count used for all words, the format has no counts.
+        chunk_size (`int`):
+            Number of words in a chunk.
+        words_to_keep (`Container[str]`, optional):
+            If set only these words are read, e.g. `cdb.vocab`.
+    '''
+    with open(path, 'rb') as f:
+        n_words, dim = [int(part) for part in f.readline().split()]
+        vec_bytes = 4 * dim
+        buf = b''
+        pos = 0
+        n_read = 0
+        while n_read < n_words:
+            words, offsets = [], []
+            while n_read < n_words and len(words) < chunk_size:
+                end = buf.find(b' ', pos)
+                if end == -1 or end + 1 + vec_bytes > len(buf):
+                    # Not a complete entry left in the buffer, first finish the words read from it
+                    if words:
+                        break
+                    more = f.read(max(_BLOCK_SIZE, 2 * vec_bytes))
+                    if not more:
+                        raise ValueError("{} ended after {} of {} words".format(path, n_read, n_words))
+                    buf = buf[pos:] + more
+                    pos = 0
+                    continue
+                word = buf[pos:end].strip().decode('utf-8', errors='replace')
+                if words_to_keep is None or word in words_to_keep:
+                    words.append(word)
+                    offsets.append(end + 1)
+                pos = end + 1 + vec_bytes
+                n_read += 1
+
+            raw = np.frombuffer(buf, dtype=np.uint8)
+            vectors = raw[np.array(offsets, dtype=np.int64).reshape(-1, 1) + np.arange(vec_bytes)].view('<f4')
+            yield words, np.full(len(words), cnt, dtype=np.int64), vectors.astype(np.float32), np.ones(len(words), dtype=bool)
@@ -0,0 +1,109 @@
+""" Directory based on-disk format for the Vocab. Compared to the single pickled `vocab.dat` file the
+embedding matrix and the negative sampling distribution are saved as `.npy` files that are memory mapped on load
+(`np.load(mmap_mode='r')`), so loading is fast and all processes that load the same vocab share one
+copy of them in the page cache.
+
+Layout of a saved Vocab:
+    vocab_dir/
+        format.json                 # Kind (vocab), version and the number of words
+        words.txt, words.npy        # index2word: words, offsets into words.txt
+        counts.npy                  # Count of each word
+        has_vec.npy                 # Which words have a vector
+        vectors.npy                 # The embedding matrix, float32 (n_words, dim), missing if no word has a vector
+        unigram_inds.npy            # Negative sampling: words that can be sampled
+        unigram_cum_probs.npy       # Negative sampling: cumulative probabilities of the words
+        unigram_has_letters.npy     # Negative sampling: which of the words have letters
+"""
+import os
+import json
+import numpy as np
+
+from medcat.utils.cdb_storage import FORMAT_FILE, _save_npy, save_strings, load_strings, read_format, check_format
+
+FORMAT_VERSION = 2
+
+
+def is_vocab_dir(path):
+    r''' Is `path` a Vocab saved with `save_vocab_dir`.
+    '''
+    return os.path.isdir(path) and os.path.exists(os.path.join(path, FORMAT_FILE)) and read_format(path)['kind'] == 'vocab'
+
+
+def save_vocab_dir(vocab, path):
+    r''' Save a Vocab into the directory format (see the module docstring).
+
+    Args:
+        vocab (`medcat.vocab.Vocab`):
+            The Vocab to be saved.
+        path (`str`):
+            Directory where the Vocab will be saved, created if it does not exist.
+    '''
+    os.makedirs(path, exist_ok=True)
+    n_words = len(vocab.index2word)
+
+    save_strings(os.path.join(path, 'words'), vocab.index2word)
+    _save_npy(os.path.join(path, 'counts.npy'), vocab.counts[:n_words])
+    _save_npy(os.path.join(path, 'has_vec.npy'), vocab.has_vec[:n_words])
+    if vocab.vectors is not None:
+        _save_npy(os.path.join(path, 'vectors.npy'), vocab.vectors[:n_words])
+    elif os.path.exists(os.path.join(path, 'vectors.npy')):
+        os.remove(os.path.join(path, 'vectors.npy'))
+    for key in ('unigram_inds', 'unigram_cum_probs', 'unigram_has_letters'):
+        _save_npy(os.path.join(path, '{}.npy'.format(key)), getattr(vocab, key))
+
+    with open(os.path.join(path, FORMAT_FILE), 'w') as f:
+        json.dump({'kind': 'vocab',
+                   'format_version': FORMAT_VERSION,
+                   'n_words': n_words,
+                   'vectors': vocab.vectors is not None}, f)
+
+
+def load_vocab_dir(vocab_cls, path, mmap=True):
+    r''' Load a Vocab saved with `save_vocab_dir`.
+
+    Args:
+        vocab_cls (`type`):
+            The Vocab class (`medcat.vocab.Vocab`).
+        path (`str`):
+            Directory from which to load.
+        mmap (`bool`, defaults to `True`):
+            Memory map the embedding matrix and the negative sampling distribution instead of reading them into memory.
+            They are read-only, the first change of a vector takes a private copy of the matrix.
+    '''
+    meta = check_format(path, 'vocab', FORMAT_VERSION)
+
+    mmap_mode = 'r' if mmap else None
+    vocab = vocab_cls()
+    vocab.index2word = load_strings(os.path.join(path, 'words'))
+    vocab.word2ind = {word: ind for ind, word in enumerate(vocab.index2word)}
+    vocab.counts = np.load(os.path.join(path, 'counts.npy'))
+    vocab.has_vec = np.load(os.path.join(path, 'has_vec.npy'))
+    if meta['vectors']:
+        vocab.vectors = np.load(os.path.join(path, 'vectors.npy'), mmap_mode=mmap_mode)
+    if meta['format_version'] < 2:
+        # Version 1 saved a unigram table
+        vocab._unigram_from_table(np.load(os.path.join(path, 'unigram_table.npy'), mmap_mode=mmap_mode))
+    else:
+        for key in ('unigram_inds', 'unigram_cum_probs', 'unigram_has_letters'):
+            setattr(vocab, key, np.load(os.path.join(path, '{}.npy'.format(key)), mmap_mode=mmap_mode))
+
+    return vocab
+
+
+def convert_vocab(dat_path, dir_path):
+    r''' Convert a Vocab saved in the pickled single file format (`vocab.dat`) into the directory format.
+
+    Args:
+        dat_path (`str`):
+            Path to the `vocab.dat` file.
+        dir_path (`str`):
+            Directory where the converted Vocab will be saved.
+
+    Examples:
+        >>> convert_vocab('./vocab.dat', './vocab')
+        >>> vocab = Vocab.load('./vocab')
+    '''
+    from medcat.vocab import Vocab
+    vocab = Vocab.load(dat_path)
+    save_vocab_dir(vocab, dir_path)
+    return dir_path
@@ -1,26 +1,230 @@
+import os
 import numpy as np
 import pickle
+import operator
+from collections.abc import Mapping, MutableMapping
+
+from medcat.utils.shared_memory import to_shared_array
+from medcat.utils.vocab_storage import save_vocab_dir, load_vocab_dir
+from medcat.utils import vocab_loader
+
+
+class _WordItem(MutableMapping):
+    r''' View of one word in the vocab, behaves like the `{'vec': <np.array>, 'cnt': <int>, 'ind': <int>}`
+    dictionary that was stored for each word before the vocab was backed by arrays.
+    '''
+    __slots__ = ('_vocab', '_ind')
+    _KEYS = ('vec', 'cnt', 'ind')
+
+    def __init__(self, vocab, ind):
+        self._vocab = vocab
+        self._ind = ind
+
+    def __getitem__(self, key):
+        if key == 'vec':
+            return self._vocab._vec(self._ind)
+        elif key == 'cnt':
+            return int(self._vocab.counts[self._ind])
+        elif key == 'ind':
+            return self._ind
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key == 'vec':
+            self._vocab._set_vec(self._ind, value)
+        elif key == 'cnt':
+            self._vocab.counts[self._ind] = value
+        else:
+            raise KeyError("Only 'vec' and 'cnt' can be set for a word, not: {}".format(key))
+
+    def __delitem__(self, key):
+        raise TypeError("Attributes of a word can not be removed")
+
+    def __iter__(self):
+        return iter(self._KEYS)
+
+    def __len__(self):
+        return len(self._KEYS)
+
+    def __repr__(self):
+        return repr(dict(self))
+
+
+class _Words(Mapping):
+    r''' Read-only view `{word: _WordItem}` over all words in the vocab, used as `vocab.vocab`.
+    '''
+    __slots__ = ('_vocab',)
+
+    def __init__(self, vocab):
+        self._vocab = vocab
+
+    def __getitem__(self, word):
+        return _WordItem(self._vocab, self._vocab.word2ind[word])
+
+    def __contains__(self, word):
+        return word in self._vocab.word2ind
+
+    def __iter__(self):
+        return iter(self._vocab.word2ind)
+
+    def __len__(self):
+        return len(self._vocab.word2ind)
+
+
+class _VecIndex2Word(Mapping):
+    r''' Read-only view `{index: word}` over the words that have a vector, used as `vocab.vec_index2word`.
+    '''
+    __slots__ = ('_vocab',)
+
+    def __init__(self, vocab):
+        self._vocab = vocab
+
+    def __getitem__(self, ind):
+        try:
+            ind = operator.index(ind)
+        except TypeError:
+            raise KeyError(ind)
+        if ind < 0 or ind >= len(self._vocab.index2word) or not self._vocab.has_vec[ind]:
+            raise KeyError(ind)
+        return self._vocab.index2word[ind]
+
+    def __iter__(self):
+        return iter(np.flatnonzero(self._vocab.has_vec[:len(self._vocab.index2word)]).tolist())
+
+    def __len__(self):
+        return int(np.count_nonzero(self._vocab.has_vec[:len(self._vocab.index2word)]))
+
 
 class Vocab(object):
     r''' Vocabulary used to store word embeddings for context similarity
     calculation. Also used by the spell checker - but not for fixing the spelling
     only for checking is something correct.
 
+    The words are kept in arrays: each word has an index, its vector is the row with that
+    index in one float32 matrix and its count the element with that index in an array of counts.
+    Vocabs saved before (a dictionary per word) are converted when loaded.
+
     Properties:
-        vocab (dict):
-            Map from word to attributes, e.g. {'house': {'vec': <np.array>, 'cnt': <int>, ...}, ...}
-        index2word (dict):
-            From word to an index - used for negative sampling
-        vec_index2word (dict):
-            Same as index2word but only words that have vectors
-        unigram_table (dict):
-            Negative sampling.
+        word2ind (dict):
+            From word to its index.
+        index2word (list):
+            From index to word - used for negative sampling
+        vectors (np.array):
+            Matrix with the vector of each word in its row, None until the first vector is added.
+            The matrix can have more rows than there are words (unused capacity).
+        has_vec (np.array):
+            Boolean mask of the words that have a vector.
+        counts (np.array):
+            Count of each word.
+        unigram_inds (np.array):
+            Negative sampling, indices of the words that can be sampled.
+        unigram_cum_probs (np.array):
+            Negative sampling, cumulative probability of sampling each of `unigram_inds`.
+        unigram_has_letters (np.array):
+            Negative sampling, which of `unigram_inds` are words with letters (not punctuation or numbers).
     '''
     def __init__(self):
-        self.vocab = {}
-        self.index2word = {}
-        self.vec_index2word = {}
-        self.unigram_table = []
+        self.word2ind = {}
+        self.index2word = []
+        self.vectors = None
+        self.has_vec = np.zeros(0, dtype=bool)
+        self.counts = np.zeros(0, dtype=np.int64)
+        self.unigram_inds = np.zeros(0, dtype=np.int64)
+        self.unigram_cum_probs = np.zeros(0, dtype=np.float64)
+        self.unigram_has_letters = np.zeros(0, dtype=bool)
+
+
+    @property
+    def vocab(self):
+        r''' Map from word to attributes, e.g. {'house': {'vec': <np.array>, 'cnt': <int>, 'ind': <int>}, ...}
+        '''
+        return _Words(self)
+
+
+    @property
+    def vec_index2word(self):
+        r''' Same as index2word but only words that have vectors (as a read-only map from index to word).
+        '''
+        return _VecIndex2Word(self)
+
+
+    def _reserve(self, n_words):
+        capacity = len(self.counts)
+        if n_words <= capacity:
+            return
+        capacity = max(n_words, 2 * capacity, 16)
+        self.has_vec = self._resize(self.has_vec, capacity)
+        self.counts = self._resize(self.counts, capacity)
+        if self.vectors is not None:
+            self.vectors = self._resize(self.vectors, capacity)
+
+
+    @staticmethod
+    def _resize(array, capacity):
+        new_array = np.zeros((capacity,) + array.shape[1:], dtype=array.dtype)
+        new_array[:min(len(array), capacity)] = array[:capacity]
+        return new_array
+
+
+    def _vec(self, ind):
+        if self.has_vec[ind]:
+            return self.vectors[ind]
+        return None
+
+
+    def _set_vec(self, ind, vec):
+        if vec is None:
+            self.has_vec[ind] = False
+            return
+
+        vec = np.asarray(vec, dtype=np.float32).ravel()
+        self._prepare_vectors(len(vec), self.index2word[ind])
+        self.vectors[ind] = vec
+        self.has_vec[ind] = True
+
+
+    def _prepare_vectors(self, dim, word=None):
+        # Make sure the matrix exists, has dim columns and can be written to
+        if self.vectors is None:
+            self.vectors = np.zeros((len(self.counts), dim), dtype=np.float32)
+        elif self.vectors.shape[1] != dim:
+            raise ValueError("Vector{} has {} dimensions, expected {}".format(
+                " for word '{}'".format(word) if word is not None else "s", dim, self.vectors.shape[1]))
+        elif not self.vectors.flags.writeable:
+            # Shared (read-only) matrix, take a private copy before writing
+            self.vectors = np.array(self.vectors)
+
+
+    def _add_rows(self, words, counts, vectors, has_vec, replace=True):
+        # Same as add_word for each of the words, but the arrays are updated once for all of them
+        rows = np.empty(len(words), dtype=np.int64)
+        update = np.zeros(len(words), dtype=bool)
+        n_words = len(self.index2word)
+        for i, word in enumerate(words):
+            ind = self.word2ind.get(word, None)
+            if ind is None:
+                ind = len(self.index2word)
+                self.index2word.append(word)
+                self.word2ind[word] = ind
+                update[i] = True
+            elif replace and has_vec[i]:
+                update[i] = True
+            rows[i] = ind
+        self._reserve(len(self.index2word))
+
+        # Words that were repeated get what add_word would have left, the last update
+        rows, counts, has_vec = rows[update], counts[update], has_vec[update]
+        _, last = np.unique(rows[::-1], return_index=True)
+        last = len(rows) - 1 - last
+        rows, counts, has_vec = rows[last], counts[last], has_vec[last]
+
+        self.counts[rows] = counts
+        new = rows >= n_words
+        self.has_vec[rows[new]] = False
+        if has_vec.any():
+            self._prepare_vectors(vectors.shape[1])
+            self.vectors[rows[has_vec]] = vectors[update][last][has_vec]
+            self.has_vec[rows[has_vec]] = True
 
 
     def inc_or_add(self, word, cnt=1, vec=None):
@@ -35,7 +239,7 @@ class Vocab(object):
             vec (np.array):
                 Word vector
         '''
-        if word not in self.vocab:
+        if word not in self.word2ind:
             self.add_word(word, cnt, vec)
         else:
             self.inc_wc(word, cnt)
@@ -44,10 +248,8 @@ class Vocab(object):
     def remove_all_vectors(self):
         r''' Remove all stored vector representations
         '''
-        self.vec_index2word = {}
-
-        for word in self.vocab:
-            self.vocab[word]['vec'] = None
+        self.vectors = None
+        self.has_vec[:] = False
 
 
     def remove_words_below_cnt(self, cnt):
@@ -57,22 +259,18 @@ class Vocab(object):
             cnt (int):
                 Word count limit.
         '''
-        print("Words before removal: " + str(len(self.vocab)))
-        for word in list(self.vocab.keys()):
-            if self.vocab[word]['cnt'] < cnt:
-                del self.vocab[word]
-        print("Words after removal : " + str(len(self.vocab)))
-
-        # Rebuild index2word and vec_index2word
-        self.index2word = {}
-        self.vec_index2word = {}
-        for word in self.vocab.keys():
-            ind = len(self.index2word)
-            self.index2word[ind] = word
-            self.vocab[word]['ind'] = ind
+        n_words = len(self.index2word)
+        print("Words before removal: " + str(n_words))
+        keep = np.flatnonzero(self.counts[:n_words] >= cnt)
 
-            if self.vocab[word]['vec'] is not None:
-                self.vec_index2word[ind] = word
+        # Rebuild the indices and arrays
+        self.index2word = [self.index2word[ind] for ind in keep.tolist()]
+        self.word2ind = {word: ind for ind, word in enumerate(self.index2word)}
+        self.counts = self.counts[keep]
+        self.has_vec = self.has_vec[keep]
+        if self.vectors is not None:
+            self.vectors = self.vectors[keep]
+        print("Words after removal : " + str(len(self.index2word)))
 
 
     def inc_wc(self, word, cnt=1):
@@ -84,7 +282,7 @@ class Vocab(object):
             cnt:
                 By how muhc to incrase the count
         '''
-        self.item(word)['cnt'] += cnt
+        self.counts[self.word2ind[word]] += cnt
 
 
     def add_vec(self, word, vec):
@@ -96,11 +294,7 @@ class Vocab(object):
             vec (np.array):
                 The vector to add.
         '''
-        self.vocab[word]['vec'] = vec
-
-        ind = self.vocab[word]['ind']
-        if ind not in self.vec_index2word:
-            self.vec_index2word[ind] = word
+        self._set_vec(self.word2ind[word], vec)
 
 
     def reset_counts(self, cnt=1):
@@ -110,8 +304,7 @@ class Vocab(object):
             cnt (int):
                 New count for all words in the vocab.
         '''
-        for word in self.vocab.keys():
-            self.vocab[word]['cnt'] = cnt
+        self.counts[:len(self.index2word)] = cnt
 
     def update_counts(self, tokens):
         r''' Given a list of tokens update counts for words in the vocab.
@@ -138,25 +331,22 @@ class Vocab(object):
             replace (bool):
                 will replace old vector representation
         """
-        if word not in self.vocab:
+        if word not in self.word2ind:
             ind = len(self.index2word)
-            self.index2word[ind] = word
-            item = {'vec': vec, 'cnt': cnt, 'ind': ind}
-            self.vocab[word] = item
-
+            self._reserve(ind + 1)
+            self.index2word.append(word)
+            self.word2ind[word] = ind
+            self.counts[ind] = cnt
+            self.has_vec[ind] = False
             if vec is not None:
-                self.vec_index2word[ind] = word
+                self._set_vec(ind, vec)
         elif replace and vec is not None:
-            self.vocab[word]['vec'] = vec
-            self.vocab[word]['cnt'] = cnt
-
-            # If this word didn't have a vector before
-            ind = self.vocab[word]['ind']
-            if ind not in self.vec_index2word:
-                self.vec_index2word[ind] = word
+            ind = self.word2ind[word]
+            self._set_vec(ind, vec)
+            self.counts[ind] = cnt
 
 
-    def add_words(self, path, replace=True):
+    def add_words(self, path, replace=True, fmt='medcat', words_to_keep=None, cnt=1, chunk_size=100000):
         """Adds words to the vocab from a file, the file
         is required to have the following format (vec being optional):
             <word>\t<cnt>[\t<vec_space_separated>]
@@ -164,46 +354,68 @@ class Vocab(object):
         e.g. one line: the word house with 3 dimensional vectors
             house   34444   0.3232 0.123213 1.231231
 
+        The word2vec text and binary formats are also supported (look at `medcat.utils.vocab_loader`).
+        The file is read in chunks, the vectors of each chunk are parsed at once.
+
         Args:
             path (str):
                 path to the file with words and vectors
             replace (bool):
                 existing words in the vocabulary will be replaced
+            fmt (str):
+                `medcat` for the format above, `word2vec` or `word2vec_binary`
+            words_to_keep (Container[str], optional):
+                if set only these words are added, e.g. `cdb.vocab`
+            cnt (int):
+                count of each word for the word2vec formats, they do not have counts
+            chunk_size (int):
+                number of lines (words) read at once
         """
-        with open(path) as f:
-            for line in f:
-                parts = line.split("\t")
-                word = parts[0]
-                cnt = int(parts[1].strip())
-                vec = None
-                if len(parts) == 3:
-                    vec = np.array([float(x) for x in parts[2].strip().split(" ")])
+        if fmt == 'medcat':
+            chunks = vocab_loader.read_medcat(path, chunk_size=chunk_size, words_to_keep=words_to_keep)
+        elif fmt == 'word2vec':
+            chunks = vocab_loader.read_word2vec(path, cnt=cnt, chunk_size=chunk_size, words_to_keep=words_to_keep)
+        elif fmt == 'word2vec_binary':
+            chunks = vocab_loader.read_word2vec_binary(path, cnt=cnt, chunk_size=chunk_size, words_to_keep=words_to_keep)
+        else:
+            raise ValueError("Unknown format of the words file: {}, expected one of {}".format(fmt, vocab_loader.FORMATS))
 
-                self.add_word(word, cnt, vec, replace)
+        for words, counts, vectors, has_vec in chunks:
+            self._add_rows(words, counts, vectors, has_vec, replace=replace)
 
 
-    def make_unigram_table(self, table_size=100000000):
-        r''' Make unigram table for negative sampling, look at the paper if interested
+    def make_unigram_table(self, table_size=None):
+        r''' Make the unigram distribution for negative sampling, each word with a vector is
+        sampled with a probability proportional to `cnt ** (3/4)`, look at the paper if interested
         in details.
+
+        Args:
+            table_size (int):
+                Not used, the probabilities used to be approximated by a table with this many entries.
         '''
-        freqs = []
-        self.unigram_table = []
+        inds = np.flatnonzero(self.has_vec[:len(self.index2word)])
+        self._set_unigram_distribution(inds, np.power(self.counts[inds], 3/4))
 
-        words = list(self.vec_index2word.values())
-        for word in words:
-            freqs.append(self[word])
 
-        freqs = np.array(freqs)
-        freqs = np.power(freqs, 3/4)
-        sm = np.sum(freqs)
+    def _set_unigram_distribution(self, inds, weights):
+        cum_probs = np.cumsum(weights, dtype=np.float64)
+        if len(cum_probs) == 0 or cum_probs[-1] <= 0:
+            inds = np.zeros(0, dtype=np.int64)
+            cum_probs = np.zeros(0, dtype=np.float64)
+        else:
+            cum_probs /= cum_probs[-1]
+        self.unigram_inds = np.asarray(inds, dtype=np.int64)
+        self.unigram_cum_probs = cum_probs
+        self.unigram_has_letters = np.array([self.index2word[ind].upper().isupper() for ind in self.unigram_inds.tolist()],
+                                            dtype=bool)
 
-        for ind in self.vec_index2word.keys():
-            word = self.vec_index2word[ind]
-            f_ind = words.index(word)
-            p = freqs[f_ind] / sm
-            self.unigram_table.extend([ind] * int(p * table_size))
 
-        self.unigram_table = np.array(self.unigram_table)
+    def _unigram_from_table(self, unigram_table):
+        # Vocabs saved before the distribution was used keep a table where each index is repeated
+        #according to its probability, the counts of the indices give the same distribution.
+        counts = np.bincount(np.asarray(unigram_table, dtype=np.int64))
+        inds = np.flatnonzero(counts)
+        self._set_unigram_distribution(inds, counts[inds])
 
 
     def get_negative_samples(self, n=6, ignore_punct_and_num=False):
@@ -215,19 +427,35 @@ class Vocab(object):
             ignore_punct_and_num (bool):
                 When returing words shold we skip punctuation and numbers.
         Returns:
-            inds (List[int]):
+            inds (np.array):
                 Indices for words in this vocabulary.
         '''
-        if len(self.unigram_table) == 0:
+        if len(self.unigram_cum_probs) == 0:
             raise Exception("No unigram table present, please run the function vocab.make_unigram_table() first.")
-        inds = np.random.randint(0, len(self.unigram_table), n)
-        inds = self.unigram_table[inds]
+        samples = np.searchsorted(self.unigram_cum_probs, np.random.random(n), side='right')
 
         if ignore_punct_and_num:
             # Do not return anything that does not have letters in it
-            inds = [ind for ind in inds if self.index2word[ind].upper().isupper()]
+            samples = samples[self.unigram_has_letters[samples]]
+
+        return self.unigram_inds[samples]
 
-        return inds
+
+    def share_memory(self):
+        r''' Move the matrix with the word vectors (without unused capacity) into read-only shared memory
+        and do the same for the negative sampling distribution, so that worker processes forked afterwards do not copy them.
+        '''
+        n_words = len(self.index2word)
+        # Arrays memory mapped from a file (`load(mmap=True)`) are already shared through the page cache
+        if self.vectors is not None and not isinstance(self.vectors, np.memmap):
+            self.vectors = to_shared_array(self.vectors[:n_words])
+            self.has_vec = np.array(self.has_vec[:n_words])
+            self.counts = np.array(self.counts[:n_words])
+
+        for key in ('unigram_inds', 'unigram_cum_probs', 'unigram_has_letters'):
+            array = getattr(self, key)
+            if len(array) > 0 and not isinstance(array, np.memmap):
+                setattr(self, key, to_shared_array(array))
 
 
     def __getitem__(self, word):
@@ -235,32 +463,109 @@ class Vocab(object):
 
 
     def vec(self, word):
-        return self.vocab[word]['vec']
+        return self._vec(self.word2ind[word])
 
 
     def count(self, word):
-        return self.vocab[word]['cnt']
+        return int(self.counts[self.word2ind[word]])
 
 
     def item(self, word):
-        return self.vocab[word]
+        return _WordItem(self, self.word2ind[word])
 
 
     def __contains__(self, word):
-        if word in self.vocab:
+        if word in self.word2ind:
             return True
 
         return False
 
 
-    def save(self, path):
+    def __getstate__(self):
+        # Do not save the unused capacity
+        state = dict(self.__dict__)
+        n_words = len(self.index2word)
+        state['has_vec'] = np.array(self.has_vec[:n_words])
+        state['counts'] = np.array(self.counts[:n_words])
+        if self.vectors is not None:
+            state['vectors'] = np.array(self.vectors[:n_words])
+        return state
+
+
+    def __setstate__(self, state):
+        if isinstance(state.get('vocab', None), dict):
+            state = self._convert_dict_state(state)
+        unigram_table = state.pop('unigram_table', None)
+        self.__dict__.update(state)
+        if unigram_table is not None:
+            self._unigram_from_table(unigram_table)
+
+
+    @staticmethod
+    def _convert_dict_state(state):
+        # Vocabs saved before the arrays were used keep a {'vec', 'cnt', 'ind'} dictionary per word
+        items = sorted(state['vocab'].items(), key=lambda item: item[1]['ind'])
+        index2word = [word for word, _ in items]
+        counts = np.array([item['cnt'] for _, item in items], dtype=np.int64).reshape(-1)
+        has_vec = np.array([item['vec'] is not None for _, item in items], dtype=bool).reshape(-1)
+        vectors = None
+        if has_vec.any():
+            dim = len(next(item['vec'] for _, item in items if item['vec'] is not None))
+            vectors = np.zeros((len(items), dim), dtype=np.float32)
+            vectors[has_vec] = np.array([item['vec'] for _, item in items if item['vec'] is not None], dtype=np.float32)
+
+        unigram_table = state.get('unigram_table', [])
+        if len(unigram_table) > 0:
+            # The table stores the old indices, they only differ from the new ones if some were missing
+            old2new = np.full(max(item['ind'] for _, item in items) + 1, -1, dtype=np.int64)
+            old2new[[item['ind'] for _, item in items]] = np.arange(len(items))
+            unigram_table = old2new[np.asarray(unigram_table)]
+            unigram_table = unigram_table[unigram_table >= 0]
+
+        return {'word2ind': {word: ind for ind, word in enumerate(index2word)},
+                'index2word': index2word,
+                'vectors': vectors,
+                'has_vec': has_vec,
+                'counts': counts,
+                'unigram_table': unigram_table}
+
+
+    def save(self, path, fmt='dat'):
+        r''' Save the vocab.
+
+        Args:
+            path (`str`):
+                Path to a file where the vocab will be saved
+            fmt (`str`, defaults to `dat`):
+                `dat` pickles everything into one file, `dir` saves into a directory where the
+                embedding matrix and the negative sampling distribution can be memory mapped (look at `medcat.utils.vocab_storage`).
+        '''
+        if fmt == 'dir':
+            save_vocab_dir(self, path)
+            return
+        elif fmt != 'dat':
+            raise ValueError("Unknown Vocab format: {}".format(fmt))
+
         with open(path, 'wb') as f:
-            pickle.dump(self.__dict__, f)
+            pickle.dump(self.__getstate__(), f)
 
 
     @classmethod
-    def load(cls, path):
+    def load(cls, path, mmap=True):
+        r''' Load and return a vocab.
+
+        Args:
+            path (`str`):
+                Path to a `vocab.dat` from which to load data, or to a directory
+                created with `save(path, fmt='dir')`.
+            mmap (`bool`, defaults to `True`):
+                Only for the directory format, memory map the embedding matrix and the negative sampling distribution.
+        '''
+        if os.path.isdir(path):
+            # Raises a ValueError if it is not a saved Vocab (e.g. a saved CDB)
+            return load_vocab_dir(cls, path, mmap=mmap)
+
         with open(path, 'rb') as f:
             vocab = cls()
-            vocab.__dict__ = pickle.load(f)
+            vocab.__setstate__(pickle.load(f))
         return vocab
@@ -0,0 +1,41 @@
+""" Time of `CDB.filter_by_cui` and `CDB.filtered` for a growing number of kept concepts, with the name maps as
+dictionaries and as `CompactNameMaps`, on the generated CDB of `bench_cdb_memory.py`.
+
+    python tests/benchmarks/bench_cdb_filter.py [n_concepts]
+"""
+import sys
+import copy
+import time
+import random
+
+from bench_cdb_memory import make_cdb, N_CONCEPTS
+
+N_KEPT = [100, 1000, 10000]
+
+
+def main():
+    n_concepts = int(sys.argv[1]) if len(sys.argv) > 1 else N_CONCEPTS
+    rng = random.Random(11)
+    cdb = make_cdb(n_concepts, rng)
+    compact_cdb = copy.deepcopy(cdb)
+    compact_cdb.use_compact_names()
+    cuis = list(cdb.cui2names)
+
+    for n_kept in N_KEPT:
+        cuis_to_keep = rng.sample(cuis, n_kept)
+        for name, parent in [('dictionaries', cdb), ('compact', compact_cdb)]:
+            start = time.time()
+            view = parent.filtered(cuis_to_keep)
+            took_view = time.time() - start
+
+            # filter_by_cui changes the CDB, so it works on a copy of the fields it replaces
+            target = copy.copy(parent)
+            start = time.time()
+            target.filter_by_cui(cuis_to_keep)
+            took = time.time() - start
+            print("{:6d} CUIs to keep ({} kept), {:12s}: filter_by_cui {:.3f}s, filtered {:.3f}s".format(
+                n_kept, len(view.cui2names), name, took, took_view))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+""" Compares building a CDB from a CSV row by row (`prepare_csvs(bulk=False)`), in bulk and in bulk with
+N_SHARDS processes (`n_shards`), on a synthetic SNOMED like CSV where many names are shared between concepts.
+
+    python tests/benchmarks/bench_cdb_maker.py [spacy_model]
+"""
+import os
+import sys
+import logging
+import time
+import random
+import tempfile
+import pandas
+
+from medcat.config import Config
+from medcat.cdb import CDB
+from medcat.cdb_maker import CDBMaker
+
+N_CONCEPTS = 20000
+N_SHARDS = 4
+WORDS = ["acute", "chronic", "left", "right", "upper", "lower", "kidney", "heart", "lung", "liver", "failure", "disease",
+         "infection", "injury", "pain", "fracture", "of", "the", "syndrome", "type", "2", "diabetes", "mellitus", "HTN"]
+SUFFIXES = ["", "", " (disorder)", " (finding)", " (procedure)"]
+
+
+def make_csv(path, rng):
+    rows = []
+    for i in range(N_CONCEPTS):
+        # Short names repeat a lot across concepts, like in SNOMED/UMLS
+        names = [" ".join(rng.choice(WORDS) for _ in range(rng.randint(1, 4))) + rng.choice(SUFFIXES)
+                 for _ in range(rng.randint(1, 4))]
+        rows.append({'cui': 'C{:07d}'.format(i), 'name': "|".join(names), 'ontologies': 'SNOMED',
+                     'name_status': rng.choice(['P', 'A', 'N']), 'type_ids': 'T{:03d}'.format(rng.randint(0, 120))})
+    pandas.DataFrame(rows).to_csv(path, index=False)
+
+
+def main():
+    config = Config()
+    config.general['log_level'] = logging.WARNING
+    config.general['spacy_model'] = sys.argv[1] if len(sys.argv) > 1 else 'en_core_sci_md'
+    maker = CDBMaker(config)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'concepts.csv')
+        make_csv(path, random.Random(11))
+
+        cdbs = []
+        for bulk, n_shards in [(False, 1), (True, 1), (True, N_SHARDS)]:
+            maker.cdb = CDB(config=config)
+            start = time.time()
+            cdbs.append(maker.prepare_csvs([path], full_build=True, bulk=bulk, n_shards=n_shards))
+            print("bulk={}, n_shards={}: {:.2f}s".format(bulk, n_shards, time.time() - start))
+
+    same = all(getattr(cdbs[0], field) == getattr(cdb, field) for cdb in cdbs[1:] for field in
+               ['name2cuis', 'name2cuis2status', 'snames', 'cui2names', 'cui2snames', 'cui2preferred_name', 'name_isupper',
+                'vocab', 'addl_info'])
+    print("{} concepts, {} names, same CDB: {}".format(len(cdbs[0].cui2names), len(cdbs[0].name2cuis), same))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+""" Memory used by the name maps of a CDB (`name2cuis`, `name2cuis2status`, `snames`, `cui2names`, `cui2snames`)
+as dictionaries and as `CompactNameMaps` (`cdb.use_compact_names()`), on a generated CDB with N_CONCEPTS concepts,
+and the time of the lookups done by NER in both representations.
+
+    python tests/benchmarks/bench_cdb_memory.py [n_concepts]
+"""
+import gc
+import sys
+import time
+import random
+import pickle
+import tracemalloc
+
+from medcat.config import Config
+from medcat.cdb import CDB
+from medcat.utils.name_maps import CompactNameMaps
+
+N_CONCEPTS = 200000
+N_LOOKUPS = 200000
+
+
+def make_cdb(n_concepts, rng):
+    words = ["".join(rng.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(rng.randint(3, 10))) for _ in range(20000)]
+    cdb = CDB(config=Config())
+    for i in range(n_concepts):
+        names = {}
+        for _ in range(rng.randint(1, 6)):
+            tokens = [rng.choice(words[:2000] if rng.random() < 0.5 else words) for _ in range(rng.randint(1, 5))]
+            # A new string for every row, like names built by the CDBMaker
+            name = "~".join(tokens)
+            snames = {"~".join(tokens[:k]) for k in range(1, len(tokens) + 1)}
+            names[name] = {'tokens': tokens, 'snames': snames, 'raw_name': " ".join(tokens), 'is_upper': False}
+        cdb.add_concept('C{:07d}'.format(i), names, ontologies=set(), name_status=rng.choice(['P', 'A', 'N']),
+                        type_ids={'T001'}, description='')
+    return cdb
+
+
+def traced(build):
+    gc.collect()
+    tracemalloc.start()
+    result = build()
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, size
+
+
+def time_lookups(cdb, names):
+    start = time.time()
+    for name in names:
+        if name in cdb.snames and name in cdb.name2cuis:
+            cdb.name2cuis2status[name].get(cdb.name2cuis[name][0], '')
+    return (time.time() - start) / len(names) * 1e6
+
+
+def main():
+    n_concepts = int(sys.argv[1]) if len(sys.argv) > 1 else N_CONCEPTS
+    rng = random.Random(11)
+    cdb = make_cdb(n_concepts, rng)
+    maps = [getattr(cdb, field) for field in CDB.NAME_MAPS]
+
+    # Unpickling keeps the strings that are shared between the maps shared, and the copies copies
+    data = pickle.dumps(maps)
+    maps, dict_size = traced(lambda: pickle.loads(data))
+    del data
+    compact, compact_size = traced(lambda: CompactNameMaps(*maps))
+
+    print("{:,} concepts, {:,} names, {:,} snames".format(len(cdb.cui2names), len(cdb.name2cuis), len(cdb.snames)))
+    print("Dictionaries:     {:8.1f} MB".format(dict_size / 2**20))
+    print("CompactNameMaps:  {:8.1f} MB ({:.1f}x smaller, {:.1f} MB in arrays)".format(
+        compact_size / 2**20, dict_size / compact_size, compact.nbytes / 2**20))
+
+    snames = list(cdb.snames)
+    names = [rng.choice(snames) for _ in range(N_LOOKUPS // 2)] + ["no~such~name"] * (N_LOOKUPS // 2)
+    took_dict = time_lookups(cdb, names)
+    cdb.use_compact_names()
+    took_compact = time_lookups(cdb, names)
+    print("NER lookups: {:.2f}us (dictionaries), {:.2f}us (compact)".format(took_dict, took_compact))
+    print("Same maps: {}".format(all(getattr(cdb, field) == old for field, old in zip(CDB.NAME_MAPS, maps))))
+
+
+if __name__ == '__main__':
+    main()
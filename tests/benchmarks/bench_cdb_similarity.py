@@ -0,0 +1,70 @@
+""" `CDB.most_similar` on a CDB with N_CONCEPTS concepts that have clustered random context vectors: one query at a
+time, a batch of queries (`most_similar_batch`) and the approximate IVF index, with its recall against the exact
+results.
+
+    python tests/benchmarks/bench_cdb_similarity.py [n_concepts]
+"""
+import sys
+import time
+import numpy as np
+
+from medcat.config import Config
+from medcat.cdb import CDB
+
+N_CONCEPTS = 200000
+DIM = 300
+N_CLUSTERS = 500
+N_QUERIES = 200
+TOPN = 50
+
+
+def make_cdb(n_concepts):
+    rng = np.random.RandomState(11)
+    config = Config()
+    config.linking['context_vector_store'] = 'matrix'
+    cdb = CDB(config=config)
+    cdb.use_context_vector_store(matrix=True)
+    centers = rng.randn(N_CLUSTERS, DIM)
+    vectors = centers[rng.randint(0, N_CLUSTERS, n_concepts)] + rng.randn(n_concepts, DIM)
+    for i in range(n_concepts):
+        cui = 'C{:07d}'.format(i)
+        cdb.cui2names[cui] = {'name~{}'.format(i)}
+        cdb.cui2type_ids[cui] = {'T{:03d}'.format(i % 100)}
+        cdb.cui2count_train[cui] = i % 20
+        cdb.cui2context_vectors[cui] = {'long': vectors[i]}
+    return cdb
+
+
+def main():
+    n_concepts = int(sys.argv[1]) if len(sys.argv) > 1 else N_CONCEPTS
+    cdb = make_cdb(n_concepts)
+    cuis = list(cdb.cui2names)[:N_QUERIES]
+
+    start = time.time()
+    cdb.build_similarity_index('long')
+    print("Exact index built in {:.2f}s".format(time.time() - start))
+
+    for type_id_filter in [[], ['T001', 'T002']]:
+        start = time.time()
+        exact = {cui: cdb.most_similar(cui, 'long', type_id_filter=type_id_filter, min_cnt=1, topn=TOPN) for cui in cuis}
+        took_single = time.time() - start
+        start = time.time()
+        cdb.most_similar_batch(cuis, 'long', type_id_filter=type_id_filter, min_cnt=1, topn=TOPN)
+        took_batch = time.time() - start
+        print("type_id_filter={}: {:.2f}ms per query one by one, {:.2f}ms in a batch".format(
+            type_id_filter, took_single / len(cuis) * 1000, took_batch / len(cuis) * 1000))
+
+    exact = {cui: cdb.most_similar(cui, 'long', topn=TOPN) for cui in cuis}
+    cdb.config.linking['similarity_index'] = {'type': 'ivf', 'n_lists': None, 'n_probe': 8}
+    start = time.time()
+    cdb.build_similarity_index('long')
+    print("IVF index built in {:.2f}s".format(time.time() - start))
+    start = time.time()
+    ivf = cdb.most_similar_batch(cuis, 'long', topn=TOPN)
+    took = time.time() - start
+    recall = np.mean([len(set(exact[cui]) & set(ivf[cui])) / len(exact[cui]) for cui in cuis])
+    print("IVF: {:.2f}ms per query in a batch, recall@{} {:.3f}".format(took / len(cuis) * 1000, TOPN, recall))
+
+
+if __name__ == '__main__':
+    main()
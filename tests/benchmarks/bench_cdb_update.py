@@ -0,0 +1,67 @@
+""" Compares updating a CDB to a new release of a CSV where 1% of the rows changed (`CDBMaker.update_from_csvs`)
+with building the CDB again from the new CSV.
+
+    python tests/benchmarks/bench_cdb_update.py [spacy_model]
+"""
+import os
+import sys
+import time
+import random
+import logging
+import tempfile
+import pandas
+
+from medcat.config import Config
+from medcat.cdb import CDB
+from medcat.cdb_maker import CDBMaker
+from bench_cdb_maker import make_csv, WORDS
+
+CHANGED = 0.01
+
+
+def make_release(path, new_path, rng):
+    rows = pandas.read_csv(path, dtype=str).fillna('').to_dict('records')
+    new_rows = []
+    for row in rows:
+        x = rng.random()
+        if x < CHANGED / 3:
+            continue
+        elif x < CHANGED * 2 / 3:
+            row = dict(row, name=row['name'] + "|" + " ".join(rng.choice(WORDS) for _ in range(3)))
+        new_rows.append(row)
+    for i in range(int(len(rows) * CHANGED / 3)):
+        new_rows.append({'cui': 'N{:07d}'.format(i), 'name': " ".join(rng.choice(WORDS) for _ in range(3)), 'ontologies': 'SNOMED',
+                         'name_status': 'P', 'type_ids': 'T001'})
+    pandas.DataFrame(new_rows).to_csv(new_path, index=False)
+
+
+def main():
+    config = Config()
+    config.general['log_level'] = logging.WARNING
+    config.general['spacy_model'] = sys.argv[1] if len(sys.argv) > 1 else 'en_core_sci_md'
+    maker = CDBMaker(config)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'concepts.csv')
+        new_path = os.path.join(tmp, 'concepts_new.csv')
+        rng = random.Random(11)
+        make_csv(path, rng)
+        make_release(path, new_path, rng)
+
+        maker.prepare_csvs([path], full_build=True)
+        report = maker.update_from_csvs([path], [new_path], full_build=True)
+        updated = maker.cdb
+
+        maker.cdb = CDB(config=config)
+        start = time.time()
+        rebuilt = maker.prepare_csvs([new_path], full_build=True)
+        took_rebuild = time.time() - start
+
+    print("Update:  {:.2f}s, {}".format(report['took'], report))
+    print("Rebuild: {:.2f}s ({:.1f}x)".format(took_rebuild, took_rebuild / report['took']))
+    print("Same concepts as the rebuild: {}".format(all(getattr(updated, field) == getattr(rebuilt, field) for field in
+                                                     ['cui2names', 'cui2snames', 'cui2type_ids', 'cui2preferred_name', 'vocab'])))
+
+
+if __name__ == '__main__':
+    main()
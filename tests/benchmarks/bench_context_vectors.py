@@ -0,0 +1,66 @@
+""" Compares ContextModel.get_context_vectors (one entity at a time) with
+ContextModel.get_doc_context_vectors (one pass per document) on long synthetic notes.
+
+    python tests/benchmarks/bench_context_vectors.py
+"""
+import time
+import random
+import numpy as np
+import spacy
+from spacy.tokens import Token
+
+from medcat.config import Config
+from medcat.vocab import Vocab
+from medcat.linking.vector_context_model import ContextModel
+
+N_DOCS = 10
+N_TOKENS = 5000
+N_ENTITIES = 500
+VOCAB_SIZE = 20000
+DIM = 300
+
+
+def main():
+    random.seed(11)
+    np.random.seed(11)
+    Token.set_extension('to_skip', default=False, force=True)
+    nlp = spacy.blank('en')
+
+    words = ["word{}".format(i) for i in range(VOCAB_SIZE)]
+    vocab = Vocab()
+    for word in words:
+        vocab.add_word(word, cnt=random.randint(1, 1000), vec=np.random.rand(DIM))
+
+    config = Config()
+    context_model = ContextModel(cdb=None, vocab=vocab, config=config)
+
+    docs = []
+    for _ in range(N_DOCS):
+        text = " ".join(random.choice(words + ["the", "and", ",", ".", "12", "unknown"]) for _ in range(N_TOKENS))
+        doc = nlp(text)
+        starts = sorted(random.sample(range(N_TOKENS - 3), N_ENTITIES))
+        docs.append((doc, [doc[start:start + random.randint(1, 3)] for start in starts]))
+
+    start = time.time()
+    old = [[context_model.get_context_vectors(entity, doc) for entity in entities] for doc, entities in docs]
+    old_time = time.time() - start
+
+    start = time.time()
+    new = [context_model.get_doc_context_vectors(entities, doc) for doc, entities in docs]
+    new_time = time.time() - start
+
+    max_diff = 0
+    for old_doc, new_doc in zip(old, new):
+        for old_vectors, new_vectors in zip(old_doc, new_doc):
+            assert old_vectors.keys() == new_vectors.keys()
+            for context_type in old_vectors:
+                max_diff = max(max_diff, np.abs(old_vectors[context_type] - new_vectors[context_type]).max())
+
+    print("Docs: {}, tokens per doc: {}, entities per doc: {}".format(N_DOCS, N_TOKENS, N_ENTITIES))
+    print("Per entity:   {:.3f}s".format(old_time))
+    print("Per document: {:.3f}s".format(new_time))
+    print("Speedup:      {:.1f}x, max abs difference: {:.2e}".format(old_time / new_time, max_diff))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,42 @@
+""" Negative sampling on a generated vocab with N_WORDS words (Zipf distributed counts): the time to build the
+distribution with `Vocab.make_unigram_table`, its size and the time of `Vocab.get_negative_samples`.
+
+    python tests/benchmarks/bench_negative_sampling.py [n_words]
+"""
+import sys
+import time
+import numpy as np
+
+from medcat.vocab import Vocab
+
+N_WORDS = 1000000
+N_CALLS = 100000
+N_SAMPLES = 15
+
+
+def main():
+    n_words = int(sys.argv[1]) if len(sys.argv) > 1 else N_WORDS
+    rng = np.random.RandomState(11)
+    vocab = Vocab()
+    counts = rng.zipf(1.5, n_words)
+    for i in range(n_words):
+        # Some punctuation and numbers, they are skipped by ignore_punct_and_num
+        word = "word{}".format(i) if i % 10 else str(i)
+        vocab.add_word(word, cnt=int(counts[i]), vec=[1.0])
+
+    start = time.time()
+    vocab.make_unigram_table()
+    took = time.time() - start
+    size = vocab.unigram_inds.nbytes + vocab.unigram_cum_probs.nbytes + vocab.unigram_has_letters.nbytes
+    print("{:,} words: distribution built in {:.2f}s, {:.1f} MB".format(n_words, took, size / 2**20))
+
+    for ignore_punct_and_num in [False, True]:
+        start = time.time()
+        for _ in range(N_CALLS):
+            vocab.get_negative_samples(N_SAMPLES, ignore_punct_and_num=ignore_punct_and_num)
+        print("get_negative_samples({}, ignore_punct_and_num={}): {:.1f}us".format(
+            N_SAMPLES, ignore_punct_and_num, (time.time() - start) / N_CALLS * 1e6))
+
+
+if __name__ == '__main__':
+    main()
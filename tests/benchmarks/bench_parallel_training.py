@@ -0,0 +1,50 @@
+""" Throughput of unsupervised training (`CAT.train`) with the examples CDB and Vocab, in one process and with
+N workers that collect the training examples while the main process applies them to the CDB. The documents are
+generated from the words of the vocab and the names of the concepts.
+
+    python tests/benchmarks/bench_parallel_training.py [spacy_model]
+"""
+import os
+import sys
+import time
+import random
+
+from medcat.cat import CAT
+from medcat.cdb import CDB
+from medcat.vocab import Vocab
+
+N_DOCS = 2000
+DOC_LEN = 200
+BATCH_SIZE = 50
+NPROCS = [1, 2, 4]
+EXAMPLES = os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "..", "examples")
+
+
+def make_docs():
+    rng = random.Random(11)
+    words = ["house", "dog", "virus", "second csv", "the", "is", "patient", "with", "and", "of", ","]
+    return [" ".join(rng.choice(words) for _ in range(DOC_LEN)) for _ in range(N_DOCS)]
+
+
+def main():
+    spacy_model = sys.argv[1] if len(sys.argv) > 1 else 'en_core_sci_sm'
+    docs = make_docs()
+    for nproc in NPROCS:
+        # Every run starts from the untrained examples CDB
+        cdb = CDB.load(os.path.join(EXAMPLES, "cdb.dat"))
+        vocab = Vocab.load(os.path.join(EXAMPLES, "vocab.dat"))
+        vocab.make_unigram_table()
+        cdb.config.general['spacy_model'] = spacy_model
+        cdb.config.general['spell_check'] = False
+        cat = CAT(cdb=cdb, config=cdb.config, vocab=vocab)
+
+        start = time.time()
+        cat.train(docs, nproc=nproc, batch_size=BATCH_SIZE, progress_print=N_DOCS)
+        took = time.time() - start
+        print("nproc={}: {:.0f} docs/s, {:.2f}s, {:,} positive examples applied".format(
+            nproc, N_DOCS / took, took, sum(cdb.cui2count_train.values())))
+        cat.destroy_pipe()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+""" Throughput of `Pipe.batch_multi_process` with n_process=1, where the pipeline components
+(PipeRunner) send the documents to a pool of joblib workers, plus the pickled size of a document
+with packed entities.
+
+    python tests/benchmarks/bench_pipe_runner.py
+"""
+import time
+import pickle
+import random
+import tempfile
+import numpy as np
+import spacy
+
+from medcat.cat import CAT
+from medcat.cdb_maker import CDBMaker
+from medcat.config import Config
+from medcat.vocab import Vocab
+from medcat.pipeline.pipe_runner import PipeRunner
+from medcat.preprocessing.cleaners import prepare_name
+
+N_CUIS = 1000
+N_WORDS = 500
+N_DOCS = 200
+N_TOKENS = 100
+DIM = 100
+WORKERS = 4
+BATCH_SIZE = 100
+
+
+def build(model_dir):
+    random.seed(11)
+    np.random.seed(11)
+    spacy.blank('en').to_disk(model_dir)
+    config = Config()
+    config.general['spacy_model'] = model_dir
+    config.general['spell_check'] = False
+    config.general['workers'] = WORKERS
+    config.linking['train_count_threshold'] = 0
+
+    words = ["word{}".format(i) for i in range(N_WORDS)]
+    maker = CDBMaker(config)
+    cdb = maker.cdb
+    for i in range(N_CUIS):
+        cui = "C{:07d}".format(i)
+        name = " ".join(random.sample(words, random.randint(1, 2)))
+        cdb.add_names(cui=cui, names=prepare_name(name, maker.nlp, {}, config))
+        cdb.cui2context_vectors[cui] = {context_type: np.random.rand(DIM)
+                                        for context_type in config.linking['context_vector_sizes']}
+        cdb.cui2count_train[cui] = 10
+
+    vocab = Vocab()
+    for word in words:
+        vocab.add_word(word, cnt=random.randint(1, 1000), vec=np.random.rand(DIM))
+    vocab.make_unigram_table(table_size=100000)
+
+    texts = [" ".join(random.choice(words + ["the", "and", ",", "."]) for _ in range(N_TOKENS))
+             for _ in range(N_DOCS)]
+    return CAT(cdb=cdb, config=config, vocab=vocab), texts
+
+
+def main():
+    with tempfile.TemporaryDirectory() as model_dir:
+        cat, texts = build(model_dir)
+
+        # Warm up the worker pool
+        list(cat.pipe.batch_multi_process(texts[:WORKERS], n_process=1, batch_size=BATCH_SIZE))
+
+        start = time.time()
+        docs = list(cat.pipe.batch_multi_process(texts, n_process=1, batch_size=BATCH_SIZE))
+        took = time.time() - start
+        n_ents = sum(len(doc.ents) for doc in docs)
+        print("batch_multi_process: {} docs, {} entities in {:.2f}s ({:.1f} docs/s, workers: {})".format(
+              len(docs), n_ents, took, len(docs) / took, WORKERS))
+
+        doc = PipeRunner.deserialize_entities(docs[0])
+        print("Entities in the first doc: {}, pickled doc: {} bytes".format(
+              len(doc._.ents), len(pickle.dumps(PipeRunner.serialize_entities(doc)))))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+""" Private (not shared) memory of forked worker processes with and without `CAT.share_memory`.
+
+Every worker looks up a sample of concepts, words and names (as annotating documents would) and then runs
+the garbage collector. Linux only (reads /proc/self/smaps_rollup).
+
+    python tests/benchmarks/bench_shared_memory.py
+"""
+import gc
+import random
+import numpy as np
+from multiprocessing import Process, Queue
+
+from medcat.cdb import CDB
+from medcat.config import Config
+from medcat.vocab import Vocab
+from medcat.utils.shared_memory import frozen_gc
+
+N_CUIS = 50000
+N_WORDS = 30000
+N_LOOKUPS = 5000
+DIM = 300
+N_WORKERS = 4
+
+
+def private_mb():
+    private = 0
+    with open('/proc/self/smaps_rollup') as f:
+        for line in f:
+            if line.startswith('Private_'):
+                private += int(line.split()[1])
+    return private / 1024
+
+
+def build():
+    random.seed(11)
+    np.random.seed(11)
+    config = Config()
+    cdb = CDB(config)
+    for i in range(N_CUIS):
+        cui = "C{:07d}".format(i)
+        name = "concept~name~{}".format(i)
+        cdb.add_concept(cui, {name: {'tokens': name.split('~'), 'snames': ['concept', 'concept~name', name],
+                                     'raw_name': name, 'is_upper': False}},
+                        ontologies=set(), name_status='A', type_ids={'T1'}, description='', full_build=True)
+        cdb.cui2context_vectors[cui] = {context_type: np.random.rand(DIM)
+                                        for context_type in config.linking['context_vector_sizes']}
+        cdb.cui2count_train[cui] = 10
+
+    vocab = Vocab()
+    for i in range(N_WORDS):
+        vocab.add_word("word{}".format(i), cnt=random.randint(1, 1000), vec=np.random.rand(DIM))
+    vocab.make_unigram_table(table_size=10000000)
+    return cdb, vocab
+
+
+def worker(cdb, vocab, out_q):
+    start = private_mb()
+    rng = random.Random()
+    total = 0
+    for cui in rng.sample(list(cdb.cui2names), N_LOOKUPS):
+        vectors = cdb.cui2context_vectors[cui]
+        total += float(vectors['long'][0])
+    for word in rng.sample(list(vocab.vocab), N_LOOKUPS):
+        total += float(vocab.vec(word)[0])
+    for name in rng.sample(list(cdb.name2cuis), N_LOOKUPS):
+        total += len(cdb.name2cuis[name]) + (name in cdb.snames)
+    vocab.get_negative_samples(n=1000)
+    gc.collect()
+    out_q.put(private_mb() - start)
+
+
+def run(cdb, vocab):
+    out_q = Queue()
+    procs = [Process(target=worker, args=(cdb, vocab, out_q)) for _ in range(N_WORKERS)]
+    for p in procs:
+        p.start()
+    results = [out_q.get() for _ in procs]
+    for p in procs:
+        p.join()
+    return results
+
+
+def main():
+    cdb, vocab = build()
+    print("Parent private memory: {:.0f} MB, workers: {}".format(private_mb(), N_WORKERS))
+
+    results = run(cdb, vocab)
+    print("Default:       {:.0f} MB copied per worker".format(np.mean(results)))
+
+    cdb.share_memory()
+    vocab.share_memory()
+    with frozen_gc():
+        results = run(cdb, vocab)
+    print("Shared memory: {:.0f} MB copied per worker".format(np.mean(results)))
+
+
+if __name__ == '__main__':
+    main()
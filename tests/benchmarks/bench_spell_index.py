@@ -0,0 +1,75 @@
+""" Compares BasicSpellChecker.fix with and without the symmetric delete index (`config.general['spell_check_index']`)
+on a synthetic vocab, for one (default) and two (`spell_check_deep`) edits.
+
+    python tests/benchmarks/bench_spell_index.py
+"""
+import time
+import random
+
+from medcat.config import Config
+from medcat.utils.normalizers import BasicSpellChecker
+from medcat.utils.spell_index import SymSpellIndex
+
+N_WORDS = 100000
+N_QUERIES = {False: 2000, True: 50}
+SYLLABLES = ["hy", "per", "ten", "sion", "car", "di", "o", "my", "pa", "thy", "neph", "ro", "gas", "tri", "tis",
+             "an", "ae", "mi", "a", "leu", "ko", "cy", "te", "chol", "e", "stas", "is", "ic", "al", "pneu", "mon"]
+
+
+def make_word(rng):
+    return "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 5)))
+
+
+def typo(rng, word):
+    i = rng.randrange(len(word))
+    op = rng.choice(["delete", "insert", "replace", "transpose"])
+    if op == "delete":
+        return word[:i] + word[i + 1:]
+    elif op == "insert":
+        return word[:i] + rng.choice("abcdefghijklmnopqrstuvwxyz") + word[i:]
+    elif op == "replace":
+        return word[:i] + rng.choice("abcdefghijklmnopqrstuvwxyz") + word[i + 1:]
+    return word[:i] + word[i + 1:i + 2] + word[i:i + 1] + word[i + 2:]
+
+
+def main():
+    rng = random.Random(11)
+    vocab = {}
+    while len(vocab) < N_WORDS:
+        vocab[make_word(rng)] = rng.randint(1, 1000)
+    words = list(vocab)
+
+    for deep in [False, True]:
+        config = Config()
+        config.general['spell_check_deep'] = deep
+        queries = [typo(rng, typo(rng, word)) if deep else typo(rng, word)
+                   for word in rng.sample(words, N_QUERIES[deep])]
+
+        start = time.time()
+        index = SymSpellIndex(max_distance=2 if deep else 1)
+        for word in vocab:
+            index.add_word(word)
+        took_build = time.time() - start
+
+        plain = BasicSpellChecker(cdb_vocab=vocab, config=config)
+        start = time.time()
+        fixes_plain = [plain.fix(query) for query in queries]
+        took_plain = time.time() - start
+
+        indexed = BasicSpellChecker(cdb_vocab=vocab, config=config, index=index)
+        start = time.time()
+        fixes_indexed = [indexed.fix(query) for query in queries]
+        took_indexed = time.time() - start
+
+        # Ties between candidates with the same count can be broken differently, compare the counts
+        same = all(vocab.get(a) == vocab.get(b) for a, b in zip(fixes_plain, fixes_indexed))
+        print("spell_check_deep={}, {} words, {} queries".format(deep, N_WORDS, len(queries)))
+        print("  Index build:     {:.2f}s ({} deletes)".format(took_build, len(index.deletes)))
+        print("  Generated edits: {:.3f}ms per word".format(took_plain / len(queries) * 1000))
+        print("  Index:           {:.3f}ms per word ({:.1f}x)".format(took_indexed / len(queries) * 1000,
+                                                                      took_plain / took_indexed))
+        print("  Same fixes:      {}".format(same))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+""" Cold start of MedCAT: the time to import `medcat.cat` and to build a `CAT` (mostly `spacy.load`), with the
+disabled spaCy components excluded (`config.general['spacy_exclude_disabled']`) or only disabled. Every
+measurement runs in a new python process.
+
+    python tests/benchmarks/bench_startup.py [spacy_model]
+"""
+import sys
+import json
+import subprocess
+
+N_RUNS = 3
+HEAVY = ['torch', 'transformers', 'tokenizers', 'sklearn']
+
+IMPORT = """
+import sys, time, json
+start = time.time()
+import medcat.cat
+print(json.dumps({'took': time.time() - start,
+                  'heavy': sorted({m.split('.')[0] for m in sys.modules if m.split('.')[0] in %r})}))
+""" % (HEAVY, )
+
+BUILD = """
+import time, json
+from medcat.cat import CAT
+from medcat.cdb import CDB
+from medcat.vocab import Vocab
+from medcat.config import Config
+config = Config()
+config.general['spacy_model'] = %r
+config.general['spacy_exclude_disabled'] = %r
+start = time.time()
+cat = CAT(cdb=CDB(config=config), config=config, vocab=Vocab())
+print(json.dumps({'took': time.time() - start, 'pipes': cat.pipe.nlp.pipe_names}))
+"""
+
+
+def run(code):
+    out = subprocess.run([sys.executable, '-c', code], check=True, stdout=subprocess.PIPE,
+                         universal_newlines=True).stdout
+    return json.loads(out.strip().split('\n')[-1])
+
+
+def main():
+    spacy_model = sys.argv[1] if len(sys.argv) > 1 else 'en_core_sci_md'
+
+    results = [run(IMPORT) for _ in range(N_RUNS)]
+    print("import medcat.cat: {:.2f}s (min of {}), heavy modules imported: {}".format(
+        min(r['took'] for r in results), N_RUNS, results[0]['heavy']))
+
+    for exclude in [False, True]:
+        results = [run(BUILD % (spacy_model, exclude)) for _ in range(N_RUNS)]
+        print("CAT(), spacy_exclude_disabled={}: {:.2f}s (min of {}), spaCy components: {}".format(
+            exclude, min(r['took'] for r in results), N_RUNS, results[0]['pipes']))
+
+
+if __name__ == '__main__':
+    main()
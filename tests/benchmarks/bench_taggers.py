@@ -0,0 +1,83 @@
+""" Compares the skip/punct tagger with and without the per lexeme tag cache
+(`config.preprocessing['cache_token_tags']`) on synthetic clinical notes.
+
+    python tests/benchmarks/bench_taggers.py
+"""
+import time
+import random
+from spacy.lang.en import English
+from spacy.tokens import Token
+
+from medcat.config import Config
+from medcat.preprocessing.taggers import tag_skip_and_punct
+
+N_DOCS = 2000
+
+SENTENCES = [
+    "Pt is a {age} y/o {sex} w/ PMHx of {dx}, {dx} and {dx} who presents with {sx} x{n} days.",
+    "Denies {sx}, {sx} or {sx}. ROS otherwise neg.",
+    "Vitals: BP {n}/{n}, HR {n}, RR {n}, SpO2 {n}% on RA, T 37.{n}C.",
+    "Labs: Na {n}, K 4.{n}, Cr 1.{n} (baseline 0.9), WBC {n}.{n}, Hb {n}.{n} g/dL.",
+    "Meds: {med} {n} mg PO BID, {med} {n} mcg daily, {med} PRN.",
+    "A/P: {dx}, nos - continue {med}; f/u in {n} wks. ? {dx} vs {dx}.",
+    "CXR: no acute cardiopulmonary process; ECG: NSR, no ST changes.",
+]
+FILL = {
+    'age': [str(i) for i in range(18, 95)],
+    'sex': ['M', 'F', 'male', 'female'],
+    'dx': ['HTN', 'T2DM', 'CHF', 'COPD', 'CKD stage 3', 'AFib', 'hyperlipidemia', 'GERD', 'pneumonia', 'UTI',
+           'acute kidney injury', 'NSTEMI', 'DVT', 'anaemia', 'hypothyroidism', 'OSA'],
+    'sx': ['chest pain', 'SOB', 'dyspnoea', 'nausea', 'vomiting', 'fever', 'cough', 'palpitations', 'syncope',
+           'abdominal pain', 'headache', 'dizziness', 'fatigue', 'leg swelling'],
+    'med': ['metformin', 'lisinopril', 'atorvastatin', 'furosemide', 'apixaban', 'omeprazole', 'salbutamol',
+            'levothyroxine', 'amlodipine', 'paracetamol'],
+}
+
+
+def make_note(rng):
+    sentences = []
+    for _ in range(rng.randint(10, 40)):
+        template = rng.choice(SENTENCES)
+        while '{' in template:
+            start = template.index('{')
+            end = template.index('}')
+            key = template[start + 1:end]
+            value = str(rng.randint(1, 200)) if key == 'n' else rng.choice(FILL[key])
+            template = template[:start] + value + template[end + 1:]
+        sentences.append(template)
+    return " ".join(sentences)
+
+
+def run(tagger, docs):
+    start = time.time()
+    for doc in docs:
+        tagger(doc)
+    took = time.time() - start
+    return took, [[(token._.is_punct, token._.to_skip) for token in doc] for doc in docs]
+
+
+def main():
+    rng = random.Random(11)
+    nlp = English()
+    Token.set_extension('is_punct', default=False, force=True)
+    Token.set_extension('to_skip', default=False, force=True)
+    texts = [make_note(rng) for _ in range(N_DOCS)]
+
+    config = Config()
+    tagger = tag_skip_and_punct(nlp, tag_skip_and_punct.name, config)
+
+    config.preprocessing['cache_token_tags'] = False
+    took_regex, tags_regex = run(tagger, [nlp.make_doc(text) for text in texts])
+
+    config.preprocessing['cache_token_tags'] = True
+    took_cache, tags_cache = run(tagger, [nlp.make_doc(text) for text in texts])
+
+    n_tokens = sum(len(tags) for tags in tags_regex)
+    print("{} notes, {} tokens, {} distinct lexemes".format(N_DOCS, n_tokens, len(tagger._tag_cache)))
+    print("Regex per token: {:.3f}s".format(took_regex))
+    print("Tag cache:       {:.3f}s ({:.1f}x)".format(took_cache, took_regex / took_cache))
+    print("Identical tags:  {}".format(tags_regex == tags_cache))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+""" Loading words and vectors with `Vocab.add_words` from a generated file with N_LINES lines in the MedCAT vocab
+format (`<word>\t<cnt>\t<vec>`) and the same words in the word2vec binary format, all words and only the words of
+a (generated) CDB vocab. The first N_BASELINE lines are also loaded line by line, parsing each vector in Python
+and adding it with `Vocab.add_word`, as a reference.
+
+    python tests/benchmarks/bench_vocab_add_words.py [n_lines]
+"""
+import os
+import sys
+import time
+import shutil
+import tempfile
+import numpy as np
+
+from medcat.vocab import Vocab
+
+N_LINES = 1000000
+N_BASELINE = 100000
+DIM = 100
+CHUNK = 10000
+
+
+def write_files(tmp_dir, n_lines):
+    rng = np.random.RandomState(11)
+    text_path = os.path.join(tmp_dir, 'vocab_data.txt')
+    binary_path = os.path.join(tmp_dir, 'vectors.bin')
+    with open(text_path, 'w') as text, open(binary_path, 'wb') as binary:
+        binary.write("{} {}\n".format(n_lines, DIM).encode())
+        for start in range(0, n_lines, CHUNK):
+            vectors = rng.randn(min(CHUNK, n_lines - start), DIM).astype(np.float32)
+            counts = rng.randint(1, 100000, len(vectors))
+            for i, (cnt, vec) in enumerate(zip(counts, vectors)):
+                word = "word{}".format(start + i)
+                text.write("{}\t{}\t{}\n".format(word, cnt, " ".join(["%.6f" % x for x in vec])))
+                binary.write(word.encode() + b" " + vec.tobytes() + b"\n")
+    return text_path, binary_path
+
+
+def baseline(path, n_lines):
+    vocab = Vocab()
+    with open(path) as f:
+        for _, line in zip(range(n_lines), f):
+            parts = line.split("\t")
+            vec = np.array([float(x) for x in parts[2].strip().split(" ")]) if len(parts) == 3 else None
+            vocab.add_word(parts[0], int(parts[1].strip()), vec)
+    return vocab
+
+
+def timed(load):
+    start = time.time()
+    vocab = load()
+    return vocab, time.time() - start
+
+
+def main():
+    n_lines = int(sys.argv[1]) if len(sys.argv) > 1 else N_LINES
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        text_path, binary_path = write_files(tmp_dir, n_lines)
+        print("{:,} lines, {} dimensions, {:.0f} MB of text".format(n_lines, DIM, os.path.getsize(text_path) / 2**20))
+
+        n_baseline = min(N_BASELINE, n_lines)
+        _, took = timed(lambda: baseline(text_path, n_baseline))
+        print("add_word line by line: {:.1f}us per line (first {:,} lines)".format(took / n_baseline * 1e6, n_baseline))
+
+        # A CDB vocab that has one in ten of the words
+        cdb_vocab = {"word{}".format(i): 1 for i in range(0, n_lines, 10)}
+        for fmt, path in [('medcat', text_path), ('word2vec_binary', binary_path)]:
+            for words_to_keep in [None, cdb_vocab]:
+                vocab = Vocab()
+                _, took = timed(lambda: vocab.add_words(path, fmt=fmt, words_to_keep=words_to_keep))
+                print("add_words(fmt={}, words_to_keep={}): {:.1f}us per line, {:.2f}s, {:,} words".format(
+                    fmt, None if words_to_keep is None else 'cdb.vocab', took / n_lines * 1e6, took, len(vocab.index2word)))
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+if __name__ == '__main__':
+    main()
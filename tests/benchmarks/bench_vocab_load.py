@@ -0,0 +1,84 @@
+""" Load time and memory of a Vocab saved as a pickle (`vocab.dat`) and in the directory format (`fmt='dir'`, the
+embedding matrix and the negative sampling distribution memory mapped), on a generated vocab with N_WORDS words. Every load runs in
+a new python process. Memory is RssAnon (private to the process) and RssFile (pages of the memory mapped files, in
+the page cache and shared by all processes that load the same vocab), after loading and after NER like lookups.
+Linux only (reads /proc/self/status).
+
+    python tests/benchmarks/bench_vocab_load.py [n_words]
+"""
+import os
+import sys
+import json
+import shutil
+import tempfile
+import subprocess
+import numpy as np
+
+from medcat.vocab import Vocab
+
+N_WORDS = 300000
+DIM = 300
+N_LOOKUPS = 100000
+
+LOAD = """
+import time, json, random
+from medcat.vocab import Vocab
+
+def memory():
+    mem = {}
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith(('RssAnon', 'RssFile')):
+                mem[line.split(':')[0]] = int(line.split()[1]) / 1024
+    return mem
+
+before = memory()
+start = time.time()
+vocab = Vocab.load(%r)
+took = time.time() - start
+loaded = memory()
+rng = random.Random(11)
+for word in rng.choices(vocab.index2word, k=%d):
+    vocab.vec(word).sum()
+vocab.get_negative_samples(n=6)
+used = memory()
+print(json.dumps({'took': took,
+                  'loaded': {k: loaded[k] - before[k] for k in loaded},
+                  'used': {k: used[k] - before[k] for k in used}}))
+"""
+
+
+def run(code):
+    out = subprocess.run([sys.executable, '-c', code], check=True, stdout=subprocess.PIPE,
+                         universal_newlines=True).stdout
+    return json.loads(out.strip().split('\n')[-1])
+
+
+def main():
+    n_words = int(sys.argv[1]) if len(sys.argv) > 1 else N_WORDS
+    rng = np.random.RandomState(11)
+    vocab = Vocab()
+    vectors = rng.rand(n_words, DIM).astype(np.float32)
+    counts = rng.randint(1, 10000, n_words)
+    for i in range(n_words):
+        vocab.add_word("word{}".format(i), cnt=int(counts[i]), vec=vectors[i])
+    vocab.make_unigram_table()
+
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        paths = {'dat': os.path.join(tmp_dir, 'vocab.dat'), 'dir': os.path.join(tmp_dir, 'vocab')}
+        for fmt, path in paths.items():
+            vocab.save(path, fmt=fmt)
+
+        print("{:,} words, {} dimensions".format(n_words, DIM))
+        for fmt, path in paths.items():
+            result = run(LOAD % (path, N_LOOKUPS))
+            print("{}: loaded in {:.2f}s, RssAnon/RssFile after load {:.0f}/{:.0f} MB, after {:,} lookups {:.0f}/{:.0f} MB".format(
+                fmt, result['took'], result['loaded']['RssAnon'], result['loaded']['RssFile'],
+                N_LOOKUPS, result['used']['RssAnon'], result['used']['RssFile']))
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+if __name__ == '__main__':
+    main()
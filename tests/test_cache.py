@@ -0,0 +1,46 @@
+import os
+import tempfile
+import unittest
+from medcat.utils.cache import LRUCache
+
+
+class LRUCacheTests(unittest.TestCase):
+
+    def test_least_recently_used_is_removed(self):
+        cache = LRUCache(max_size=2)
+        cache["a"] = 1
+        cache["b"] = 2
+        self.assertEqual(1, cache.get("a"))
+        cache["c"] = 3
+
+        self.assertEqual(2, len(cache))
+        self.assertIn("a", cache)
+        self.assertNotIn("b", cache)
+        self.assertIn("c", cache)
+
+    def test_hit_rate(self):
+        cache = LRUCache()
+        cache["a"] = None
+        self.assertIsNone(cache.get("a", "missing"))
+        self.assertEqual("missing", cache.get("b", "missing"))
+        self.assertEqual("missing", cache.get("c", "missing"))
+
+        self.assertEqual({'size': 1, 'max_size': None, 'hits': 1, 'misses': 2, 'hit_rate': 1 / 3}, cache.info())
+
+    def test_save_and_load(self):
+        cache = LRUCache()
+        for i in range(5):
+            cache[str(i)] = i
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "cache.pickle")
+            cache.save(path)
+            loaded = LRUCache(max_size=3)
+            loaded.load(path)
+
+        # The most recently used items are kept
+        self.assertEqual(["2", "3", "4"], [key for key in map(str, range(5)) if key in loaded])
+        self.assertEqual(0, loaded.hits + loaded.misses)
+
+
+if __name__ == '__main__':
+    unittest.main()
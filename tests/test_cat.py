@@ -1,8 +1,15 @@
 import os
+import sys
+import types
 import unittest
+import subprocess
+import numpy as np
+from copy import deepcopy
+from unittest.mock import patch
 from medcat.vocab import Vocab
 from medcat.cdb import CDB
 from medcat.cat import CAT
+from medcat.linking.context_based_linker import Linker
 
 
 class CATTests(unittest.TestCase):
@@ -26,6 +33,10 @@ class CATTests(unittest.TestCase):
     def tearDownClass(cls) -> None:
         cls.undertest.destroy_pipe()
 
+    def test_disabled_spacy_components_are_not_loaded(self):
+        self.assertNotIn("parser", self.undertest.pipe.nlp.component_names)
+        self.assertNotIn("ner", self.undertest.pipe.nlp.component_names)
+
     def test_callable_with_single_text(self):
         text = "The dog is sitting outside the house."
         doc = self.undertest(text)
@@ -71,6 +82,29 @@ class CATTests(unittest.TestCase):
         self.assertEqual(3, out[2][0])
         self.assertEqual("The dog is sitting outside the house.", out[2][1]["text"])
 
+    def test_multiprocessing_iter(self):
+        in_data = [(i, "The dog is sitting outside the house and second csv.") for i in range(10)]
+        out = self.undertest.multiprocessing_iter(iter(in_data), nproc=2, batch_size_chars=100)
+        self.assertIsInstance(out, types.GeneratorType)
+        out = sorted(out, key=lambda x: x[0])
+        self.assertEqual(list(range(10)), [id for id, _ in out])
+        for _, doc in out:
+            self.assertEqual('second csv', doc['entities'][0]['source_value'])
+
+    def test_multiprocessing_iter_closed_early(self):
+        in_data = ((i, "The dog is sitting outside the house.") for i in range(1000))
+        out = self.undertest.multiprocessing_iter(in_data, nproc=2, batch_size_chars=100, max_queued_batches=2)
+        self.assertEqual(2, len([next(out) for _ in range(2)]))
+        out.close()
+
+    def test_multiprocessing_iter_worker_died(self):
+        in_data = [(i, "The dog is sitting outside the house.") for i in range(10)]
+        # Workers are forked, so they get the patched get_entities and exit as if they were killed
+        with patch.object(self.undertest, 'get_entities', side_effect=lambda *args, **kwargs: os._exit(1)), \
+                patch.object(self.undertest, '_mp_poll_interval', 0.1):
+            with self.assertRaises(RuntimeError):
+                list(self.undertest.multiprocessing_iter(iter(in_data), nproc=2, batch_size_chars=100))
+
     def test_multiprocessing_pipe(self):
         in_data = [
             (1, "The dog is sitting outside the house and second csv."),
@@ -103,6 +137,52 @@ class CATTests(unittest.TestCase):
         self.assertEqual(3, out[2][0])
         self.assertIsNone(out[2][1])
 
+    def test_multiprocessing_pipe_iter(self):
+        in_data = ((i, "The dog is sitting outside the house and second csv." if i % 3 else "") for i in range(20))
+        out = self.undertest.multiprocessing_pipe_iter(in_data, nproc=2, batch_size=3)
+        self.assertIsInstance(out, types.GeneratorType)
+        out = list(out)
+        self.assertEqual(list(range(20)), [id for id, _ in out])
+        for id, doc in out:
+            if id % 3:
+                self.assertEqual('second csv', doc['entities'][0]['source_value'])
+            else:
+                self.assertIsNone(doc)
+
+    def test_multiprocessing_pipe_iter_failed_document(self):
+        in_data = [(i, "The dog is sitting outside the house and second csv." if i != 4 else "This one fails.") for i in range(10)]
+        call = Linker.__call__
+
+        def fail_on_marked(linker, doc):
+            if "fails" in doc.text:
+                raise ValueError("Failed on purpose")
+            return call(linker, doc)
+
+        with patch.object(Linker, '__call__', fail_on_marked):
+            out = list(self.undertest.multiprocessing_pipe_iter(iter(in_data), nproc=2, batch_size=5))
+        self.assertEqual(list(range(10)), [id for id, _ in out])
+        self.assertIsNone(out[4][1])
+        for id, doc in out[:4] + out[5:]:
+            self.assertEqual('second csv', doc['entities'][0]['source_value'])
+
+    def test_multiprocessing_pipe_iter_worker_died(self):
+        in_data = [(i, "The dog is sitting outside the house.") for i in range(10)]
+        with patch.object(self.undertest, 'get_entities', side_effect=lambda *args, **kwargs: os._exit(1)), \
+                patch.object(self.undertest, '_mp_poll_interval', 0.1):
+            with self.assertRaises(RuntimeError):
+                list(self.undertest.multiprocessing_pipe_iter(iter(in_data), nproc=2, batch_size=3, ordered=True))
+        with patch.object(self.undertest, 'pipe', side_effect=lambda *args, **kwargs: os._exit(1)), \
+                patch.object(self.undertest, '_mp_poll_interval', 0.1):
+            with self.assertRaises(RuntimeError):
+                self.undertest.train([text for _, text in in_data], nproc=2, batch_size=3)
+
+    def test_multiprocessing_pipe_iter_unordered(self):
+        in_data = [(i, "The dog is sitting outside the house.") for i in range(20)] + [(20, None)]
+        out = dict(self.undertest.multiprocessing_pipe_iter(iter(in_data), nproc=2, batch_size=3, ordered=False))
+        self.assertEqual(set(range(21)), set(out.keys()))
+        self.assertEqual({'entities': {}, 'tokens': [], 'text': "The dog is sitting outside the house."}, out[0])
+        self.assertIsNone(out[20])
+
     def test_multiprocessing_pipe_return_dict(self):
         in_data = [
             (1, "The dog is sitting outside the house."),
@@ -121,6 +201,37 @@ class CATTests(unittest.TestCase):
         self.undertest.train(["The dog is not a house", "The house is not a dog"])
         self.undertest.cdb.print_stats()
 
+    def test_train_parallel(self):
+        count = self.undertest.cdb.cui2count_train.get('C0000239', 0)
+        self.undertest.train(["The dog is sitting outside the house and second csv."] * 10, nproc=2, batch_size=3)
+        self.assertEqual(count + 10, self.undertest.cdb.cui2count_train['C0000239'])
+        self.assertFalse(self.undertest.config.linking['train'])
+
+    def test_train_parallel_equals_single_process(self):
+        texts = ["The {} is near the virus and second csv, not the {}.".format(a, b)
+                 for a in ["dog", "house", "virus"] for b in ["house", "dog", "second csv"]] * 3
+        results = []
+        for nproc, staleness in [(1, 1000), (2, 1000), (2, 2)]:
+            cdb = CDB.load(os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "examples", "cdb.dat"))
+            cdb.config = deepcopy(self.cdb.config)
+            cdb.config.linking['negative_probability'] = 0
+            cdb.config.linking['subsample_after'] = 1000000
+            cdb.config.linking['train_update_staleness'] = staleness
+            cat = CAT(cdb=cdb, config=cdb.config, vocab=self.vocab)
+            cat.train(texts, nproc=nproc, batch_size=2)
+            cat.destroy_pipe()
+            results.append(cdb)
+
+        self.assertGreater(sum(results[0].cui2count_train.values()), 0)
+        for cdb in results[1:]:
+            self.assertEqual(results[0].cui2count_train, cdb.cui2count_train)
+            self.assertEqual(results[0].name2count_train, cdb.name2count_train)
+            self.assertEqual(set(results[0].cui2context_vectors), set(cdb.cui2context_vectors))
+            for cui, vectors in results[0].cui2context_vectors.items():
+                self.assertEqual(set(vectors), set(cdb.cui2context_vectors[cui]))
+                for context_type, vector in vectors.items():
+                    np.testing.assert_array_equal(vector, cdb.cui2context_vectors[cui][context_type])
+
     def test_get_entities(self):
         text = "The dog is sitting outside the house."
         out = self.undertest.get_entities(text)
@@ -132,6 +243,14 @@ class CATTests(unittest.TestCase):
         out = self.undertest.get_entities(in_data, n_process=2)
         self.assertEqual(3, len(out))
 
+    def test_entities_not_packed_after_batch(self):
+        text = "The dog is sitting outside the house and second csv."
+        self.undertest.get_entities([(1, text), (2, text)], n_process=1)
+        self.assertNotIn("ensure_serializable", self.undertest.pipe.nlp.pipe_names)
+        doc = self.undertest(text)
+        self.assertIsInstance(doc._.ents, list)
+        self.assertEqual("second csv", doc._.ents[0].text)
+
     def test_train_supervised(self):
         fp, fn, tp, p, r, f1, cui_counts, examples = self.undertest.train_supervised(os.path.join(os.path.dirname(__file__), "resources", "medcat_trainer_export.json"), nepochs=1)
         self.assertEqual({}, fp)
@@ -197,5 +316,14 @@ class CATTests(unittest.TestCase):
         self.assertFalse(hasattr(out[4], "text"))
 
 
+class CATImportTests(unittest.TestCase):
+
+    def test_import_does_not_import_torch(self):
+        code = "import sys, medcat.cat; print(sorted({m.split('.')[0] for m in sys.modules} & {'torch', 'transformers', 'gensim'}))"
+        out = subprocess.run([sys.executable, "-c", code], check=True, stdout=subprocess.PIPE,
+                             universal_newlines=True).stdout
+        self.assertEqual("[]", out.strip().split("\n")[-1])
+
+
 if __name__ == '__main__':
     unittest.main()
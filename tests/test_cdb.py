@@ -1,9 +1,20 @@
 import os
+import copy
+import json
+import dill
+import pickle
 import shutil
 import unittest
 import tempfile
+import numpy as np
 from medcat.config import Config
+from medcat.cdb import CDB
 from medcat.cdb_maker import CDBMaker
+from medcat.vocab import Vocab
+from medcat.utils.context_vectors import ContextVectorStore
+from medcat.utils.cdb_storage import FORMAT_FILE, LazyAddlInfo, convert_cdb, is_cdb_dir
+from medcat.utils.name_maps import is_compact
+from medcat.utils.spell_index import SymSpellIndex
 
 
 class CDBTests(unittest.TestCase):
@@ -46,11 +57,431 @@ class CDBTests(unittest.TestCase):
     def test_cui2type_ids(self):
         self.assertEqual({'C0000039': {'T109', 'T234', 'T123'}, 'C0000139': set(), 'C0000239': set()}, self.undertest.cui2type_ids)
 
+    def test_merge_concepts(self):
+        cdb = CDB(config=self.undertest.config)
+        cdb.merge_concepts(self.undertest)
+        for field in ['name2cuis', 'name2cuis2status', 'snames', 'cui2names', 'cui2snames', 'cui2preferred_name',
+                      'cui2type_ids', 'name_isupper', 'vocab', 'addl_info']:
+            self.assertEqual(getattr(self.undertest, field), getattr(cdb, field), field)
+
+        other = CDB(config=self.undertest.config)
+        other.add_names('C0000239', {"virus": {'tokens': ['virus'], 'snames': {'virus'}, 'raw_name': "Virus",
+                                               'is_upper': False}}, name_status='P')
+        cdb.merge_concepts(other)
+        self.assertEqual(['C0000039', 'C0000139', 'C0000239'], cdb.name2cuis['virus'])
+        self.assertEqual('P', cdb.name2cuis2status['virus']['C0000239'])
+        self.assertEqual(self.undertest.cui2names['C0000239'] | {'virus'}, cdb.cui2names['C0000239'])
+        self.assertEqual(self.undertest.vocab['virus'] + 1, cdb.vocab['virus'])
+        self.assertNotIn('virus', self.undertest.cui2names['C0000239'])
+
     def test_save_and_load(self):
         with tempfile.NamedTemporaryFile() as f:
             self.undertest.save(f.name)
             self.undertest.load(f.name)
 
 
+class CDBContextVectorStoreTests(unittest.TestCase):
+
+    def setUp(self) -> None:
+        np.random.seed(11)
+        self.cdb = CDB(config=Config())
+        for i in range(10):
+            for negative in [False, True, False]:
+                vectors = {context_type: np.random.rand(30) for context_type in self.cdb.config.linking['context_vector_sizes']}
+                self.cdb.update_context_vector("C{}".format(i), vectors, negative=negative)
+
+    def test_use_context_vector_store(self):
+        old = {cui: dict(vectors) for cui, vectors in self.cdb.cui2context_vectors.items()}
+        self.cdb.use_context_vector_store(matrix=True)
+
+        self.assertIsInstance(self.cdb.cui2context_vectors, ContextVectorStore)
+        self.assertEqual(set(old.keys()), set(self.cdb.cui2context_vectors.keys()))
+        np.testing.assert_allclose(old['C3']['long'], self.cdb.cui2context_vectors['C3']['long'], rtol=1e-6)
+
+    def test_store_similarities(self):
+        store = ContextVectorStore.from_dict(self.cdb.cui2context_vectors)
+        vectors = {context_type: np.random.rand(30) for context_type in self.cdb.config.linking['context_vector_sizes']}
+        weights = self.cdb.config.linking['context_vector_weights']
+        cuis = ["C1", "C5", "C99"]
+
+        similarities, has_vectors = store.similarities(cuis, vectors, weights)
+
+        self.assertEqual([True, True, False], has_vectors.tolist())
+        for cui, similarity in zip(cuis[:2], similarities):
+            expected = sum(weight * np.dot(vectors[context_type] / np.linalg.norm(vectors[context_type]),
+                                           self.cdb.cui2context_vectors[cui][context_type] / np.linalg.norm(self.cdb.cui2context_vectors[cui][context_type]))
+                           for context_type, weight in weights.items())
+            self.assertAlmostEqual(expected, similarity, places=5)
+
+    def test_save_and_load_with_store(self):
+        self.cdb.use_context_vector_store(matrix=True)
+        self.cdb.update_context_vector("C42", {'long': np.random.rand(30)})
+        with tempfile.NamedTemporaryFile() as f:
+            self.cdb.save(f.name)
+            cdb = CDB.load(f.name)
+
+        self.assertIsInstance(cdb.cui2context_vectors, ContextVectorStore)
+        self.assertEqual(11, len(cdb.cui2context_vectors))
+        np.testing.assert_array_equal(self.cdb.cui2context_vectors['C42']['long'], cdb.cui2context_vectors['C42']['long'])
+
+    def test_share_memory(self):
+        old = np.array(self.cdb.cui2context_vectors['C3']['long'])
+        self.cdb.share_memory()
+        store = self.cdb.cui2context_vectors
+        self.assertIsInstance(store, ContextVectorStore)
+        self.assertEqual('dict', self.cdb.config.linking['context_vector_store'])
+        self.assertFalse(store.matrices['long'].flags.writeable)
+        np.testing.assert_allclose(old, store['C3']['long'], rtol=1e-6)
+
+        # Changes go into a private copy
+        self.cdb.update_context_vector("C3", {'long': np.random.rand(30)})
+        self.cdb.update_context_vector("C42", {'long': np.random.rand(30)})
+        self.assertTrue(store.matrices['long'].flags.writeable)
+        self.assertIn("C42", store)
+
+
+class CDBCompactNamesTests(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.cdb = CDB(config=Config())
+        for i in range(10):
+            names = {"name~{}".format(i): {'tokens': ['name', str(i)], 'snames': {'name', "name~{}".format(i)},
+                                           'raw_name': "Name {}".format(i), 'is_upper': False},
+                     "shared~namé": {'tokens': ['shared', 'namé'], 'snames': {'shared', 'shared~namé'},
+                                     'raw_name': "Shared namé", 'is_upper': False}}
+            self.cdb.add_concept("C{}".format(i), names, ontologies=set(), name_status='P' if i % 3 else 'A',
+                                 type_ids={'T1'}, description='')
+        self.old = {field: copy.deepcopy(getattr(self.cdb, field)) for field in CDB.NAME_MAPS}
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.tmp_dir)
+
+    def assertSameNames(self, cdb):
+        for field in CDB.NAME_MAPS:
+            self.assertEqual(self.old[field], getattr(cdb, field))
+
+    def test_use_compact_names(self):
+        self.cdb.use_compact_names()
+
+        self.assertTrue(all(is_compact(getattr(self.cdb, field)) for field in CDB.NAME_MAPS))
+        self.assertSameNames(self.cdb)
+        self.assertEqual(['C{}'.format(i) for i in range(10)], self.cdb.name2cuis["shared~namé"])
+        self.assertIn("name~3", self.cdb.snames)
+        self.assertNotIn("name~33", self.cdb.snames)
+        self.assertNotIn("name", self.cdb.name2cuis)
+        self.assertEqual({"name~3", "shared~namé"}, self.cdb.cui2names["C3"])
+        self.assertEqual('', self.cdb.name2cuis2status.get("name~33", {}).get("C3", ''))
+
+        self.cdb.use_compact_names(False)
+        self.assertIsInstance(self.cdb.name2cuis, dict)
+        self.assertSameNames(self.cdb)
+
+    def test_status_can_be_changed(self):
+        self.cdb.use_compact_names()
+        self.cdb.name2cuis2status.get("shared~namé", {})["C3"] = 'PD'
+        self.assertEqual('PD', self.cdb.name2cuis2status["shared~namé"]["C3"])
+        self.assertEqual('A', self.cdb.name2cuis2status["shared~namé"]["C0"])
+        with self.assertRaises(TypeError):
+            self.cdb.name2cuis2status["name~3"]["C4"] = 'A'
+
+    def test_edit_compact_names(self):
+        dict_cdb = copy.deepcopy(self.cdb)
+        self.cdb.use_compact_names()
+        for cdb in [dict_cdb, self.cdb]:
+            cdb.add_names("C42", {"shared~namé": {'tokens': ['shared', 'namé'], 'snames': {'shared', 'shared~namé'},
+                                                  'raw_name': "Shared namé", 'is_upper': False}})
+            cdb.remove_names("C1", {"shared~namé": {}})
+
+        self.assertIsInstance(self.cdb.name2cuis, dict)
+        for field in CDB.NAME_MAPS:
+            self.assertEqual(getattr(dict_cdb, field), getattr(self.cdb, field))
+
+        self.cdb.use_compact_names()
+        self.cdb.filter_by_cui(["C3"])
+        dict_cdb.filter_by_cui(["C3"])
+        self.assertTrue(is_compact(self.cdb.name2cuis))
+        for field in CDB.NAME_MAPS:
+            self.assertEqual(getattr(dict_cdb, field), getattr(self.cdb, field))
+
+    def test_save_and_load_compact_names(self):
+        self.cdb.use_compact_names()
+        for fmt in ['dat', 'dir']:
+            path = os.path.join(self.tmp_dir, "cdb_" + fmt)
+            self.cdb.save(path, fmt=fmt)
+            cdb = CDB.load(path)
+            self.assertTrue(is_compact(cdb.snames))
+            self.assertSameNames(cdb)
+            self.assertIn("name~3", cdb.snames)
+
+    def test_compact_names_are_saved_as_dicts(self):
+        # Pickling the views would save the whole CompactNameMaps with each of them
+        self.cdb.save(os.path.join(self.tmp_dir, "dict.dat"))
+        self.cdb.use_compact_names()
+        self.cdb.save(os.path.join(self.tmp_dir, "compact.dat"))
+        self.cdb.save(os.path.join(self.tmp_dir, "compact"), fmt='dir')
+
+        with open(os.path.join(self.tmp_dir, "compact.dat"), 'rb') as f:
+            saved = dill.load(f)['cdb']
+        with open(os.path.join(self.tmp_dir, "compact", "core.pickle"), 'rb') as f:
+            core = pickle.load(f)
+        for field in CDB.NAME_MAPS:
+            self.assertEqual(self.old[field], saved[field])
+        for field in ['name2cuis2status', 'cui2names', 'cui2snames']:
+            self.assertEqual(self.old[field], core[field])
+        self.assertNotIn('name2cuis', core)
+        self.assertLessEqual(os.path.getsize(os.path.join(self.tmp_dir, "compact.dat")),
+                             os.path.getsize(os.path.join(self.tmp_dir, "dict.dat")))
+
+
+class CDBFilterTests(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.cdb = CDB(config=Config())
+        for i in range(10):
+            # Concepts 2k and 2k+1 share a name
+            names = {"name~{}".format(i): {'tokens': ['name', str(i)], 'snames': {'name', "name~{}".format(i)},
+                                           'raw_name': "Name {}".format(i), 'is_upper': False},
+                     "pair~{}~x".format(i // 2): {'tokens': ['pair', str(i // 2), 'x'],
+                                                  'snames': {'pair', "pair~{}".format(i // 2), "pair~{}~x".format(i // 2)},
+                                                  'raw_name': "Pair {} x".format(i // 2), 'is_upper': False}}
+            self.cdb.add_concept("C{}".format(i), names, ontologies=set(), name_status='A', type_ids={'T1'}, description='')
+            self.cdb.cui2context_vectors["C{}".format(i)] = {'long': np.ones(3) * i}
+            self.cdb.cui2count_train["C{}".format(i)] = i
+
+    def assertFiltered(self, cdb):
+        self.assertEqual({"C2", "C3"}, set(cdb.cui2names))
+        self.assertEqual({"name~2", "pair~1~x"}, set(cdb.name2cuis))
+        self.assertEqual(["C2", "C3"], cdb.name2cuis["pair~1~x"])
+        self.assertEqual({"name", "name~2", "pair", "pair~1", "pair~1~x"}, set(cdb.snames))
+        self.assertEqual({"C2", "C3"}, set(cdb.cui2context_vectors))
+        self.assertEqual({"C2": 2, "C3": 3}, cdb.cui2count_train)
+
+    def test_filter_by_cui(self):
+        for compact in [False, True]:
+            cdb = copy.deepcopy(self.cdb)
+            cdb.use_compact_names(compact)
+            cdb.filter_by_cui(["C2", "C42"])
+            self.assertFiltered(cdb)
+            self.assertEqual(compact, is_compact(cdb.name2cuis))
+
+    def test_filter_without_cui2snames(self):
+        for compact in [False, True]:
+            for snames in [self.cdb.snames, set()]:
+                cdb = copy.deepcopy(self.cdb)
+                cdb.cui2snames = {}
+                cdb.snames = set(snames)
+                cdb.use_compact_names(compact)
+                cdb.filter_by_cui(["C2"])
+                self.assertFiltered(cdb)
+
+    def test_filtered(self):
+        self.cdb.use_compact_names()
+        view = self.cdb.filtered(["C2"])
+
+        self.assertFiltered(view)
+        self.assertEqual(10, len(self.cdb.cui2names))
+        self.assertIn("name~7", self.cdb.snames)
+        # The string tables are shared with the parent
+        self.assertIs(self.cdb.name2cuis.maps.names, view.name2cuis.maps.names)
+
+    def test_filtered_is_read_only(self):
+        names = {"new~name": {'tokens': ['new', 'name'], 'snames': {'new', 'new~name'}, 'raw_name': "New name",
+                              'is_upper': False}}
+        for compact in [False, True]:
+            cdb = copy.deepcopy(self.cdb)
+            cdb.use_compact_names(compact)
+            view = cdb.filtered(["C2"])
+            with self.assertRaises(TypeError):
+                view.update_context_vector("C2", {'long': np.ones(3)}, negative=True)
+            with self.assertRaises(TypeError):
+                view.add_names("C2", names)
+            with self.assertRaises(TypeError):
+                view.remove_names("C2", {"pair~1~x": {}})
+
+            # A copy can be trained and does not change the parent
+            trained = copy.deepcopy(view)
+            trained.update_context_vector("C2", {'long': np.ones(3)}, negative=True)
+            trained.add_names("C2", names)
+            trained.remove_names("C2", {"pair~1~x": {}})
+            self.assertEqual('N', trained.name2cuis2status["pair~1~x"]["C3"])
+            self.assertEqual('A', cdb.name2cuis2status["pair~1~x"]["C3"])
+            self.assertEqual(["C2", "C3"], list(cdb.name2cuis["pair~1~x"]))
+            self.assertNotIn("new~name", cdb.name2cuis)
+            self.assertNotIn("new~name", cdb.cui2names["C2"])
+            self.assertEqual([2, 2, 2], list(cdb.cui2context_vectors["C2"]['long']))
+            self.assertEqual(2, cdb.cui2count_train["C2"])
+
+
+class CDBSimilarityTests(unittest.TestCase):
+
+    def setUp(self) -> None:
+        rng = np.random.RandomState(11)
+        self.cdb = CDB(config=Config())
+        self.cdb.addl_info['type_id2name'] = {'T1': 'Type 1', 'T2': 'Type 2'}
+        for i in range(300):
+            cui = "C{}".format(i)
+            names = {"name~{}".format(i): {'tokens': ['name', str(i)], 'snames': {'name', "name~{}".format(i)},
+                                           'raw_name': "Name {}".format(i), 'is_upper': False}}
+            self.cdb.add_concept(cui, names, ontologies=set(), name_status='P', type_ids={'T{}'.format(i % 3)}, description='')
+            self.cdb.cui2context_vectors[cui] = {'long': rng.rand(20) - 0.5}
+            self.cdb.cui2count_train[cui] = i % 10
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.tmp_dir)
+
+    def expected(self, cui, type_ids, min_cnt, topn):
+        cuis = [_cui for _cui in self.cdb.cui2names if self.cdb.cui2type_ids[_cui] & type_ids and
+                self.cdb.cui2count_train[_cui] >= min_cnt]
+        vector = self.cdb.cui2context_vectors[cui]['long']
+        sims = [np.dot(vector, self.cdb.cui2context_vectors[_cui]['long']) / np.linalg.norm(vector) /
+                np.linalg.norm(self.cdb.cui2context_vectors[_cui]['long']) for _cui in cuis]
+        return [cuis[ind] for ind in np.argsort(sims)[::-1][:topn]]
+
+    def test_most_similar(self):
+        res = self.cdb.most_similar("C7", 'long', type_id_filter=['T1', 'T2'], min_cnt=3, topn=10)
+
+        self.assertEqual(self.expected("C7", {'T1', 'T2'}, 3, 10), list(res))
+        self.assertEqual("C7", list(res)[0])
+        self.assertAlmostEqual(1, res["C7"]['sim'], places=5)
+        self.assertEqual(['Type 1'], res["C7"]['type_names'])
+        self.assertEqual(7, res["C7"]['cnt'])
+
+    def test_most_similar_batch(self):
+        results = self.cdb.most_similar_batch(["C1", "C2", "C200"], 'long', topn=5)
+        for cui in ["C1", "C2", "C200"]:
+            res = self.cdb.most_similar(cui, 'long', topn=5)
+            self.assertEqual(list(res), list(results[cui]))
+            np.testing.assert_allclose([r['sim'] for r in res.values()], [r['sim'] for r in results[cui].values()], rtol=1e-5)
+
+    def test_ivf_index(self):
+        expected = {cui: list(self.cdb.most_similar(cui, 'long', topn=10)) for cui in ["C1", "C2", "C200"]}
+        self.cdb.config.linking['similarity_index'] = {'type': 'ivf', 'n_lists': 10, 'n_probe': 10}
+        index = self.cdb.build_similarity_index('long')
+
+        self.assertEqual(10, len(index.centroids))
+        self.assertEqual(list(range(300)), sorted(index.list_positions.tolist()))
+        # Searching all lists is exact
+        for cui in expected:
+            self.assertEqual(expected[cui], list(self.cdb.most_similar(cui, 'long', topn=10)))
+
+        index.n_probe = 3
+        res = self.cdb.most_similar("C1", 'long', topn=10, type_id_filter=['T1'])
+        self.assertEqual("C1", list(res)[0])
+        self.assertTrue(all(self.cdb.cui2type_ids[cui] == {'T1'} for cui in res))
+
+    def test_index_is_saved_separately(self):
+        self.cdb.most_similar("C1", 'long')
+        path = os.path.join(self.tmp_dir, "cdb.dat")
+        self.cdb.save(path)
+        self.assertEqual({}, CDB.load(path)._similarity_indices)
+
+        path = os.path.join(self.tmp_dir, "cdb")
+        self.cdb.save(path, fmt='dir')
+        cdb = CDB.load(path)
+        self.assertEqual(['long'], list(cdb._similarity_indices))
+        self.assertEqual(self.cdb.most_similar("C1", 'long'), cdb.most_similar("C1", 'long'))
+
+
+class CDBDirectoryFormatTests(unittest.TestCase):
+
+    def setUp(self) -> None:
+        np.random.seed(11)
+        self.cdb = CDB(config=Config())
+        for i in range(10):
+            cui = "C{}".format(i)
+            names = {"name~{}".format(i): {'tokens': ['name', str(i)], 'snames': ['name', "name~{}".format(i)],
+                                           'raw_name': "Name {}".format(i), 'is_upper': False},
+                     "shared~name": {'tokens': ['shared', 'name'], 'snames': ['shared', 'shared~name'],
+                                     'raw_name': "Shared name", 'is_upper': False}}
+            self.cdb.add_concept(cui, names, ontologies={'SNOMED'}, name_status='A', type_ids={'T1'},
+                                 description="Concept {}".format(i), full_build=True)
+            if i % 2 == 0:
+                vectors = {context_type: np.random.rand(30) for context_type in self.cdb.config.linking['context_vector_sizes']}
+                self.cdb.update_context_vector(cui, vectors)
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.tmp_dir)
+
+    def test_save_and_load_dir(self):
+        path = os.path.join(self.tmp_dir, "cdb")
+        self.cdb.save(path, fmt='dir')
+        cdb = CDB.load(path)
+
+        self.assertEqual(self.cdb.name2cuis, cdb.name2cuis)
+        self.assertEqual(self.cdb.snames, cdb.snames)
+        self.assertEqual(self.cdb.cui2names, cdb.cui2names)
+        self.assertEqual(self.cdb.cui2count_train, cdb.cui2count_train)
+        self.assertIsInstance(cdb.cui2context_vectors, ContextVectorStore)
+        self.assertIsInstance(cdb.cui2context_vectors.matrices['long'], np.memmap)
+        self.assertEqual('dict', cdb.config.linking['context_vector_store'])
+        np.testing.assert_allclose(self.cdb.cui2context_vectors['C4']['long'], cdb.cui2context_vectors['C4']['long'], rtol=1e-6)
+
+        self.assertIsInstance(cdb.addl_info, LazyAddlInfo)
+        self.assertFalse(cdb.addl_info.is_loaded('cui2description'))
+        self.assertEqual("Concept 3", cdb.addl_info['cui2description']['C3'])
+        self.assertTrue(cdb.addl_info.is_loaded('cui2description'))
+        self.assertEqual(self.cdb.addl_info, dict(cdb.addl_info))
+
+    def test_update_and_resave_dir(self):
+        path = os.path.join(self.tmp_dir, "cdb")
+        self.cdb.save(path, fmt='dir')
+        cdb = CDB.load(path)
+        cdb.update_context_vector('C1', {'long': np.random.rand(30)})
+        cdb.addl_info['cui2group']['C1'] = 'group'
+        cdb.save(path, fmt='dir')
+
+        cdb = CDB.load(path)
+        self.assertIn('C1', cdb.cui2context_vectors)
+        self.assertEqual({'C1': 'group'}, cdb.addl_info['cui2group'])
+        self.assertEqual(self.cdb.addl_info['cui2original_names'], cdb.addl_info['cui2original_names'])
+
+    def test_load_vocab_dir(self):
+        path = os.path.join(self.tmp_dir, "vocab")
+        vocab = Vocab()
+        vocab.add_word("house", cnt=3, vec=[1.0, 2.0, 3.0])
+        vocab.save(path, fmt='dir')
+        self.assertFalse(is_cdb_dir(path))
+        with self.assertRaisesRegex(ValueError, "holds a saved Vocab, it can not be loaded as a CDB"):
+            CDB.load(path)
+
+    def test_load_dir_without_kind(self):
+        # Directories saved before format.json had the kind
+        path = os.path.join(self.tmp_dir, "cdb")
+        self.cdb.save(path, fmt='dir')
+        with open(os.path.join(path, FORMAT_FILE)) as f:
+            meta = json.load(f)
+        self.assertEqual('cdb', meta.pop('kind'))
+        with open(os.path.join(path, FORMAT_FILE), 'w') as f:
+            json.dump(meta, f)
+        self.assertTrue(is_cdb_dir(path))
+        self.assertEqual(self.cdb.name2cuis, CDB.load(path).name2cuis)
+
+    def test_convert_cdb(self):
+        dat_path = os.path.join(self.tmp_dir, "cdb.dat")
+        self.cdb.save(dat_path)
+        convert_cdb(dat_path, os.path.join(self.tmp_dir, "cdb"))
+        cdb = CDB.load(os.path.join(self.tmp_dir, "cdb"))
+
+        self.assertEqual(self.cdb.name2cuis, cdb.name2cuis)
+        self.assertEqual(set(self.cdb.cui2context_vectors.keys()), set(cdb.cui2context_vectors.keys()))
+
+    def test_spell_index_is_saved_and_updated(self):
+        index = SymSpellIndex.from_cdb(self.cdb)
+        self.assertIs(index, self.cdb.addl_info['spell_index'])
+        path = os.path.join(self.tmp_dir, "cdb")
+        self.cdb.save(path, fmt='dir')
+
+        cdb = CDB.load(path)
+        self.assertFalse(cdb.addl_info.is_loaded('spell_index'))
+        self.assertIn('name', cdb.addl_info['spell_index'].lookup('nme', 1))
+        cdb.add_names('C1', {"kidney~name": {'tokens': ['kidney', 'name'], 'snames': ['kidney', 'kidney~name'],
+                                             'raw_name': "Kidney name", 'is_upper': False}})
+        self.assertIs(cdb.addl_info['spell_index'], SymSpellIndex.from_cdb(cdb))
+        self.assertIn('kidney', cdb.addl_info['spell_index'].lookup('kidny', 1))
+
+
 if __name__ == '__main__':
     unittest.main()
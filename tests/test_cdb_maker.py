@@ -1,6 +1,8 @@
 import unittest
 import logging
 import os
+import tempfile
+import pandas
 import numpy as np
 from medcat.cdb_maker import CDBMaker
 from medcat.cdb import CDB
@@ -198,5 +200,98 @@ class B_CDBMakerEditTests(unittest.TestCase):
         self.assertEqual(self.cdb.cui2context_vectors, target_result)
 
 
+class C_CDBMakerBulkTests(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.config = Config()
+        cls.config.general["spacy_model"] = "en_core_sci_sm"
+        cls.maker = CDBMaker(cls.config)
+        cls.csvs = [os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'examples', 'cdb.csv')]
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        cls.maker.destroy_pipe()
+
+    def test_ca_bulk_build_equals_row_build(self):
+        self.maker.cdb = CDB(config=self.config)
+        cdb_rows = self.maker.prepare_csvs(self.csvs, full_build=True, bulk=False)
+        self.maker.cdb = CDB(config=self.config)
+        cdb_bulk = self.maker.prepare_csvs(self.csvs, full_build=True, bulk=True, batch_size=2)
+
+        for field in ['name2cuis', 'name2cuis2status', 'snames', 'cui2names', 'cui2snames', 'cui2preferred_name',
+                      'cui2type_ids', 'name_isupper', 'vocab', 'addl_info']:
+            self.assertEqual(getattr(cdb_rows, field), getattr(cdb_bulk, field), field)
+
+    def test_cb_sharded_build_equals_single_build(self):
+        csvs = self.csvs + [os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'examples', 'cdb_2.csv')]
+        self.maker.cdb = CDB(config=self.config)
+        cdb_single = self.maker.prepare_csvs(csvs, full_build=True)
+        self.maker.cdb = CDB(config=self.config)
+        cdb_sharded = self.maker.prepare_csvs(csvs, full_build=True, n_shards=2)
+
+        for field in ['name2cuis', 'name2cuis2status', 'snames', 'cui2names', 'cui2snames', 'cui2preferred_name',
+                      'cui2type_ids', 'name_isupper', 'vocab', 'addl_info']:
+            self.assertEqual(getattr(cdb_single, field), getattr(cdb_sharded, field), field)
+
+        self.assertRaises(ValueError, self.maker.prepare_csvs, csvs, n_shards=2, bulk=False)
+        self.assertRaises(ValueError, self.maker.prepare_csvs, csvs, n_shards=2, n_process=2)
+
+    def test_cc_update_from_csvs(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            new_csv = os.path.join(tmp_dir, 'cdb_new.csv')
+            df = pandas.read_csv(self.csvs[0], dtype=str)
+            # Remove the third row (C0000039 Virus M |Virus K|Virus Z) and add a new concept
+            df = df.drop(index=2)
+            df.loc[len(df) + 1] = ['C0000339', 'Kidney failure', '', 'P', '', '']
+            df.to_csv(new_csv, index=False)
+
+            self.maker.cdb = CDB(config=self.config)
+            self.maker.prepare_csvs(self.csvs, full_build=True)
+            self.maker.cdb.cui2count_train['C0000039'] = 3
+            report = self.maker.update_from_csvs(self.csvs, [new_csv], full_build=True)
+            cdb_updated = self.maker.cdb
+
+            self.maker.cdb = CDB(config=self.config)
+            cdb_new = self.maker.prepare_csvs([new_csv], full_build=True)
+
+        self.assertEqual(1, report['removed_rows'])
+        self.assertEqual(1, report['added_rows'])
+        self.assertEqual(2, report['cuis'])
+        self.assertEqual(['C0000139'], cdb_updated.name2cuis['virus~k'])
+        self.assertEqual(3, cdb_updated.cui2count_train['C0000039'])
+        for field in ['name2cuis2status', 'cui2names', 'cui2snames', 'cui2type_ids', 'cui2preferred_name', 'vocab', 'addl_info']:
+            self.assertEqual(getattr(cdb_new, field), getattr(cdb_updated, field), field)
+
+    def test_cd_update_from_csvs_removed_concept(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            new_csv = os.path.join(tmp_dir, 'cdb_new.csv')
+            df = pandas.read_csv(self.csvs[0], dtype=str)
+            # Remove all rows of C0000139
+            df = df[df['cui'] != 'C0000139']
+            df.loc[len(df) + 1] = ['C0000339', 'Kidney failure', '', 'P', '', '']
+            df.to_csv(new_csv, index=False)
+
+            self.maker.cdb = CDB(config=self.config)
+            self.maker.prepare_csvs(self.csvs, full_build=True)
+            for cui in ['C0000039', 'C0000139']:
+                self.maker.cdb.cui2context_vectors[cui] = {'long': np.random.rand(5)}
+                self.maker.cdb.cui2count_train[cui] = 3
+                self.maker.cdb.cui2average_confidence[cui] = 0.5
+            self.maker.cdb.most_similar('C0000039', 'long')
+            report = self.maker.update_from_csvs(self.csvs, [new_csv], full_build=True)
+            cdb_updated = self.maker.cdb
+
+            self.maker.cdb = CDB(config=self.config)
+            cdb_new = self.maker.prepare_csvs([new_csv], full_build=True)
+
+        self.assertEqual(1, report['removed_cuis'])
+        for field in ['cui2context_vectors', 'cui2count_train', 'cui2average_confidence']:
+            self.assertEqual(['C0000039'], list(getattr(cdb_updated, field).keys()), field)
+        self.assertEqual(['C0000039'], list(cdb_updated.most_similar('C0000039', 'long').keys()))
+        for field in ['name2cuis', 'name2cuis2status', 'cui2names', 'cui2type_ids', 'name_isupper', 'vocab']:
+            self.assertEqual(getattr(cdb_new, field), getattr(cdb_updated, field), field)
+
+
 if __name__ == '__main__':
     unittest.main()
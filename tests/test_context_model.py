@@ -0,0 +1,45 @@
+import unittest
+import numpy as np
+import spacy
+from spacy.tokens import Token
+from medcat.config import Config
+from medcat.vocab import Vocab
+from medcat.linking.vector_context_model import ContextModel
+
+
+class ContextModelTests(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        Token.set_extension('to_skip', default=False, force=True)
+        np.random.seed(11)
+        cls.vocab = Vocab()
+        for word in ['patient', 'has', 'severe', 'kidney', 'failure', 'and', 'diabetes', 'history', 'of']:
+            cls.vocab.add_word(word, cnt=np.random.randint(1, 100), vec=np.random.rand(30))
+        cls.config = Config()
+        cls.nlp = spacy.blank('en')
+        cls.doc = cls.nlp("patient has severe kidney failure and diabetes , history of unknownword kidney failure .")
+        cls.doc[7]._.to_skip = True
+        cls.entities = [cls.doc[0:1], cls.doc[3:5], cls.doc[6:7], cls.doc[11:13], cls.doc[13:14]]
+
+    def _assert_same_as_per_entity(self, context_model):
+        vectors = context_model.get_doc_context_vectors(self.entities, self.doc)
+        self.assertEqual(len(vectors), len(self.entities))
+        for entity, doc_vectors in zip(self.entities, vectors):
+            entity_vectors = context_model.get_context_vectors(entity, self.doc)
+            self.assertEqual(set(entity_vectors.keys()), set(doc_vectors.keys()))
+            for context_type in entity_vectors:
+                np.testing.assert_allclose(entity_vectors[context_type], doc_vectors[context_type], atol=1e-10)
+
+    def test_doc_context_vectors_match_per_entity(self):
+        self.config.linking['context_ignore_center_tokens'] = False
+        self._assert_same_as_per_entity(ContextModel(cdb=None, vocab=self.vocab, config=self.config))
+
+    def test_doc_context_vectors_match_per_entity_ignore_center(self):
+        self.config.linking['context_ignore_center_tokens'] = True
+        self._assert_same_as_per_entity(ContextModel(cdb=None, vocab=self.vocab, config=self.config))
+        self.config.linking['context_ignore_center_tokens'] = False
+
+
+if __name__ == '__main__':
+    unittest.main()
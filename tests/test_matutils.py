@@ -0,0 +1,24 @@
+import unittest
+import numpy as np
+from gensim.matutils import unitvec as gensim_unitvec
+from medcat.utils.matutils import unitvec
+
+
+class UnitvecTests(unittest.TestCase):
+
+    def test_same_as_gensim(self):
+        rng = np.random.RandomState(7)
+        for dtype in [np.float64, np.float32, np.int64]:
+            vec = (rng.randn(300) * 10).astype(dtype)
+            expected = gensim_unitvec(np.array(vec))
+            out = unitvec(vec)
+            self.assertEqual(expected.dtype, out.dtype)
+            self.assertTrue(np.array_equal(expected, out))
+
+    def test_zero_and_list_input(self):
+        self.assertTrue(np.array_equal(np.zeros(3), unitvec(np.zeros(3))))
+        self.assertTrue(np.allclose([0.6, 0.8], unitvec([3, 4])))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -5,6 +5,7 @@ import unittest
 from spacy.lang.en import English
 from medcat.preprocessing.tokenizers import spacy_split_all
 from medcat.ner.vocab_based_ner import NER
+from medcat.ner.trie_based_ner import TrieNER, SnamesTrie
 from medcat.preprocessing.taggers import tag_skip_and_punct
 from medcat.pipe import Pipe
 from medcat.utils.normalizers import BasicSpellChecker
@@ -94,6 +95,40 @@ class A_NERTests(unittest.TestCase):
         self.text_post_pipe = self.pipe(self.text)
         self.assertEqual(len(self.text_post_pipe._.ents), 2, "Should equal 2")
 
+    def test_ag_trie_ner_same_entities(self):
+        trie_ner = TrieNER(self.cdb, self.config)
+        for try_reverse_word_order in [False, True]:
+            self.config.ner['try_reverse_word_order'] = try_reverse_word_order
+            doc = self.pipe(self.text)
+
+            doc._.ents = []
+            doc = self.ner(doc)
+            vocab_ents = [(ent.start, ent.end, ent._.detected_name, ent._.link_candidates) for ent in doc._.ents]
+
+            doc._.ents = []
+            doc = trie_ner(doc)
+            trie_ents = [(ent.start, ent.end, ent._.detected_name, ent._.link_candidates) for ent in doc._.ents]
+
+            self.assertEqual(vocab_ents, trie_ents)
+        self.config.ner['try_reverse_word_order'] = False
+
+
+class SnamesTrieTests(unittest.TestCase):
+
+    def test_names_are_shared_with_snames(self):
+        snames = {"heart", "heart~attack", "heart~attack~acute", "kidney~failure"}
+        trie = SnamesTrie(snames, "~")
+
+        node = trie.get_child(trie.get_child(trie.root, "heart"), "attack")
+        self.assertIs([sname for sname in snames if sname == "heart~attack"][0], node.name)
+        self.assertIsNone(trie.get_child(node, "kidney"))
+        # "kidney" is not a sname, its node has no name and is not returned
+        self.assertIsNone(trie.get_child(trie.root, "kidney"))
+        self.assertIsNone(trie.root.children["kidney"].name)
+        self.assertEqual("kidney~failure", trie.get_child(trie.root, "kidney~failure").name)
+        # Leaves have no children
+        self.assertIsNone(trie.get_child(trie.root, "kidney~failure").children)
+
 
 if __name__ == '__main__':
     unittest.main()
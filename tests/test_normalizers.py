@@ -0,0 +1,118 @@
+import os
+import tempfile
+import unittest
+from copy import deepcopy
+import spacy
+from spacy.lang.en import English
+from spacy.language import Language
+from spacy.tokens import Token
+from medcat.config import Config
+from medcat.utils.normalizers import BasicSpellChecker, TokenNormalizer
+from medcat.utils.spell_index import SymSpellIndex
+
+
+class TokenNormalizerTests(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.config = Config()
+        cls.config.general["spacy_model"] = "en_core_sci_sm"
+        cls.config.general["spell_check"] = True
+        cls.config.general["workers"] = 1
+        # Use the lowercased word and not the lemma, so the expected norms do not depend on the spacy model
+        cls.config.preprocessing["min_len_normalize"] = 100
+        cls.spell_checker = BasicSpellChecker(cdb_vocab={"diabetes": 10, "hypertension": 5}, config=cls.config)
+        cls.nlp = spacy.load(cls.config.general["spacy_model"], disable=cls.config.general["spacy_disabled_components"])
+        cls.normalizer = TokenNormalizer(config=cls.config, spell_checker=cls.spell_checker, nlp=cls.nlp)
+        Token.set_extension("norm", default=None, force=True)
+        Token.set_extension("is_punct", default=False, force=True)
+        Token.set_extension("to_skip", default=False, force=True)
+
+    def setUp(self) -> None:
+        self.normalizer.spell_cache.clear()
+
+    def norms(self, text):
+        return [token._.norm for token in self.normalizer(self.nlp.make_doc(text))]
+
+    def test_spell_cache(self):
+        self.assertEqual(["diabetes", "hypertension", "diabetes"], self.norms("diabtes hypertensoin diabtes"))
+        self.assertEqual(["diabetes"], self.norms("diabtes"))
+
+        # The second "diabtes" in the first doc is lemmatized together with the first one
+        self.assertEqual(1, self.normalizer.spell_cache.hits)
+        self.assertEqual(2, self.normalizer.spell_cache.misses)
+        self.assertEqual("diabetes", self.normalizer.spell_cache.get("diabtes"))
+
+    def test_spell_cache_is_cleared_when_the_vocab_changes(self):
+        self.norms("diabetis")
+        self.assertEqual(1, len(self.normalizer.spell_cache))
+
+        self.spell_checker.vocab["diabetic"] = 1
+        self.norms("hypertensoin")
+        self.assertNotIn("diabetis", self.normalizer.spell_cache)
+        del self.spell_checker.vocab["diabetic"]
+
+    def test_save_and_load_spell_cache(self):
+        self.norms("diabtes hypertensoin")
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            config = deepcopy(self.config)
+            config.general["spell_check_cache_path"] = os.path.join(tmp_dir, "spell_cache.pickle")
+            self.normalizer.save_spell_cache(config.general["spell_check_cache_path"])
+            normalizer = TokenNormalizer(config=config, spell_checker=self.spell_checker)
+
+        self.assertEqual(2, len(normalizer.spell_cache))
+        self.assertEqual("hypertension", normalizer.spell_cache.get("hypertensoin"))
+
+    def test_corrections_are_lemmatized_with_the_pipeline(self):
+        lemmatized = []
+
+        @Language.component("test_normalizers_lemmatizer")
+        def lemmatizer(doc):
+            lemmatized.append(doc.text)
+            for token in doc:
+                token.lemma_ = token.text + "-lemma"
+            return doc
+
+        nlp = English()
+        nlp.add_pipe("test_normalizers_lemmatizer")
+        config = deepcopy(self.config)
+        config.preprocessing["min_len_normalize"] = 1
+        normalizer = TokenNormalizer(config=config, spell_checker=self.spell_checker, nlp=nlp)
+        doc = normalizer(nlp.make_doc("diabtes hypertensoin diabtes"))
+
+        self.assertEqual(["diabetes-lemma", "hypertension-lemma", "diabetes-lemma"], [token._.norm for token in doc])
+        self.assertEqual(["diabetes", "hypertension"], lemmatized)
+
+
+class BasicSpellCheckerTests(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.config = Config()
+        self.vocab = {"diabetes": 10, "diabetic": 20, "hypertension": 5, "hypotension": 3, "tension": 8, "x-ray": 4}
+
+    def test_index_gives_the_same_candidates(self):
+        for deep in [False, True]:
+            self.config.general["spell_check_deep"] = deep
+            index = SymSpellIndex(max_distance=2 if deep else 1)
+            for word in self.vocab:
+                index.add_word(word)
+            spell_checker = BasicSpellChecker(cdb_vocab=self.vocab, config=self.config)
+            indexed_spell_checker = BasicSpellChecker(cdb_vocab=self.vocab, config=self.config, index=index)
+
+            for word in ["diabetes", "diabtes", "diabetc", "diabteic", "hypretension", "hypotnesion", "tensoin", "xray",
+                         "x-rya", "unknown"]:
+                self.assertEqual(set(spell_checker.candidates(word)), set(indexed_spell_checker.candidates(word)))
+                self.assertEqual(spell_checker.fix(word), indexed_spell_checker.fix(word))
+
+    def test_within_distance(self):
+        spell_checker = BasicSpellChecker(cdb_vocab=self.vocab, config=self.config)
+        self.assertTrue(spell_checker.within_distance("tensoin", "tension", 1))
+        self.assertTrue(spell_checker.within_distance("hpyotnesion", "hypotension", 2))
+        self.assertFalse(spell_checker.within_distance("hpyotnesion", "hypotension", 1))
+        # Only letters are inserted by the spell checker
+        self.assertFalse(spell_checker.within_distance("xray", "x-ray", 2))
+        self.assertTrue(spell_checker.within_distance("x-ray", "xray", 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,7 @@
+import pickle
 import unittest
 from spacy.lang.en import English
+from spacy.tokens import Doc, Span
 from medcat.pipeline.pipe_runner import PipeRunner
 
 
@@ -9,6 +11,10 @@ class PipeRunnerTests(unittest.TestCase):
     def setUpClass(cls) -> None:
         cls.text = "CDB - I was running and then Movar Virus attacked and CDb"
         cls.nlp = English()
+        Doc.set_extension('ents', default=[], force=True)
+        for name, default in [('cui', -1), ('detected_name', None), ('context_similarity', -1),
+                              ('link_candidates', None), ('confidence', -1), ('id', 0), ('meta_anns', None)]:
+            Span.set_extension(name, default=default, force=True)
 
     def test_pipe_single_process_multi_workers(self):
         docs = list(_PipeRunnerImpl(workers=2).pipe(
@@ -46,9 +52,54 @@ class PipeRunnerTests(unittest.TestCase):
         self.assertEqual(self.text, docs[1].text)
         self.assertEqual(self.text, docs[2].text)
 
+    def test_pipe_failed_doc_is_kept_and_marked(self):
+        for parallel in [False, True]:
+            runner = _FailingPipeRunnerImpl(workers=1)
+            errors = []
+            runner.set_error_handler(lambda name, proc, docs, e: errors.append(e))
+            texts = [self.text, "fail " + self.text, self.text]
+            docs = list(runner.pipe([self.nlp.make_doc(text) for text in texts], batch_size=3, parallel=parallel))
+
+            self.assertEqual(texts, [doc.text for doc in docs])
+            self.assertEqual([False, True, False], [PipeRunner.is_failed(doc) for doc in docs])
+            self.assertEqual(1, len(errors))
+
+    def test_serialize_entities_round_trip(self):
+        doc = self.nlp.make_doc(self.text)
+        for i, (start, end, cui) in enumerate([(0, 1, "C01"), (7, 9, "C02"), (7, 8, "C01")]):
+            ent = Span(doc, start, end, label="C")
+            ent._.cui = cui
+            ent._.detected_name = ent.text.lower()
+            ent._.context_similarity = 0.5 + i / 10
+            ent._.link_candidates = [cui]
+            ent._.id = i
+            if i == 1:
+                ent._.meta_anns = {"Status": {"value": "Affirmed"}}
+            doc._.ents.append(ent)
+        expected = [(ent.start, ent.end, ent.label_, ent._.cui, ent._.detected_name, ent._.context_similarity,
+                     ent._.link_candidates, ent._.id, ent._.meta_anns) for ent in doc._.ents]
+
+        doc = pickle.loads(pickle.dumps(PipeRunner.serialize_entities(doc)))
+        self.assertTrue(PipeRunner.is_serialized(doc))
+        self.assertEqual(["C01", "C02"], doc._.ents["cuis"])
+        doc = PipeRunner.deserialize_entities(doc)
+
+        self.assertFalse(PipeRunner.is_serialized(doc))
+        self.assertEqual(expected, [(ent.start, ent.end, ent.label_, ent._.cui, ent._.detected_name,
+                                     ent._.context_similarity, ent._.link_candidates, ent._.id, ent._.meta_anns)
+                                    for ent in doc._.ents])
+
 
 class _PipeRunnerImpl(PipeRunner):
 
     def __call__(self, doc):
         return doc
 
+
+class _FailingPipeRunnerImpl(PipeRunner):
+
+    def __call__(self, doc):
+        if doc.text.startswith("fail"):
+            raise ValueError("Failed")
+        return doc
+
@@ -0,0 +1,50 @@
+import unittest
+from spacy.lang.en import English
+from spacy.tokens import Token
+from medcat.config import Config
+from medcat.preprocessing.taggers import tag_skip_and_punct
+
+
+class TaggerTests(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.nlp = English()
+        cls.text = "Pt. has CHF, nos -- MI: (2x) and t2dm; nos!! The pt. was well, NOS... 5.5 mg/dl"
+        Token.set_extension('is_punct', default=False, force=True)
+        Token.set_extension('to_skip', default=False, force=True)
+
+    def tags(self, tagger):
+        doc = tagger(self.nlp.make_doc(self.text))
+        return [(token.text, token._.is_punct, token._.to_skip) for token in doc]
+
+    def test_cached_tags_equal_uncached(self):
+        config = Config()
+        config.preprocessing['skip_stopwords'] = True
+        tagger = tag_skip_and_punct(self.nlp, tag_skip_and_punct.name, config)
+        config.preprocessing['cache_token_tags'] = False
+        expected = self.tags(tagger)
+
+        config.preprocessing['cache_token_tags'] = True
+        self.assertEqual(expected, self.tags(tagger))
+        # Second time all tags come from the cache
+        self.assertEqual(expected, self.tags(tagger))
+        self.assertIn(('nos', False, True), expected)
+        self.assertIn((':', False, False), expected)
+        self.assertIn(('--', True, True), expected)
+
+    def test_cache_is_reset_when_config_changes(self):
+        config = Config()
+        tagger = tag_skip_and_punct(self.nlp, tag_skip_and_punct.name, config)
+        self.assertIn(('CHF', False, False), self.tags(tagger))
+
+        config.preprocessing['words_to_skip'] = {'nos', 'chf'}
+        config.preprocessing['keep_punct'] = {'.', ':', '--'}
+        config.rebuild_re()
+        tags = self.tags(tagger)
+        self.assertIn(('CHF', False, True), tags)
+        self.assertIn(('--', False, False), tags)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,7 +1,11 @@
 import os
 import shutil
 import unittest
+import numpy as np
 from medcat.vocab import Vocab
+from medcat.cdb import CDB
+from medcat.config import Config
+from medcat.utils.vocab_storage import is_vocab_dir
 
 
 class CATTests(unittest.TestCase):
@@ -35,6 +39,142 @@ class CATTests(unittest.TestCase):
         vocab = Vocab.load(vocab_path)
         self.assertEqual(["house", "dog", "test"], list(vocab.vocab.keys()))
 
+    def test_add_words_in_chunks(self):
+        words_path = os.path.join(self.tmp_dir, "words.txt")
+        with open(words_path, "w") as f:
+            f.write("house\t1\t1 2\ndog\t2\ncat\t3\t3 4\nhouse\t4\t5 6\ndog\t5\t7 8\nbird\t6\t9 10\n")
+        self.undertest.add_words(words_path, chunk_size=2)
+        self.assertEqual(["house", "dog", "cat", "bird"], self.undertest.index2word)
+        self.assertEqual([4, 5, 3, 6], [self.undertest.count(word) for word in self.undertest.index2word])
+        np.testing.assert_array_equal([5, 6], self.undertest.vec("house"))
+        np.testing.assert_array_equal([7, 8], self.undertest.vec("dog"))
+
+        vocab = Vocab()
+        vocab.add_words(words_path, replace=False, words_to_keep={"house", "dog"})
+        self.assertEqual(["house", "dog"], vocab.index2word)
+        np.testing.assert_array_equal([1, 2], vocab.vec("house"))
+        self.assertIsNone(vocab.vec("dog"))
+
+    def test_add_words_word2vec(self):
+        vectors = np.random.rand(3, 4).astype(np.float32)
+        with open(os.path.join(self.tmp_dir, "vectors.txt"), "w") as f:
+            f.write("3 4\n")
+            for word, vec in zip(["house", "dog", "cat"], vectors):
+                f.write(word + " " + " ".join(repr(float(x)) for x in vec) + "\n")
+        with open(os.path.join(self.tmp_dir, "vectors.bin"), "wb") as f:
+            f.write(b"3 4\n")
+            for word, vec in zip(["house", "dog", "cat"], vectors):
+                f.write(word.encode() + b" " + vec.astype('<f4').tobytes() + b"\n")
+
+        for path, fmt in [("vectors.txt", "word2vec"), ("vectors.bin", "word2vec_binary")]:
+            vocab = Vocab()
+            vocab.add_words(os.path.join(self.tmp_dir, path), fmt=fmt, words_to_keep={"house", "cat"}, chunk_size=1)
+            self.assertEqual(["house", "cat"], vocab.index2word)
+            np.testing.assert_array_equal(vectors[[0, 2]], [vocab.vec("house"), vocab.vec("cat")])
+            self.assertEqual(1, vocab.count("cat"))
+
+    def test_save_and_load_dir(self):
+        self.undertest.add_words(os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "examples", "vocab_data.txt"))
+        self.undertest.add_word("test", cnt=31)
+        self.undertest.make_unigram_table(table_size=100)
+        vocab_path = os.path.join(self.tmp_dir, "vocab")
+        self.undertest.save(vocab_path, fmt='dir')
+        vocab = Vocab.load(vocab_path)
+        self.assertEqual(["house", "dog", "test"], list(vocab.vocab.keys()))
+        self.assertIsInstance(vocab.vectors, np.memmap)
+        self.assertIsInstance(vocab.unigram_cum_probs, np.memmap)
+        np.testing.assert_array_equal(self.undertest.vec("dog"), vocab.vec("dog"))
+        np.testing.assert_array_equal(self.undertest.unigram_cum_probs, vocab.unigram_cum_probs)
+        self.assertIsNone(vocab.vec("test"))
+        self.assertEqual(31, vocab.count("test"))
+
+        # Changes take a private copy of the memory mapped matrix
+        vocab.add_vec("dog", [1.0, 2.0, 3.0])
+        vocab.add_word("cat", cnt=3, vec=[3.0, 2.0, 1.0])
+        np.testing.assert_array_equal([1.0, 2.0, 3.0], vocab.vec("dog"))
+        np.testing.assert_array_equal(self.undertest.vec("dog"), Vocab.load(vocab_path, mmap=False).vec("dog"))
+
+    def test_load_cdb_dir(self):
+        cdb = CDB(config=Config())
+        cdb.add_names("C1", {"house": {'tokens': ['house'], 'snames': {'house'}, 'raw_name': "House", 'is_upper': False}})
+        cdb_path = os.path.join(self.tmp_dir, "cdb")
+        cdb.save(cdb_path, fmt='dir')
+        self.assertFalse(is_vocab_dir(cdb_path))
+        with self.assertRaisesRegex(ValueError, "holds a saved CDB, it can not be loaded as a Vocab"):
+            Vocab.load(cdb_path)
+
+    def test_load_old_format(self):
+        # examples/vocab.dat was saved with a dictionary per word
+        vocab = Vocab.load(os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "examples", "vocab.dat"))
+        self.assertEqual(["house", "dog"], list(vocab.vocab.keys()))
+        self.assertEqual(34444, vocab.count("house"))
+        np.testing.assert_allclose([0.3232, 0.123213, 1.231231], vocab.vec("house"), rtol=1e-6)
+        self.assertEqual(np.float32, vocab.vectors.dtype)
+
+    def test_arrays(self):
+        self.undertest.add_words(os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "examples", "vocab_data.txt"))
+        self.undertest.add_word("test", cnt=31)
+        self.assertIsNone(self.undertest.vec("test"))
+        vec_index2word = self.undertest.vec_index2word
+        self.assertEqual({0: "house", 1: "dog"}, vec_index2word)
+        self.undertest.vocab["test"]["vec"] = [1.42, 1.44, 1.55]
+        # vec_index2word is a view, it shows the new vector
+        self.assertEqual("test", vec_index2word[np.int64(2)])
+        self.assertEqual([0, 1, 2], list(vec_index2word))
+        self.assertNotIn(3, vec_index2word)
+        self.assertNotIn("test", vec_index2word)
+        self.undertest.inc_wc("test", 2)
+        self.assertEqual(33, self.undertest.item("test")['cnt'])
+        self.assertEqual(2, self.undertest.item("test")['ind'])
+        np.testing.assert_array_equal(self.undertest.vectors[2], self.undertest.vec("test"))
+        with self.assertRaises(ValueError):
+            self.undertest.add_vec("test", [1.0, 2.0])
+
+    def test_remove_words_below_cnt(self):
+        self.undertest.add_words(os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "examples", "vocab_data.txt"))
+        self.undertest.add_word("test", cnt=40000, vec=[1.42, 1.44, 1.55])
+        dog = np.array(self.undertest.vec("dog"))
+        self.undertest.remove_words_below_cnt(20000)
+        self.assertEqual(["house", "test"], self.undertest.index2word)
+        self.assertFalse("dog" in self.undertest)
+        self.assertEqual(1, self.undertest.vocab["test"]["ind"])
+        self.undertest.add_word("dog", cnt=2, vec=dog)
+        np.testing.assert_array_equal(dog, self.undertest.vec("dog"))
+
+    def test_negative_samples(self):
+        for word, cnt in [("house", 1000), ("dog", 100), ("123", 1000), (",", 1000), ("novec", 1000)]:
+            self.undertest.add_word(word, cnt=cnt, vec=None if word == "novec" else [1.0, 2.0])
+        self.undertest.make_unigram_table()
+        np.random.seed(11)
+        inds = self.undertest.get_negative_samples(n=100000)
+        self.assertEqual(100000, len(inds))
+        self.assertNotIn(self.undertest.word2ind["novec"], inds)
+        # Probabilities are proportional to cnt^(3/4)
+        p_dog = 100 ** 0.75 / (100 ** 0.75 + 3 * 1000 ** 0.75)
+        self.assertAlmostEqual(p_dog, np.mean(inds == self.undertest.word2ind["dog"]), places=2)
+
+        inds = self.undertest.get_negative_samples(n=1000, ignore_punct_and_num=True)
+        self.assertEqual({"house", "dog"}, {self.undertest.index2word[ind] for ind in inds})
+
+    def test_negative_samples_from_unigram_table(self):
+        # Vocabs saved before kept a table in which each index was repeated by its probability
+        self.undertest.add_words(os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "examples", "vocab_data.txt"))
+        state = self.undertest.__getstate__()
+        state['unigram_table'] = np.array([0, 0, 0, 1])
+        vocab = Vocab()
+        vocab.__setstate__(state)
+        np.testing.assert_array_equal([0, 1], vocab.unigram_inds)
+        np.testing.assert_allclose([0.75, 1.0], vocab.unigram_cum_probs)
+
+    def test_share_memory(self):
+        self.undertest.add_words(os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "examples", "vocab_data.txt"))
+        house = np.array(self.undertest.vec("house"))
+        self.undertest.make_unigram_table(table_size=100)
+        self.undertest.share_memory()
+        np.testing.assert_array_equal(house, self.undertest.vec("house"))
+        self.assertFalse(self.undertest.vec("house").flags.writeable)
+        self.assertEqual(6, len(self.undertest.get_negative_samples(n=6)))
+
 
 if __name__ == '__main__':
     unittest.main()